@@ -1,47 +1,99 @@
+import gc
+import heapq
+import importlib.util
 import json
+import multiprocessing
 import re
-import signal
-from collections import defaultdict
-from functools import lru_cache
-from typing import Dict, List, Optional
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from instrumentation import Instrumentation, Trace
+from shared_index import SharedBlock, share_buffers, trim_heap
+from snapshot import SnapshotMismatch, file_checksums, read_snapshot, write_snapshot
+
+# Only the vectorized bucket index needs numpy; it is imported on first use so
+# the other engines do not pay for it in start-up time and resident memory
+HAS_NUMPY = importlib.util.find_spec('numpy') is not None
 
 
 class Ward:
-    __slots__ = ['id', 'name', 'code', 'district_id']
+    __slots__ = ['id', 'name', 'code', 'district_id', 'district']
 
     def __init__(self, id: str, name: str, code: str, district_id: str):
         self.id = id
         self.name = name
         self.code = code
         self.district_id = district_id
+        self.district = None  # Parent District, set when attached
 
 
 class District:
-    __slots__ = ['id', 'name', 'code', 'province_id', 'wards']
+    __slots__ = ['id', 'name', 'code', 'province_id', 'province', 'wards', 'ward_names', 'ward_index']
 
     def __init__(self, id: str, name: str, code: str, province_id: str):
         self.id = id
         self.name = name
         self.code = code
         self.province_id = province_id
+        self.province = None  # Parent Province, set when attached
         self.wards = {}
+        # Scoped ward indexes, built once by AddressMatcher.load_own_file
+        self.ward_names = {}
+        self.ward_index = None
 
 
 class Province:
-    __slots__ = ['id', 'name', 'code', 'districts']
+    __slots__ = ['id', 'name', 'code', 'districts', 'district_names', 'district_index']
 
     def __init__(self, id: str, name: str, code: str):
         self.id = id
         self.name = name
         self.code = code
         self.districts = {}
+        # Scoped district indexes, built once by AddressMatcher.load_own_file
+        self.district_names = {}
+        self.district_index = None
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised by Deadline.check once the time budget is spent"""
+
+
+class Deadline:
+    """Cooperative time budget passed down through matching and fuzzy search
+
+    Unlike a SIGALRM timer it works on any thread; long-running loops call
+    ``check`` at safe points and unwind with DeadlineExceeded.
+    """
+    __slots__ = ['expires_at']
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.expires_at = time.perf_counter() + timeout if timeout is not None else None
+
+    def check(self):
+        if self.expires_at is not None and time.perf_counter() >= self.expires_at:
+            raise DeadlineExceeded()
+
+
+# Trie nodes / candidates visited between deadline checks in the fuzzy searches
+DEADLINE_CHECK_INTERVAL = 256
 
 
 class TrieNode:
+    __slots__ = ['children', 'is_end', 'word', 'max_length', 'suggestions']
+
     def __init__(self):
         self.children = {}
         self.is_end = False
         self.word = None
+        self.max_length = 0  # Longest word stored below this node
         self.suggestions = set()  # Store similar words
 
 
@@ -51,68 +103,975 @@ class Trie:
 
     def insert(self, word: str, original: str):
         node = self.root
+        node.max_length = max(node.max_length, len(word))
         for char in word:
             if char not in node.children:
                 node.children[char] = TrieNode()
             node = node.children[char]
+            node.max_length = max(node.max_length, len(word))
             # Store similar words at each node
             if len(node.suggestions) < 10:  # Limit suggestions
                 node.suggestions.add(original)
         node.is_end = True
         node.word = original
 
-    def search_similar(self, word: str, max_distance: int = 2) -> list:
-        def _search_recursive(node, prefix, remaining_word, distance):
-            results = set()
-
-            # If we've reached end and distance is acceptable
-            if not remaining_word and node.is_end and distance <= max_distance:
-                results.add((node.word, distance))
-
-            # If we've exceeded max distance, stop this branch
-            if distance > max_distance:
-                return results
-
-            # Handle insertion
-            if remaining_word:
-                char = remaining_word[0]
-                rest = remaining_word[1:]
-
-                # Match current character
-                if char in node.children:
-                    results.update(_search_recursive(node.children[char],
-                                                     prefix + char,
-                                                     rest,
-                                                     distance))
-
-                # Try deletion
-                results.update(_search_recursive(node,
-                                                 prefix,
-                                                 rest,
-                                                 distance + 1))
-
-                # Try substitution
-                for c in node.children:
-                    if c != char:
-                        results.update(_search_recursive(node.children[c],
-                                                         prefix + c,
-                                                         rest,
-                                                         distance + 1))
-
-            # Try insertion
-            for c in node.children:
-                results.update(_search_recursive(node.children[c],
-                                                 prefix + c,
-                                                 remaining_word,
-                                                 distance + 1))
-
-            return results
-
-        return sorted(_search_recursive(self.root, "", word, 0),
-                      key=lambda x: x[1])  # Sort by distance
+    def __getstate__(self):
+        # Flatten to parallel pre-order lists; pickling one object per node is slower than rebuilding
+        chars, child_counts, words, max_lengths, suggestions = [], [], [], [], []
+        stack = [('', self.root)]
+        while stack:
+            char, node = stack.pop()
+            chars.append(char)
+            child_counts.append(len(node.children))
+            words.append(node.word if node.is_end else None)
+            max_lengths.append(node.max_length)
+            suggestions.append(tuple(node.suggestions))
+            stack.extend(reversed(node.children.items()))
+        return chars, child_counts, words, max_lengths, suggestions
+
+    def __setstate__(self, state):
+        chars, child_counts, words, max_lengths, suggestions = state
+        nodes = []
+        new_node = TrieNode.__new__
+        for word, max_length, node_suggestions in zip(words, max_lengths, suggestions):
+            node = new_node(TrieNode)
+            node.children = {}
+            node.is_end = word is not None
+            node.word = word
+            node.max_length = max_length
+            node.suggestions = set(node_suggestions)
+            nodes.append(node)
+
+        self.root = nodes[0]
+        pending = [(self.root, child_counts[0])]
+        for i in range(1, len(nodes)):
+            while not pending[-1][1]:
+                pending.pop()
+            parent, remaining = pending[-1]
+            pending[-1] = (parent, remaining - 1)
+            parent.children[chars[i]] = nodes[i]
+            pending.append((nodes[i], child_counts[i]))
+
+    @property
+    def max_length(self) -> int:
+        """Length of the longest word stored"""
+        return self.root.max_length
+
+    def search(self, word: str) -> Optional[str]:
+        """Return the original of an exact match, or None"""
+        node = self.root
+        for char in word:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node.word if node.is_end else None
+
+    def search_similar(self, word: str, max_distance: int = 2, limit: int = 10,
+                       deadline: Optional[Deadline] = None, stats: Optional[Dict[str, int]] = None) -> list:
+        """Return up to ``limit`` (original, distance) pairs, closest first
+
+        Walks the trie iteratively, carrying one Levenshtein DP row per node,
+        and prunes every subtree whose row minimum already exceeds the bound.
+        Only the diagonal band of width ``2 * max_distance + 1`` is computed;
+        cells outside it can never come back under the bound, and neither can
+        subtrees whose longest word is too short to reach the query. Once
+        ``limit`` matches are held the bound tightens to beat the worst of them.
+        ``deadline`` is checked periodically and may raise DeadlineExceeded.
+        The number of nodes walked is added to ``stats['visited']`` if given.
+        """
+        exact = self.search(word)
+        if exact is not None:
+            return [(exact, 0)]
+
+        width = len(word) + 1
+        min_length = len(word) - max_distance
+        if self.root.max_length < min_length:
+            return []
+        out_of_band = max_distance + 1
+        bound = max_distance
+        best = []  # max-heap of (-distance, -order, original)
+        order = 0
+
+        first_row = [j if j <= max_distance else out_of_band for j in range(width)]
+        stack = [(child, char, first_row, 1) for char, child in reversed(self.root.children.items())]
+        visited = 0
+        while stack:
+            node, char, previous_row, depth = stack.pop()
+            visited += 1
+            if deadline is not None and visited % DEADLINE_CHECK_INTERVAL == 0:
+                deadline.check()
+            row = [out_of_band] * width
+            if depth <= max_distance:
+                row[0] = depth
+            for j in range(max(1, depth - max_distance), min(width - 1, depth + max_distance) + 1):
+                row[j] = min(row[j - 1] + 1,
+                             previous_row[j] + 1,
+                             previous_row[j - 1] + (word[j - 1] != char))
+
+            distance = row[-1]
+            if node.is_end and distance <= bound:
+                heapq.heappush(best, (-distance, -order, node.word))
+                order += 1
+                if len(best) > limit:
+                    heapq.heappop(best)
+                if len(best) == limit:
+                    bound = -best[0][0] - 1
+
+            if node.children and min(row) <= bound:
+                stack.extend((child, c, row, depth + 1) for c, child in reversed(node.children.items())
+                             if child.max_length >= min_length)
+
+        if stats is not None:
+            stats['visited'] = stats.get('visited', 0) + visited
+        return [(original, -neg_distance)
+                for neg_distance, _, original in sorted(best, key=lambda x: (-x[0], -x[1]))]
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the trie nodes and their containers"""
+        total = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            total += sys.getsizeof(node) + sys.getsizeof(node.children) + sys.getsizeof(node.suggestions)
+            stack.extend(node.children.values())
+        return total
+
+
+class CompactTrie:
+    """Trie frozen into flat arrays, with no Python object per node
+
+    Nodes are numbered breadth-first, so the children of node ``i`` are the
+    contiguous range ``first_child[i]:first_child[i + 1]``, kept in insertion
+    order. Each node has its edge character, a word id (-1 if no word ends
+    there) and the longest word length below it. The originals are stored in
+    one UTF-8 buffer indexed by offsets. Inserts go to a dict-backed Trie,
+    which is compiled into the arrays on the next lookup. Search results,
+    including tie order, match Trie's; the unused per-node suggestions are
+    not kept.
+    """
+    # Flat buffers holding the compiled trie; shared_index may swap them for read-only views
+    BUFFERS = ('chars', 'first_child', 'word_ids', 'max_lengths', 'text', 'offsets')
+
+    def __init__(self):
+        self.builder: Optional[Trie] = Trie()
+        self.chars = array('I', [0])  # edge code point into each node; the root has none
+        self.first_child = array('I', [1, 1])
+        self.word_ids = array('i', [-1])
+        self.max_lengths = array('H', [0])
+        self.text = b''
+        self.offsets = array('I', [0])
+
+    @classmethod
+    def from_trie(cls, trie: Trie) -> 'CompactTrie':
+        compact = cls()
+        compact.builder = trie
+        compact.compile()
+        return compact
+
+    def insert(self, word: str, original: str):
+        if self.builder is None:
+            self.builder = self.thaw()
+        self.builder.insert(word, original)
+
+    @classmethod
+    def forest(cls, tries: Iterable) -> List['TrieView']:
+        """Lay compiled ``tries`` (CompactTries or views) out in one CompactTrie and return a view of each
+
+        Tree ``i`` is rooted at node ``i`` and nodes are numbered breadth-first
+        across all trees, so children stay contiguous. Many small tries then
+        take one set of arrays and a small view object each, instead of a
+        CompactTrie and its arrays each.
+        """
+        sources = [(trie.trie, trie.root) if isinstance(trie, TrieView) else (trie, 0) for trie in tries]
+        chars, first_child, word_ids, max_lengths = array('I', [0] * len(sources)), array('I'), array('i'), array('H')
+        text, offsets = bytearray(), array('I', [0])
+        queue = deque(sources)
+        next_child = len(sources)
+        while queue:
+            trie, node = queue.popleft()
+            start, end = trie.first_child[node], trie.first_child[node + 1]
+            first_child.append(next_child)
+            next_child += end - start
+            word_id = trie.word_ids[node]
+            if word_id >= 0:
+                word_ids.append(len(offsets) - 1)
+                text += trie.text[trie.offsets[word_id]:trie.offsets[word_id + 1]]
+                offsets.append(len(text))
+            else:
+                word_ids.append(-1)
+            max_lengths.append(trie.max_lengths[node])
+            for child in range(start, end):
+                chars.append(trie.chars[child])
+                queue.append((trie, child))
+        first_child.append(next_child)
+
+        forest = cls()
+        forest.chars, forest.first_child, forest.word_ids, forest.max_lengths = chars, first_child, word_ids, max_lengths
+        forest.text, forest.offsets = bytes(text), offsets
+        forest.builder = None
+        return [TrieView(forest, root) for root in range(len(sources))]
+
+    def compile(self):
+        """Freeze pending inserts into the arrays (no-op when already compiled)"""
+        builder = self.builder
+        if builder is None:
+            return
+        chars, first_child, word_ids, max_lengths = array('I', [0]), array('I'), array('i'), array('H')
+        text, offsets = bytearray(), array('I', [0])
+        queue = deque([builder.root])
+        next_child = 1
+        while queue:
+            node = queue.popleft()
+            first_child.append(next_child)
+            next_child += len(node.children)
+            if node.is_end:
+                word_ids.append(len(offsets) - 1)
+                text += node.word.encode('utf-8')
+                offsets.append(len(text))
+            else:
+                word_ids.append(-1)
+            max_lengths.append(node.max_length)
+            for char, child in node.children.items():
+                chars.append(ord(char))
+                queue.append(child)
+        first_child.append(next_child)
+
+        # Publish the arrays before dropping the builder so concurrent readers never see a gap
+        self.chars, self.first_child, self.word_ids, self.max_lengths = chars, first_child, word_ids, max_lengths
+        self.text, self.offsets = bytes(text), offsets
+        self.builder = None
+
+    def thaw(self) -> Trie:
+        """Rebuild a dict-backed Trie from the arrays, to accept more inserts"""
+        trie = Trie()
+        nodes = [trie.root]
+        for i in range(len(self.chars)):
+            node = nodes[i]
+            node.max_length = self.max_lengths[i]
+            if self.word_ids[i] >= 0:
+                node.is_end = True
+                node.word = self.original(self.word_ids[i])
+            for child in range(self.first_child[i], self.first_child[i + 1]):
+                child_node = TrieNode()
+                node.children[chr(self.chars[child])] = child_node
+                nodes.append(child_node)
+        return trie
+
+    def __getstate__(self):
+        self.compile()
+        return tuple(_owned(getattr(self, name)) for name in self.BUFFERS)
+
+    def __setstate__(self, state):
+        self.chars, self.first_child, self.word_ids, self.max_lengths, self.text, self.offsets = state
+        self.builder = None
+
+    def original(self, word_id: int) -> str:
+        return str(self.text[self.offsets[word_id]:self.offsets[word_id + 1]], 'utf-8')
+
+    @property
+    def node_count(self) -> int:
+        self.compile()
+        return len(self.chars)
+
+    @property
+    def max_length(self) -> int:
+        """Length of the longest word stored"""
+        self.compile()
+        return self.max_lengths[0]
+
+    def search(self, word: str, root: int = 0) -> Optional[str]:
+        """Return the original of an exact match, or None"""
+        word_id = self.find(word, root)
+        return self.original(word_id) if word_id >= 0 else None
+
+    def find(self, word: str, root: int = 0) -> int:
+        """Word id of an exact match (ids number the words 0..n-1), or -1"""
+        self.compile()
+        chars, first_child = self.chars, self.first_child
+        node = root
+        for char in word:
+            code = ord(char)
+            for child in range(first_child[node], first_child[node + 1]):
+                if chars[child] == code:
+                    node = child
+                    break
+            else:
+                return -1
+        return self.word_ids[node]
+
+    def search_similar(self, word: str, max_distance: int = 2, limit: int = 10,
+                       deadline: Optional[Deadline] = None, stats: Optional[Dict[str, int]] = None,
+                       root: int = 0) -> list:
+        """Return up to ``limit`` (original, distance) pairs, closest first
+
+        The same banded, length-pruned DP walk as Trie.search_similar, over
+        node numbers instead of node objects, from the tree rooted at ``root``.
+        ``deadline`` is checked periodically and may raise DeadlineExceeded.
+        The number of nodes walked is added to ``stats['visited']`` if given.
+        """
+        exact = self.search(word, root)
+        if exact is not None:
+            return [(exact, 0)]
+
+        chars, first_child, word_ids, max_lengths = self.chars, self.first_child, self.word_ids, self.max_lengths
+        codes = [ord(char) for char in word]
+        width = len(word) + 1
+        min_length = len(word) - max_distance
+        if max_lengths[root] < min_length:
+            return []
+        out_of_band = max_distance + 1
+        bound = max_distance
+        best = []  # max-heap of (-distance, -order, word id)
+        order = 0
+
+        first_row = [j if j <= max_distance else out_of_band for j in range(width)]
+        stack = [(child, first_row, 1) for child in reversed(range(first_child[root], first_child[root + 1]))]
+        visited = 0
+        while stack:
+            node, previous_row, depth = stack.pop()
+            visited += 1
+            if deadline is not None and visited % DEADLINE_CHECK_INTERVAL == 0:
+                deadline.check()
+            code = chars[node]
+            row = [out_of_band] * width
+            if depth <= max_distance:
+                row[0] = depth
+            for j in range(max(1, depth - max_distance), min(width - 1, depth + max_distance) + 1):
+                row[j] = min(row[j - 1] + 1,
+                             previous_row[j] + 1,
+                             previous_row[j - 1] + (codes[j - 1] != code))
+
+            distance = row[-1]
+            if word_ids[node] >= 0 and distance <= bound:
+                heapq.heappush(best, (-distance, -order, word_ids[node]))
+                order += 1
+                if len(best) > limit:
+                    heapq.heappop(best)
+                if len(best) == limit:
+                    bound = -best[0][0] - 1
+
+            start, end = first_child[node], first_child[node + 1]
+            if start != end and min(row) <= bound:
+                stack.extend((child, row, depth + 1) for child in reversed(range(start, end))
+                             if max_lengths[child] >= min_length)
+
+        if stats is not None:
+            stats['visited'] = stats.get('visited', 0) + visited
+        return [(self.original(word_id), -neg_distance)
+                for neg_distance, _, word_id in sorted(best, key=lambda x: (-x[0], -x[1]))]
+
+    def memory_usage(self) -> int:
+        """Bytes held by the node arrays and the word buffer"""
+        self.compile()
+        return sum(_buffer_size(getattr(self, name)) for name in self.BUFFERS)
+
+
+class TrieView:
+    """The tree rooted at ``root`` of a CompactTrie forest, searched like a CompactTrie of its own"""
+    __slots__ = ['trie', 'root']
+
+    def __init__(self, trie: CompactTrie, root: int):
+        self.trie = trie
+        self.root = root
+
+    def insert(self, word: str, original: str):
+        raise TypeError('TrieView is read-only')
+
+    @property
+    def max_length(self) -> int:
+        """Length of the longest word stored"""
+        return self.trie.max_lengths[self.root]
+
+    def search(self, word: str) -> Optional[str]:
+        return self.trie.search(word, self.root)
+
+    def search_similar(self, word: str, max_distance: int = 2, limit: int = 10,
+                       deadline: Optional[Deadline] = None, stats: Optional[Dict[str, int]] = None) -> list:
+        return self.trie.search_similar(word, max_distance, limit, deadline, stats, self.root)
+
+    def memory_usage(self) -> int:
+        """Bytes of the forest's node arrays and word buffer taken by this tree"""
+        trie = self.trie
+        node_bytes = sum(getattr(trie, name).itemsize for name in ('chars', 'first_child', 'word_ids', 'max_lengths'))
+        total, stack = 0, [self.root]
+        while stack:
+            node = stack.pop()
+            total += node_bytes
+            word_id = trie.word_ids[node]
+            if word_id >= 0:
+                total += trie.offsets.itemsize + trie.offsets[word_id + 1] - trie.offsets[word_id]
+            stack.extend(range(trie.first_child[node], trie.first_child[node + 1]))
+        return total
+
+
+def _owned(buffer):
+    """A private copy of a (shared) memoryview, as an array or bytes; other buffers are returned as is"""
+    if not isinstance(buffer, memoryview):
+        return buffer
+    if buffer.format == 'B':
+        return bytes(buffer)
+    copy = array(buffer.format)
+    copy.frombytes(buffer.cast('B'))
+    return copy
+
+
+def _buffer_size(buffer) -> int:
+    return buffer.nbytes if isinstance(buffer, memoryview) else sys.getsizeof(buffer)
+
+
+class DeletionIndex:
+    """SymSpell-style fuzzy index over the deletion neighbourhood of each word
+
+    Every word is stored under all strings reachable by deleting up to
+    ``max_distance`` characters. A query generates its own deletes, collects
+    candidates with a handful of dict lookups and verifies them with the exact
+    edit distance. Exposes the same search API as Trie.
+    """
+
+    def __init__(self, max_distance: int = 2):
+        self.max_distance = max_distance
+        self.words = []  # (normalized, original) per word id
+        self.exact = {}  # normalized -> word id
+        self.deletes = {}  # deleted form -> word id, or tuple of ids when shared
+        self.max_length = 0  # Length of the longest word stored
+
+    def _deletes(self, word: str) -> set:
+        """All strings obtained by deleting up to max_distance characters"""
+        found = {word}
+        frontier = [word]
+        for _ in range(self.max_distance):
+            next_frontier = []
+            for item in frontier:
+                for i in range(len(item)):
+                    deleted = item[:i] + item[i + 1:]
+                    if deleted not in found:
+                        found.add(deleted)
+                        next_frontier.append(deleted)
+            frontier = next_frontier
+        return found
+
+    def insert(self, word: str, original: str):
+        if word in self.exact:
+            # Later inserts win, as they do in Trie
+            self.words[self.exact[word]] = (word, original)
+            return
+        word_id = len(self.words)
+        self.words.append((word, original))
+        self.max_length = max(self.max_length, len(word))
+        self.exact[word] = word_id
+        for deleted in self._deletes(word):
+            ids = self.deletes.get(deleted)
+            if ids is None:
+                self.deletes[deleted] = word_id
+            elif isinstance(ids, tuple):
+                self.deletes[deleted] = ids + (word_id,)
+            else:
+                self.deletes[deleted] = (ids, word_id)
+
+    def search(self, word: str) -> Optional[str]:
+        """Return the original of an exact match, or None"""
+        word_id = self.exact.get(word)
+        return self.words[word_id][1] if word_id is not None else None
+
+    def candidates(self, word: str) -> set:
+        """Ids of words that may lie within max_distance, before verification"""
+        candidates = set()
+        for deleted in self._deletes(word):
+            ids = self.deletes.get(deleted)
+            if ids is None:
+                continue
+            if isinstance(ids, tuple):
+                candidates.update(ids)
+            else:
+                candidates.add(ids)
+        return candidates
+
+    def search_similar(self, word: str, max_distance: int = 2, limit: int = 10,
+                       deadline: Optional[Deadline] = None, stats: Optional[Dict[str, int]] = None) -> list:
+        """Return up to ``limit`` (original, distance) pairs, closest first
+
+        Distances above the index's own max_distance are never found.
+        ``deadline`` is checked periodically and may raise DeadlineExceeded.
+        The number of candidates scored is added to ``stats['visited']`` if given.
+        """
+        exact = self.search(word)
+        if exact is not None:
+            return [(exact, 0)]
+
+        max_distance = min(max_distance, self.max_distance)
+        matches = []
+        candidates = sorted(self.candidates(word))
+        if stats is not None:
+            stats['visited'] = stats.get('visited', 0) + len(candidates)
+        for checked, word_id in enumerate(candidates, 1):
+            if deadline is not None and checked % DEADLINE_CHECK_INTERVAL == 0:
+                deadline.check()
+            normalized, original = self.words[word_id]
+            if abs(len(normalized) - len(word)) > max_distance:
+                continue
+            distance = levenshtein_distance(word, normalized, max_distance)
+            if distance <= max_distance:
+                matches.append((distance, word_id, original))
+        matches.sort()
+        return [(original, distance) for distance, _, original in matches[:limit]]
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the index (containers, keys and values)"""
+        total = sys.getsizeof(self.words) + sys.getsizeof(self.exact) + sys.getsizeof(self.deletes)
+        for normalized, original in self.words:
+            total += sys.getsizeof((normalized, original)) + sys.getsizeof(normalized) + sys.getsizeof(original)
+        for deleted, ids in self.deletes.items():
+            total += sys.getsizeof(deleted)
+            if isinstance(ids, tuple):
+                total += sys.getsizeof(ids)
+        return total
+
+
+class BucketIndex:
+    """Names bucketed by normalized length and scored with bit-parallel distances
+
+    A query only visits the buckets within ``max_distance`` of its own length,
+    and every candidate is scored with the bounded bit-parallel
+    levenshtein_distance. With ``vectorized`` each bucket is scored in one
+    pass of NumPy operations instead: every name is a pattern packed into its
+    own uint64 lane and the query is streamed through all lanes at once.
+    Exposes the same search API as Trie.
+    """
+
+    # Longest name a uint64 lane can hold; longer buckets use the scalar path
+    LANE_BITS = 64
+    # Below this many names NumPy's per-call overhead outweighs the scalar loop
+    VECTORIZE_MIN_BUCKET = 32
+
+    def __init__(self, vectorized: bool = False):
+        if vectorized and not HAS_NUMPY:
+            raise ImportError('the vectorized BucketIndex requires numpy')
+        self.vectorized = vectorized
+        self.buckets = defaultdict(list)  # normalized length -> [(normalized, original)]
+        self.exact = {}  # normalized -> position in its bucket
+        self.max_length = 0
+        self.lanes = {}  # normalized length -> (char -> uint64 lane masks), built on first use
+
+    def __getstate__(self):
+        # Lane masks are cheap to rebuild and would bloat snapshots
+        state = dict(self.__dict__)
+        state['lanes'] = {}
+        return state
+
+    def insert(self, word: str, original: str):
+        bucket = self.buckets[len(word)]
+        if word in self.exact:
+            # Later inserts win, as they do in Trie
+            bucket[self.exact[word]] = (word, original)
+            return
+        self.exact[word] = len(bucket)
+        bucket.append((word, original))
+        self.max_length = max(self.max_length, len(word))
+        self.lanes.pop(len(word), None)
+
+    def search(self, word: str) -> Optional[str]:
+        """Return the original of an exact match, or None"""
+        position = self.exact.get(word)
+        return self.buckets[len(word)][position][1] if position is not None else None
+
+    def search_similar(self, word: str, max_distance: int = 2, limit: int = 10,
+                       deadline: Optional[Deadline] = None, stats: Optional[Dict[str, int]] = None) -> list:
+        """Return up to ``limit`` (original, distance) pairs, closest first
+
+        ``deadline`` is checked per bucket and periodically within it, and may
+        raise DeadlineExceeded. The number of names scored is added to
+        ``stats['visited']`` if given.
+        """
+        exact = self.search(word)
+        if exact is not None:
+            return [(exact, 0)]
+
+        matches = []
+        for length in range(max(0, len(word) - max_distance), len(word) + max_distance + 1):
+            bucket = self.buckets.get(length)
+            if not bucket:
+                continue
+            if deadline is not None:
+                deadline.check()
+            if stats is not None:
+                stats['visited'] = stats.get('visited', 0) + len(bucket)
+            if self.vectorized and 0 < length <= self.LANE_BITS and len(bucket) >= self.VECTORIZE_MIN_BUCKET:
+                import numpy
+                distances = self.bucket_distances(length, word)
+                for position in numpy.flatnonzero(distances <= max_distance).tolist():
+                    matches.append((int(distances[position]), length, position, bucket[position][1]))
+                continue
+            for position, (normalized, original) in enumerate(bucket):
+                if deadline is not None and position % DEADLINE_CHECK_INTERVAL == DEADLINE_CHECK_INTERVAL - 1:
+                    deadline.check()
+                distance = levenshtein_distance(word, normalized, max_distance)
+                if distance <= max_distance:
+                    matches.append((distance, length, position, original))
+
+        matches.sort()
+        return [(original, distance) for distance, _, _, original in matches[:limit]]
+
+    def bucket_distances(self, length: int, word: str):
+        """Distances from ``word`` to every name in the bucket, as a NumPy array
+
+        The lane-wise transcription of levenshtein_distance, with the names
+        as patterns; uint64 arithmetic wraps exactly like the masked ints.
+        """
+        import numpy
+
+        peq = self.lanes.get(length)
+        if peq is None:
+            peq = self.lanes[length] = self._pack(self.buckets[length])
+        size = len(self.buckets[length])
+        one = numpy.uint64(1)
+        mask = numpy.uint64((1 << length) - 1)
+        high = numpy.uint64(1 << (length - 1))
+        zero = numpy.zeros(size, dtype=numpy.uint64)
+
+        vp = numpy.full(size, mask, dtype=numpy.uint64)
+        vn = zero
+        score = numpy.full(size, length, dtype=numpy.int64)
+        for char in word:
+            x = peq.get(char, zero) | vn
+            d0 = (((x & vp) + vp) ^ vp) | x
+            hp = vn | ~(d0 | vp)
+            hn = vp & d0
+            score += (hp & high) != 0
+            score -= (hn & high) != 0
+            x = ((hp << one) | one) & mask
+            vn = x & d0
+            vp = ((hn << one) | ~(x | d0)) & mask
+        return score
+
+    @staticmethod
+    def _pack(bucket: list) -> dict:
+        import numpy
+
+        masks = defaultdict(lambda: [0] * len(bucket))
+        for lane, (normalized, _) in enumerate(bucket):
+            for i, char in enumerate(normalized):
+                masks[char][lane] |= 1 << i
+        return {char: numpy.array(lane_masks, dtype=numpy.uint64) for char, lane_masks in masks.items()}
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the buckets and the exact-match map"""
+        total = sys.getsizeof(self.buckets) + sys.getsizeof(self.exact)
+        for bucket in self.buckets.values():
+            total += sys.getsizeof(bucket) + sum(sys.getsizeof(entry) for entry in bucket)
+        for peq in self.lanes.values():
+            total += sum(masks.nbytes for masks in peq.values())
+        return total
+
+
+class VectorizedBucketIndex(BucketIndex):
+    """BucketIndex scoring whole buckets with NumPy; requires numpy"""
+
+    def __init__(self):
+        super().__init__(vectorized=True)
+
+
+class TokenIndex:
+    """Inverted index from normalized tokens and token bigrams to entry ids
+
+    Each posting list is split by parent id (None for unscoped entries), so a
+    scoped lookup reads only the postings of that parent's children. The
+    candidates for a query are the entries sharing the most of its terms. The
+    survivors are verified with the edit distance. Entries sharing no intact
+    token with the query are not found; callers fall back to a full fuzzy
+    index for those.
+    """
+
+    def __init__(self):
+        self.entries = []  # (normalized, original) per entry id
+        self.postings = {}  # term -> {parent id: [entry ids]}
+
+    @staticmethod
+    def terms(word: str) -> List[str]:
+        tokens = word.split()
+        return list(dict.fromkeys(tokens + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]))
+
+    def insert(self, word: str, original: str, parent_id: Optional[str] = None):
+        entry_id = len(self.entries)
+        self.entries.append((word, original))
+        for term in self.terms(word):
+            self.postings.setdefault(term, {}).setdefault(parent_id, []).append(entry_id)
+
+    def posting(self, term: str, parent_id: Optional[str] = None):
+        """Entry ids holding ``term`` under ``parent_id``, or None"""
+        by_parent = self.postings.get(term)
+        return by_parent.get(parent_id) if by_parent is not None else None
+
+    def entry(self, entry_id: int) -> tuple:
+        return self.entries[entry_id]
+
+    def candidates(self, word: str, parent_id: Optional[str] = None) -> List[int]:
+        """Ids of the entries under ``parent_id`` that share the most query terms"""
+        lists = []
+        for term in self.terms(word):
+            posting = self.posting(term, parent_id)
+            if posting is not None:
+                lists.append(posting)
+        if not lists:
+            return []
+        if len(lists) == 1:
+            return lists[0]
+
+        # Intersect shortest first; a term that would empty the intersection is
+        # treated as noise (a typo or a token from a neighbouring span)
+        lists.sort(key=len)
+        survivors = set(lists[0])
+        for posting in lists[1:]:
+            narrowed = survivors.intersection(posting)
+            if narrowed:
+                survivors = narrowed
+        return sorted(survivors)
+
+    def search_similar(self, word: str, max_distance: int = 2, limit: int = 10,
+                       parent_id: Optional[str] = None) -> list:
+        """Return up to ``limit`` verified (original, distance) pairs, closest first"""
+        matches = []
+        for entry_id in self.candidates(word, parent_id):
+            normalized, original = self.entry(entry_id)
+            if abs(len(normalized) - len(word)) > max_distance:
+                continue
+            distance = levenshtein_distance(word, normalized, max_distance)
+            if distance <= max_distance:
+                matches.append((distance, entry_id, original))
+        matches.sort()
+        return [(original, distance) for distance, _, original in matches[:limit]]
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the entries and posting lists"""
+        total = sys.getsizeof(self.entries) + sys.getsizeof(self.postings)
+        total += sum(sys.getsizeof(entry) for entry in self.entries)
+        for by_parent in self.postings.values():
+            total += sys.getsizeof(by_parent) + sum(sys.getsizeof(ids) for ids in by_parent.values())
+        return total
+
+
+class PackedTokenIndex(TokenIndex):
+    """Read-only TokenIndex in flat arrays, with the same candidates and results
+
+    Terms are numbered by the word ids of a CompactTrie holding them. Term
+    ``t`` owns the groups ``term_groups[t]:term_groups[t + 1]``, one per
+    parent and sorted by parent number (-1 for unscoped). Group ``g`` owns the
+    entry ids ``entry_ids[group_starts[g]:group_starts[g + 1]]``. Entry
+    strings, normalized then original, are stored in one UTF-8 buffer.
+    """
+    BUFFERS = ('term_groups', 'group_parents', 'group_starts', 'entry_ids', 'text', 'offsets')
+
+    def __init__(self, index: TokenIndex):
+        parents = sorted({parent for by_parent in index.postings.values() for parent in by_parent
+                          if parent is not None})
+        self.parent_numbers = {None: -1, **{parent: number for number, parent in enumerate(parents)}}
+        self.term_trie = CompactTrie()
+        for term in index.postings:
+            self.term_trie.insert(term, term)
+        self.term_trie.compile()
+
+        by_term_id = sorted(index.postings.items(), key=lambda item: self.term_trie.find(item[0]))
+        self.term_groups, self.group_parents = array('I', [0]), array('i')
+        self.group_starts, self.entry_ids = array('I', [0]), array('I')
+        for _, by_parent in by_term_id:
+            for number, ids in sorted((self.parent_numbers[parent], ids) for parent, ids in by_parent.items()):
+                self.group_parents.append(number)
+                self.entry_ids.extend(ids)
+                self.group_starts.append(len(self.entry_ids))
+            self.term_groups.append(len(self.group_parents))
+
+        text, self.offsets = bytearray(), array('I', [0])
+        for normalized, original in index.entries:
+            for string in (normalized, original):
+                text += string.encode('utf-8')
+                self.offsets.append(len(text))
+        self.text = bytes(text)
+
+    def __getstate__(self):
+        return {name: _owned(value) if name in self.BUFFERS else value for name, value in self.__dict__.items()}
+
+    def insert(self, word: str, original: str, parent_id: Optional[str] = None):
+        raise TypeError('PackedTokenIndex is read-only')
+
+    def posting(self, term: str, parent_id: Optional[str] = None):
+        term_id = self.term_trie.find(term)
+        number = self.parent_numbers.get(parent_id)
+        if term_id < 0 or number is None:
+            return None
+        start, end = self.term_groups[term_id], self.term_groups[term_id + 1]
+        group = bisect_left(self.group_parents, number, start, end)
+        if group == end or self.group_parents[group] != number:
+            return None
+        return self.entry_ids[self.group_starts[group]:self.group_starts[group + 1]]
+
+    def entry(self, entry_id: int) -> tuple:
+        text, offsets = self.text, self.offsets
+        start, middle, end = offsets[2 * entry_id], offsets[2 * entry_id + 1], offsets[2 * entry_id + 2]
+        return str(text[start:middle], 'utf-8'), str(text[middle:end], 'utf-8')
+
+    def memory_usage(self) -> int:
+        """Bytes held by the arrays, the term trie and the parent numbering"""
+        total = sum(_buffer_size(getattr(self, name)) for name in self.BUFFERS) + self.term_trie.memory_usage()
+        return total + sys.getsizeof(self.parent_numbers)
+
+
+def levenshtein_distance(s1: str, s2: str, max_distance: Optional[int] = None) -> int:
+    """Levenshtein distance by Hyyrö's bit-parallel form of Myers' algorithm
+
+    The longer string is encoded as bit vectors (Python ints, so any length)
+    and the shorter one is scanned a character at a time, one column of the
+    DP table per handful of integer operations. With ``max_distance`` any
+    larger distance is reported as ``max_distance + 1``, and the scan stops as
+    soon as that is certain.
+    """
+    if len(s1) < len(s2):
+        s1, s2 = s2, s1
+    if not s2:
+        return len(s1) if max_distance is None else min(len(s1), max_distance + 1)
+
+    peq = {}
+    for i, char in enumerate(s1):
+        peq[char] = peq.get(char, 0) | (1 << i)
+    mask = (1 << len(s1)) - 1
+    high = 1 << (len(s1) - 1)
+    vp, vn, score = mask, 0, len(s1)
+    remaining = len(s2)
+    for char in s2:
+        x = peq.get(char, 0) | vn
+        d0 = (((x & vp) + vp) ^ vp) | x
+        hp = vn | ~(d0 | vp)
+        hn = vp & d0
+        if hp & high:
+            score += 1
+        elif hn & high:
+            score -= 1
+        x = ((hp << 1) | 1) & mask
+        vn = x & d0
+        vp = ((hn << 1) | ~(x | d0)) & mask
+        remaining -= 1
+        # Each remaining column can lower the score by at most one
+        if max_distance is not None and score - remaining > max_distance:
+            return max_distance + 1
+    return score if max_distance is None else min(score, max_distance + 1)
+
+
+class LRUCache:
+    """Size-bounded, thread-safe LRU cache with an optional time-to-live
+
+    A ``maxsize`` of 0 disables caching. Hits, misses and evictions (both
+    capacity and expiry) are counted for monitoring.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > self.clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.evictions += 1
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires_at = self.clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class FoldTable(dict):
+    """``str.translate`` table that lower-cases, folds Vietnamese letters to
+    ASCII and drops everything but [a-z0-9] and whitespace, in one call
+
+    Entries are filled in on first sight of each code point.
+    """
+
+    _DROP = re.compile(r'[^a-z0-9\s]')
+
+    def __init__(self, char_map: Dict[str, str]):
+        super().__init__()
+        self.char_map = char_map
+
+    def __missing__(self, code_point: int) -> str:
+        folded = ''.join(self.char_map.get(char, char) for char in chr(code_point).lower())
+        folded = self._DROP.sub('', folded)
+        self[code_point] = folded
+        return folded
+
+
+class ReplacementPasses(dict):
+    """Ordered ``str.replace`` passes, run with only the ones an input can match
+
+    A pass can only match, in the input or in text created by earlier passes,
+    if the input has every character of its pattern that no replacement
+    writes. So the passes to run depend only on which pattern characters the
+    input holds, and the others are skipped; the result is exactly that of
+    running every pass in order. The plan for each set of characters is
+    filled in on first sight.
+    """
+
+    MAX_PLANS = 1024
+
+    def __init__(self, replacements: Dict[str, str]):
+        super().__init__()
+        created = set(''.join(replacements.values()))
+        self.passes = [(old, new, frozenset(old) - created) for old, new in replacements.items()]
+        self.chars = frozenset().union(*(needed for _, _, needed in self.passes))
+
+    def __missing__(self, chars: frozenset) -> tuple:
+        if len(self) >= self.MAX_PLANS:
+            self.clear()
+        plan = tuple((old, new) for old, new, needed in self.passes if needed <= chars)
+        self[chars] = plan
+        return plan
+
+    def replace(self, text: str) -> str:
+        for old, new in self[self.chars.intersection(text)]:
+            text = text.replace(old, new)
+        return text
 
 
 class AddressMatcher:
+    # Per-address time budget used by process(), in seconds
+    DEFAULT_TIMEOUT = 0.09
+
     # Vietnamese character mappings
     VIET_CHARS = {
         'đ': 'd', 'Đ': 'D',
@@ -151,27 +1110,159 @@ class AddressMatcher:
         '.': ' ', ',': ' ', '-': ' ', '_': ' ',
     }
 
-    def __init__(self, xa_file: str, huyen_file: str, tinh_file: str):
+    # Folding is a single str.translate; the replacements only run the passes an address can match
+    FOLD_TABLE = FoldTable(VIET_CHARS)
+    REPLACEMENT_PASSES = ReplacementPasses(REPLACEMENTS)
+
+    FUZZY_INDEXES = {
+        'trie': CompactTrie,
+        'dict-trie': Trie,
+        'deletion': DeletionIndex,
+        'bucket': BucketIndex,
+        'bucket-numpy': VectorizedBucketIndex,
+    }
+
+    # Levels in decoding order, outermost first
+    LEVELS = ('province', 'district', 'ward')
+
+    ABBREVIATIONS_FILE = 'abbreviations.txt'
+    HIERARCHY_FILES = ('wards_with_code.txt', 'districts_with_code.txt', 'provinces_with_code.txt')
+
+    # Compiled state saved in snapshots; bump SNAPSHOT_VERSION when its layout changes
+    SNAPSHOT_FILE = 'address_matcher.snap'
+    SNAPSHOT_VERSION = 5
+    SNAPSHOT_STATE = (
+        'fuzzy_index', 'data', 'abbreviations',
+        'provinces', 'provinces_by_name', 'districts_by_id', 'districts_by_name',
+        'province_trie', 'district_trie', 'ward_trie', 'tries', 'fuzzy_indexes', 'token_indexes',
+    )
+
+    def __init__(self, xa_file: str, huyen_file: str, tinh_file: str, fuzzy_index: str = 'trie',
+                 cache_size: int = 10000, cache_ttl: Optional[float] = None,
+                 instrumentation: Optional[Instrumentation] = None, lazy_wards: bool = False,
+                 warm_up: bool = False):
+        """Build the indexes from the gazetteer files
+
+        With ``lazy_wards`` the ward indexes are built on first use: per
+        district for scoped lookups, and all at once for the unscoped ward
+        index. ``warm_up`` then builds the rest in a background thread.
+        """
+        if fuzzy_index not in self.FUZZY_INDEXES:
+            raise ValueError(f"Unknown fuzzy index {fuzzy_index!r}, expected one of {sorted(self.FUZZY_INDEXES)}")
+        self._init_runtime(cache_size, cache_ttl, instrumentation)
+        self._build(xa_file, huyen_file, tinh_file, fuzzy_index, lazy_wards)
+        if warm_up:
+            self.warm_up()
+
+    def _build(self, xa_file: str, huyen_file: str, tinh_file: str, fuzzy_index: str, lazy_wards: bool = False,
+               previous: Optional['AddressMatcher'] = None):
+        """Build the gazetteer state, reusing the parts of ``previous`` whose sources are unchanged"""
+        self.fuzzy_index = fuzzy_index
+        self.data_files = (xa_file, huyen_file, tinh_file)
+        self.source_checksums = file_checksums(self.source_files(*self.data_files))
+        reused_levels, reused_tokens = self._reusable_levels(previous)
+        self.reused = {'levels': list(reused_levels), 'token_indexes': list(reused_tokens),
+                       'district_scopes': 0, 'ward_scopes': 0}
+
         # Initialize data structures
         self.data = {
             'ward': set(self.load_data(xa_file)),
             'district': set(self.load_data(huyen_file)),
             'province': set(self.load_data(tinh_file))
         }
+        for level in reused_levels:
+            self.data[level] = previous.data[level]
 
         # Initialize lookup maps
         self.provinces = {}
-        self.cache = {}
+        self.provinces_by_name = {}
+        self.districts_by_id = {}
+        self.districts_by_name = {}  # (province id, name) -> District
         self.abbreviations = self._load_abbreviations()
 
-        self.province_trie = Trie()
-        self.district_trie = Trie()
-        self.ward_trie = Trie()
-        self.tries = {
-            'province': self.province_trie,
-            'district': self.district_trie,
-            'ward': self.ward_trie
-        }
+        self.tries = {level: previous.tries[level] if level in reused_levels else CompactTrie()
+                      for level in self.LEVELS}
+        self.province_trie, self.district_trie, self.ward_trie = self.tries.values()
+        # Indexes used for fuzzy lookups; the tries themselves unless another kind is selected
+        if fuzzy_index == 'trie':
+            self.fuzzy_indexes = self.tries
+        else:
+            index_class = self.FUZZY_INDEXES[fuzzy_index]
+            self.fuzzy_indexes = {level: previous.fuzzy_indexes[level] if level in reused_levels else index_class()
+                                  for level in self.tries}
+        # Token postings for every level, unscoped and per parent, used to
+        # generate fuzzy candidates before falling back to fuzzy_indexes
+        self.token_indexes = {level: previous.token_indexes[level] if level in reused_tokens else TokenIndex()
+                              for level in self.tries}
+
+        # Create normalized lookup maps
+        self._init_lookup_maps(lazy_wards, previous, reused_levels, reused_tokens)
+
+        # Load hierarchical data
+        self.load_own_file(*self.HIERARCHY_FILES, lazy_wards=lazy_wards, previous=previous,
+                           token_levels=[level for level in self.LEVELS if level not in reused_tokens])
+        self.compile_indexes()
+
+    def _reusable_levels(self, previous: Optional['AddressMatcher']) -> tuple:
+        """Levels whose global indexes, and levels whose token indexes, can be taken from ``previous``
+
+        A level's global indexes depend on its list file only; its token index
+        also holds the scoped postings, which depend on the hierarchy files.
+        Parts ``previous`` has not built yet (lazy wards) are never reused.
+        """
+        if previous is None or previous.fuzzy_index != self.fuzzy_index:
+            return (), ()
+        old = getattr(previous, 'source_checksums', {})
+
+        def unchanged(paths):
+            return all(old.get(path) == self.source_checksums.get(path) for path in paths)
+
+        level_files = dict(zip(('ward', 'district', 'province'), self.data_files))
+        hierarchy_complete = not previous.ward_level_pending and not previous.pending_wards and all(
+            district.ward_index is not None for district in previous.districts_by_id.values())
+        levels, tokens = [], []
+        for level in self.LEVELS:
+            if level == 'ward' and previous.ward_level_pending:
+                continue
+            if unchanged([level_files[level]]):
+                levels.append(level)
+                scoped_sources = self.HIERARCHY_FILES if level != 'province' else ()
+                if unchanged(scoped_sources) and (level != 'ward' or hierarchy_complete):
+                    tokens.append(level)
+        return tuple(levels), tuple(tokens)
+
+    def reload(self, **runtime) -> 'AddressMatcher':
+        """Return a new matcher built from the current contents of this one's files
+
+        Indexes whose source files are unchanged are shared with this
+        matcher instead of rebuilt. So are the scoped district/ward indexes of
+        every province/district whose names are unchanged. Shared indexes are
+        never modified after they are built. This matcher stays fully usable
+        while the new one is built, so callers can swap the reference once
+        reload returns. ``reused`` on the result says what was shared. Runtime
+        options (``cache_size``, ``cache_ttl``, ``instrumentation``) default
+        to this matcher's; the cache starts empty. The new matcher is built
+        eagerly.
+        """
+        runtime = {'cache_size': self.cache.maxsize, 'cache_ttl': self.cache.ttl,
+                   'instrumentation': self.instrumentation, **runtime}
+        matcher = type(self).__new__(type(self))
+        matcher._init_runtime(**runtime)
+        matcher._build(*self.data_files, self.fuzzy_index, previous=self)
+        return matcher
+
+    def _init_runtime(self, cache_size: int = 10000, cache_ttl: Optional[float] = None,
+                      instrumentation: Optional[Instrumentation] = None):
+        """Per-process state that is never part of a snapshot"""
+        self.cache = LRUCache(cache_size, cache_ttl)
+        # Per-stage timings and counters; None disables every hook
+        self.instrumentation = instrumentation
+        # Ward data not indexed yet in lazy mode: rows per district id, and the unscoped ward level
+        self.pending_wards: Dict[str, list] = {}
+        self.ward_level_pending = False
+        self.ward_lock = threading.Lock()
+        # Mapping holding the compiled indexes once share() has been called
+        self.shared_block: Optional[SharedBlock] = None
 
         # Precompile regex patterns
         self.admin_indicators = re.compile(r'^.*?(Thị\s*[Tt]rấn|TT|Phường|P|Ph?|[Xx]ã)\.?\s+')
@@ -185,11 +1276,66 @@ class AddressMatcher:
             ]
         ]
 
-        # Create normalized lookup maps
-        self._init_lookup_maps()
-
-        # Load hierarchical data
-        self.load_own_file('wards_with_code.txt', 'districts_with_code.txt', 'provinces_with_code.txt')
+    # Set by _init_runtime; the lazy ward rows among them are data and survive pickling
+    RUNTIME_STATE = ('cache', 'instrumentation', 'ward_lock', 'shared_block', 'admin_indicators', 'p_patterns')
+
+    def __getstate__(self):
+        # Pool workers that cannot fork receive the matcher pickled: locks and the mapping cannot be
+        state = {name: value for name, value in self.__dict__.items() if name not in self.RUNTIME_STATE}
+        state['runtime'] = {'cache_size': self.cache.maxsize, 'cache_ttl': self.cache.ttl,
+                            'instrumentation': self.instrumentation}
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        runtime = state.pop('runtime')
+        pending = state.pop('pending_wards'), state.pop('ward_level_pending')
+        self.__dict__.update(state)
+        self._init_runtime(**runtime)
+        self.pending_wards, self.ward_level_pending = pending
+
+    @classmethod
+    def source_files(cls, xa_file: str, huyen_file: str, tinh_file: str) -> List[str]:
+        """Every file the compiled state is built from"""
+        return [xa_file, huyen_file, tinh_file, cls.ABBREVIATIONS_FILE, *cls.HIERARCHY_FILES]
+
+    def save_snapshot(self, path: str = SNAPSHOT_FILE):
+        """Write the compiled gazetteer state to a versioned snapshot"""
+        self.load_all_wards()
+        state = {name: getattr(self, name) for name in self.SNAPSHOT_STATE}
+        write_snapshot(path, state, self.source_files(*self.data_files), 'AddressMatcher',
+                       self.SNAPSHOT_VERSION, {'fuzzy_index': self.fuzzy_index})
+
+    @classmethod
+    def from_snapshot(cls, path: str, xa_file: str, huyen_file: str, tinh_file: str,
+                      fuzzy_index: str = 'trie', **runtime) -> 'AddressMatcher':
+        """Load a matcher from a snapshot; raises SnapshotMismatch if it is stale
+
+        Extra keyword arguments (``cache_size``, ``cache_ttl``, ``instrumentation``) are passed on
+        as they would be to the constructor.
+        """
+        state = read_snapshot(path, cls.source_files(xa_file, huyen_file, tinh_file), 'AddressMatcher',
+                              cls.SNAPSHOT_VERSION, {'fuzzy_index': fuzzy_index})
+        matcher = cls.__new__(cls)
+        for name in cls.SNAPSHOT_STATE:
+            setattr(matcher, name, state[name])
+        matcher.data_files = (xa_file, huyen_file, tinh_file)
+        # read_snapshot has just checked the sources still hash to these
+        matcher.source_checksums = file_checksums(cls.source_files(xa_file, huyen_file, tinh_file))
+        matcher.reused = {}
+        matcher._init_runtime(**runtime)
+        return matcher
+
+    @classmethod
+    def load(cls, xa_file: str, huyen_file: str, tinh_file: str, fuzzy_index: str = 'trie',
+             snapshot: str = SNAPSHOT_FILE, **runtime) -> 'AddressMatcher':
+        """Load from ``snapshot`` when it is current, otherwise build and refresh it"""
+        try:
+            return cls.from_snapshot(snapshot, xa_file, huyen_file, tinh_file, fuzzy_index, **runtime)
+        except (OSError, SnapshotMismatch):
+            matcher = cls(xa_file, huyen_file, tinh_file, fuzzy_index, **runtime)
+            matcher.save_snapshot(snapshot)
+            return matcher
 
     @staticmethod
     def load_data(filename: str) -> List[str]:
@@ -203,89 +1349,218 @@ class AddressMatcher:
 
     def _load_abbreviations(self) -> Dict[str, str]:
         abbreviations = {}
-        with open('abbreviations.txt', 'r', encoding='utf-8') as file:
+        with open(self.ABBREVIATIONS_FILE, 'r', encoding='utf-8') as file:
             for line in file:
                 abbr, full = line.strip().split(',')
                 abbreviations[abbr] = full
         return abbreviations
 
-    def _init_lookup_maps(self):
-        """Initialize normalized lookup maps for faster matching"""
-        # Create dictionaries grouped by length for each level
-        self.length_maps = {
-            'province': defaultdict(list),
-            'district': defaultdict(list),
-            'ward': defaultdict(list)
-        }
-
-        # Group items by their normalized length
-        for level in ['province', 'district', 'ward']:
-            for item in self.data[level]:
-                norm_item = self.normalize(item)
-                self.length_maps[level][len(norm_item)].append((item, norm_item))
+    def _init_lookup_maps(self, lazy_wards: bool = False, previous: Optional['AddressMatcher'] = None,
+                          reused_levels: Iterable[str] = (), reused_tokens: Iterable[str] = ()):
+        """Index the names of every level, except those reused from ``previous`` or left to lazy loading"""
+        for level in self.LEVELS:
+            if level in reused_levels:
+                if level not in reused_tokens:
+                    self._index_level(level, indexes=False)
+            elif level == 'ward' and lazy_wards:
+                self.ward_level_pending = True
+            else:
+                self._index_level(level)
+
+    def _index_level(self, level: str, indexes: bool = True, tokens: bool = True):
+        """Add every name of ``level`` to its trie and fuzzy index, and/or to its token index"""
+        for item in self.data[level]:
+            norm_item = self.normalize(item)
+            if indexes:
                 # Add to trie
                 self.tries[level].insert(norm_item, item)
+                if self.fuzzy_indexes is not self.tries:
+                    self.fuzzy_indexes[level].insert(norm_item, item)
+            if tokens:
+                self.token_indexes[level].insert(norm_item, item)
+        if indexes:
+            # Free this level's build-time nodes before the next level allocates its own
+            self.tries[level].compile()
+            if isinstance(self.fuzzy_indexes[level], CompactTrie):
+                self.fuzzy_indexes[level].compile()
 
-    @lru_cache(maxsize=10000)
     def normalize(self, text: str) -> str:
-        """Normalize text with caching"""
-        text = text.lower()
-        for viet_char, ascii_char in self.VIET_CHARS.items():
-            text = text.replace(viet_char, ascii_char)
-        return re.sub(r'[^a-z0-9\s]', '', text)
+        """Lower-case, strip diacritics and drop anything but letters, digits and whitespace"""
+        return text.translate(self.FOLD_TABLE)
 
-    @lru_cache(maxsize=1000)
     def levenshtein_distance(self, s1: str, s2: str) -> int:
-        """Calculate Levenshtein distance with caching"""
-        if len(s1) < len(s2):
-            return self.levenshtein_distance(s2, s1)
-        if len(s2) == 0:
-            return len(s1)
-
-        previous_row = range(len(s2) + 1)
-        for i, c1 in enumerate(s1):
-            current_row = [i + 1]
-            for j, c2 in enumerate(s2):
-                insertions = previous_row[j + 1] + 1
-                deletions = current_row[j] + 1
-                substitutions = previous_row[j] + (c1 != c2)
-                current_row.append(min(insertions, deletions, substitutions))
-            previous_row = current_row
-        return previous_row[-1]
-
-    def find_best_match_v3(self, part: str, level: str, in_scope) -> Optional[str]:
-        """Find best matching address component"""
+        """Calculate Levenshtein distance (bit-parallel, cheaper than caching it)"""
+        return levenshtein_distance(s1, s2)
+
+    def build_scope_index(self, items, previous: Optional[tuple] = None) -> tuple:
+        """Build the exact-match map and fuzzy index for a set of sibling items
+
+        ``previous`` is an earlier (names, index) pair for the same parent;
+        it is returned as is when the names, in order, are unchanged.
+        """
+        items = list(items)
+        names = {}
+        for item in items:
+            names[self.normalize(item.name)] = item.name
+        if previous is not None and previous[1] is not None and list(previous[0].items()) == list(names.items()):
+            return previous
+        index = self.FUZZY_INDEXES[self.fuzzy_index]()
+        for item in items:
+            index.insert(self.normalize(item.name), item.name)
+        return names, index
+
+    def level_indexes(self, level: str, scope) -> tuple:
+        """(exact-match names or None, fuzzy index) for ``level`` under ``scope``
+
+        Lazily loaded ward indexes are built here on first use.
+        """
+        if scope is None:
+            if level == 'ward' and self.ward_level_pending:
+                self.load_ward_level()
+            return None, self.fuzzy_indexes[level]
+        if level == 'district':
+            return scope.district_names, scope.district_index
+        if scope.ward_index is None:
+            self.load_wards(scope)
+        return scope.ward_names, scope.ward_index
+
+    def load_wards(self, district: District):
+        """Build the scoped ward indexes of ``district`` if lazy loading left them out"""
+        with self.ward_lock:
+            if district.ward_index is not None:
+                return
+            for id, name, code in self.pending_wards.pop(district.id, ()):
+                ward = Ward(id, name, code, district.id)
+                ward.district = district
+                district.wards[id] = ward
+            self._build_ward_scope(district)
+
+    def load_ward_level(self):
+        """Build the unscoped ward indexes if lazy loading left them out"""
+        with self.ward_lock:
+            if self.ward_level_pending:
+                self._index_level('ward')
+                self.ward_level_pending = False
+
+    def load_all_wards(self):
+        """Build every ward index still pending; a no-op for eagerly built matchers"""
+        self.load_ward_level()
+        for district in self.districts_by_id.values():
+            if district.ward_index is None:
+                self.load_wards(district)
+
+    def warm_up(self) -> threading.Thread:
+        """Build the pending ward indexes in a daemon thread, returned so callers can join it"""
+        thread = threading.Thread(target=self.load_all_wards, name='ward-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def compiled_indexes(self) -> List[CompactTrie]:
+        """Every CompactTrie of the matcher, global and scoped (the forests behind TrieViews)"""
+        indexes = list(self.tries.values()) + list(self.fuzzy_indexes.values())
+        for province in self.provinces.values():
+            indexes.append(province.district_index)
+            indexes.extend(district.ward_index for district in province.districts.values()
+                           if district.ward_index is not None)
+        indexes = [index.trie if isinstance(index, TrieView) else index for index in indexes]
+        return list({id(index): index for index in indexes if isinstance(index, CompactTrie)}.values())
+
+    def pack_scope_indexes(self):
+        """Compile the scoped district and ward tries into one forest per level, viewed per scope
+
+        Only for the 'trie' backend, once every ward scope is built.
+        """
+        if self.fuzzy_index != 'trie':
+            return
+        provinces = list(self.provinces.values())
+        districts = [district for province in provinces for district in province.districts.values()]
+        for scopes, name in ((provinces, 'district_index'), (districts, 'ward_index')):
+            for scope, view in zip(scopes, CompactTrie.forest(getattr(scope, name) for scope in scopes)):
+                setattr(scope, name, view)
+
+    def compile_indexes(self):
+        """Freeze every CompactTrie now, so lookups never build and forked workers share the arrays"""
+        for index in self.compiled_indexes():
+            index.compile()
+
+    def share(self, directory: Optional[str] = None) -> SharedBlock:
+        """Move the compiled indexes into one read-only mapping that forked workers share
+
+        Token indexes and scoped tries are packed first, so a worker only
+        touches a few small objects per index it reads. Non-trie fuzzy
+        backends and the hierarchy objects stay ordinary per-process objects.
+        Sharing again is a no-op.
+        """
+        if self.shared_block is not None:
+            return self.shared_block
+        self.load_all_wards()
+        self.compile_indexes()
+        self.pack_scope_indexes()
+        self.token_indexes = {level: index if isinstance(index, PackedTokenIndex) else PackedTokenIndex(index)
+                              for level, index in self.token_indexes.items()}
+        indexes = self.compiled_indexes()
+        for index in self.token_indexes.values():
+            indexes += [index, index.term_trie]
+        self.shared_block = share_buffers(indexes, directory)
+        # The replaced build-time objects sit on free lists until a full collection empties them
+        gc.collect()
+        trim_heap()
+        return self.shared_block
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Approximate bytes held by the fuzzy and token indexes, global and scoped, per level"""
+        usage = {level: index.memory_usage() + self.token_indexes[level].memory_usage()
+                 for level, index in self.fuzzy_indexes.items()}
+        for province in self.provinces.values():
+            usage['district'] += province.district_index.memory_usage()
+            for district in province.districts.values():
+                if district.ward_index is not None:
+                    usage['ward'] += district.ward_index.memory_usage()
+        return usage
+
+    def enable_instrumentation(self, instrumentation: Optional[Instrumentation] = None) -> Instrumentation:
+        """Record per-stage timings and counters for every match from now on"""
+        self.instrumentation = instrumentation or Instrumentation()
+        return self.instrumentation
+
+    def prometheus_metrics(self) -> str:
+        """Instrumentation counters and stage histograms with the cache statistics, as Prometheus text"""
+        cache = self.cache.stats()
+        extra = [
+            ('cache_hits_total', 'counter', 'Result cache hits', cache['hits']),
+            ('cache_misses_total', 'counter', 'Result cache misses', cache['misses']),
+            ('cache_evictions_total', 'counter', 'Result cache evictions', cache['evictions']),
+            ('cache_hit_ratio', 'gauge', 'Result cache hits per lookup', cache['hit_ratio']),
+            ('cache_entries', 'gauge', 'Results held in the cache', cache['size']),
+        ]
+        return (self.instrumentation or Instrumentation()).to_prometheus(extra)
+
+    def find_best_match_v3(self, part: str, level: str, scope=None,
+                           deadline: Optional[Deadline] = None) -> Optional[str]:
+        """Find best matching address component
+
+        ``scope`` is the parent entity (a Province for districts, a District
+        for wards) whose precomputed indexes restrict the search.
+        """
         normalized_part = self.normalize(part)
 
+        names, index = self.level_indexes(level, scope)
         # Try exact match first
-        if in_scope is not None:
-            normalized_items = {self.normalize(item.name): item.name for item in in_scope.values()}
-            if normalized_part in normalized_items:
-                return normalized_items[normalized_part]
-
-        # Use trie for fuzzy matching
-        if in_scope is not None:
-            # Build temporary trie for in_scope items
-            temp_trie = Trie()
-            for item in in_scope.values():
-                temp_trie.insert(self.normalize(item.name), item.name)
-            matches = temp_trie.search_similar(normalized_part, max_distance=2)
-        else:
-            matches = self.tries[level].search_similar(normalized_part, max_distance=2)
+        if names is not None and normalized_part in names:
+            return names[normalized_part]
+
+        # Use the fuzzy index for approximate matching
+        matches = index.search_similar(normalized_part, max_distance=2, limit=1, deadline=deadline)
 
         if matches:
             return matches[0][0]  # Return the closest match
 
         return None
 
-    @lru_cache(maxsize=1000)
     def clean_address(self, address: str) -> str:
-        """Clean address string with caching"""
-        cleaned = address
-
+        """Clean address string"""
         # Apply replacements
-        for old, new in self.REPLACEMENTS.items():
-            cleaned = cleaned.replace(old, new)
+        cleaned = self.REPLACEMENT_PASSES.replace(address)
 
         # Handle administrative indicators
         match = self.admin_indicators.search(cleaned)
@@ -298,34 +1573,64 @@ class AddressMatcher:
 
         return ' '.join(cleaned.split())
 
-    def process(self, address: str):
-        return self.run_with_timeout(self.match_address, address)
+    def process(self, address: str, timeout: Optional[float] = DEFAULT_TIMEOUT):
+        return self.run_with_timeout(self.match_address, address, timeout)
 
-    def run_with_timeout(self, func, address, timeout=0.09):
-        def timeout_handler(signum, frame):
-            raise TimeoutError()
+    def match_many(self, addresses: Iterable[str], workers: int = 1, chunk_size: int = 256) -> List[Dict[str, str]]:
+        """Process a batch of addresses, returning results in input order
 
-        # Set signal handler
-        signal.signal(signal.SIGALRM, timeout_handler)
-        signal.setitimer(signal.ITIMER_REAL, timeout)
+        Identical inputs are processed once. With ``workers`` > 1 the unique
+        addresses are split into chunks and fanned out to a process pool whose
+        workers receive this matcher once, at start-up, instead of per task,
+        with its indexes shared (see ``share``). Every address still gets its
+        own ``process`` timeout.
+        """
+        addresses = list(addresses)
+        unique = list(dict.fromkeys(addresses))
 
+        if workers <= 1 or len(unique) <= chunk_size:
+            results = {address: self.process(address) for address in unique}
+        else:
+            chunks = [unique[i:i + chunk_size] for i in range(0, len(unique), chunk_size)]
+            with _shared_pool(self, min(workers, len(chunks))) as pool:
+                results = {}
+                for chunk, chunk_results in zip(chunks, pool.imap(_process_chunk, chunks)):
+                    results.update(zip(chunk, chunk_results))
+
+        return [results[address] for address in addresses]
+
+    def run_with_timeout(self, func, address, timeout=DEFAULT_TIMEOUT):
+        """Call ``func(address, deadline=...)`` with a cooperative deadline of ``timeout`` seconds"""
+        return func(address, deadline=Deadline(timeout))
+
+    def canonical_address(self, address: str) -> str:
+        """Cleaned, NFC-normalized, whitespace-collapsed form used for matching and as the cache key"""
+        return self.clean_address(unicodedata.normalize('NFC', address))
+
+    def match_address(self, input_address: str, deadline: Optional[Deadline] = None) -> Dict[str, str]:
+        """Match address components with caching
+
+        If ``deadline`` expires the best assignment decoded so far is returned
+        with ``partial`` set to True; partial results are not cached.
+        """
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return self._match_address(input_address, deadline, None)
+        trace = instrumentation.start()
         try:
-            result = func(address)
-            signal.setitimer(signal.ITIMER_REAL, 0)  # Disable timer
-            return result
-        except TimeoutError:
-            return {
-                'province': 'overtime',
-                'district': '',
-                'ward': ''
-            }
+            return self._match_address(input_address, deadline, trace)
         finally:
-            signal.setitimer(signal.ITIMER_REAL, 0)
-
-    def match_address(self, input_address: str) -> Dict[str, str]:
-        """Match address components with caching"""
-        if input_address in self.cache:
-            return self.cache[input_address]
+            instrumentation.finish(trace, input_address)
+
+    def _match_address(self, input_address: str, deadline: Optional[Deadline], trace: Optional[Trace]):
+        input_address = self.canonical_address(input_address)
+        if trace is not None:
+            trace.lap('clean')
+        cached = self.cache.get(input_address)
+        if trace is not None:
+            trace.lap('cache')
+        if cached is not None:
+            return dict(cached)
 
         result = {
             'province': '',
@@ -333,72 +1638,265 @@ class AddressMatcher:
             'ward': ''
         }
 
-        input_address = self.clean_address(input_address)
-        words = input_address.split()
-
-        # Find province
-        province = None
-        for i in range(len(words)):
-            new_string = ' '.join(words[-(i + 1):])
-            if len(new_string) <= 9:
-                new_string = self.abbreviations.get(new_string, new_string)
-
-            province_match = self.find_best_match_v3(new_string, 'province', None)
-            if province_match:
-                result['province'] = province_match
-                words = words[:len(words) - (i + 1)]
-                province = next((p for p in self.provinces.values() if p.name == province_match), None)
-                break
-
-        # Find district
-        district = None
-        for i in range(len(words)):
-            new_string = ' '.join(words[-(i + 1):])
-            district_match = self.find_best_match_v3(new_string, 'district',
-                                                    province.districts if province else None)
-            if district_match:
-                result['district'] = district_match
-                words = words[:len(words) - (i + 1)]
-                district = next((d for d in (province.districts.values() if province else [])
-                                 if d.name == district_match), None)
-                break
-
-        # Find ward
-        for i in range(len(words)):
-            new_string = ' '.join(words[-(i + 1):])
-            ward_match = self.find_best_match_v3(new_string, 'ward',
-                                                district.wards if district else None)
-            if ward_match:
-                result['ward'] = ward_match
-                break
+        try:
+            self._match_levels(input_address.split(), result, deadline, trace)
+        except DeadlineExceeded:
+            if trace is not None:
+                trace.lap('decode')
+                trace.count('timeouts')
+            result['partial'] = True
+            return result
+        if trace is not None:
+            trace.lap('decode')
 
-        self.cache[input_address] = result
+        self.cache.put(input_address, dict(result))
         return result
 
-    def load_own_file(self, xa_file: str, huyen_file: str, tinh_file: str):
-        """Load hierarchical address data"""
+    def _match_levels(self, words: List[str], result: Dict[str, str], deadline: Optional[Deadline],
+                      trace: Optional[Trace] = None):
+        """Fill ``result`` with the best consistent (province, district, ward) assignment
+
+        Tokens are normalized once. If the deadline expires, ``result`` keeps the
+        best assignment scored so far, complete or not: each level's candidate
+        is recorded as soon as it is scored, before the levels inside it are
+        decoded.
+        """
+        tokens = [self.normalize(word) for word in words]
+        _, best = self._decode(words, tokens, len(tokens), 0, None, deadline, {}, trace, [float('-inf'), result])
+        result.update(dict.fromkeys(self.LEVELS, ''))
+        result.update(best)
+
+    def _record(self, progress: list, score: float, assignment: tuple):
+        """Keep ``assignment`` in the progress result if it beats the best scored so far"""
+        if score > progress[0]:
+            progress[0] = score
+            result = progress[1]
+            result.update(dict.fromkeys(self.LEVELS, ''))
+            result.update(assignment)
+
+    def _decode(self, words: List[str], tokens: List[str], end: int, depth: int, scope,
+                deadline: Optional[Deadline], memo: dict, trace: Optional[Trace] = None,
+                progress: Optional[list] = None, prefix: tuple = (), prefix_score: float = 0.0) -> tuple:
+        """Best (score, ((level, name), ...)) for LEVELS[depth:] over ``tokens[:end]``
+
+        Dynamic programming over token positions: each level takes a span
+        ending at ``end`` and the next level decodes what precedes it, scoped
+        to the entity just matched. Sub-problems are memoized on (end, depth,
+        scope). A matched span scores 1 minus its relative edit distance, so
+        assignments that resolve more levels win. A level with no candidate
+        span is skipped and the next level is searched unscoped, as before.
+        ``progress`` is [best score, result dict]; the assignments ``prefix``
+        (scored ``prefix_score``, the levels decoded outside this call) can be
+        extended with are recorded in it as they are scored.
+        With a ``trace``, span searches are timed per level apart from the rest
+        of the decoding.
+        """
+        if depth == len(self.LEVELS) or end == 0:
+            return 0.0, ()
+        key = (end, depth, scope)
+        if key in memo:
+            return memo[key]
+
+        level = self.LEVELS[depth]
+        if trace is None:
+            candidates = self.span_candidates(words, tokens, end, level, scope, deadline)
+        else:
+            trace.lap('decode')
+            candidates = self.span_candidates(words, tokens, end, level, scope, deadline, trace)
+            trace.lap(level if scope is None else f'{level}_scoped')
+        if not candidates:
+            best = self._decode(words, tokens, end, depth + 1, None, deadline, memo, trace,
+                                progress, prefix, prefix_score)
+        else:
+            best = None
+            for start, name, score in candidates:
+                if level == 'province':
+                    child = self.provinces_by_name.get(name)
+                elif level == 'district' and scope is not None:
+                    child = self.districts_by_name.get((scope.id, name))
+                else:
+                    child = None
+                assignment = prefix + ((level, name),)
+                if progress is not None:
+                    self._record(progress, prefix_score + score, assignment)
+                rest_score, rest = self._decode(words, tokens, start, depth + 1, child, deadline, memo, trace,
+                                                progress, assignment, prefix_score + score)
+                if best is None or score + rest_score > best[0]:
+                    best = (score + rest_score, ((level, name),) + rest)
+                    if progress is not None:
+                        self._record(progress, prefix_score + best[0], prefix + best[1])
+
+        memo[key] = best
+        return best
+
+    def span_candidates(self, words: List[str], tokens: List[str], end: int, level: str, scope,
+                        deadline: Optional[Deadline] = None, trace: Optional[Trace] = None) -> List[tuple]:
+        """(start, name, score) for spans ``tokens[start:end]`` that match ``level``
+
+        Spans grow leftwards, shortest first, and stop once they are longer
+        than the longest name in the index plus the edit bound. Exact matches
+        on any span are returned alone. Otherwise every span is fuzzy-matched,
+        except in the large unscoped district and ward indexes where the
+        shortest hit is kept, as the suffix scan used to. Fuzzy hits that do
+        not score above 0 are dropped, so a level can only gain from a match
+        and a junk token leaves it unresolved. Fuzzy candidates come
+        from the token index first; the full fuzzy index is only walked for
+        spans that share no intact token with a name.
+        """
+        names, index = self.level_indexes(level, scope)
+        parent_id = scope.id if scope is not None else None
+        max_length = index.max_length + 2
+
+        matches, spans = [], []
+        span = ''
+        for start in range(end - 1, -1, -1):
+            span = tokens[start] if start == end - 1 else f'{tokens[start]} {span}'
+            if len(span) > max_length:
+                break
+            query = span
+            if level == 'province':
+                raw = ' '.join(words[start:end])
+                if len(raw) <= 9 and raw in self.abbreviations:
+                    query = self.normalize(self.abbreviations[raw])
+            if not query.strip():
+                continue
+            exact = names.get(query) if names is not None else index.search(query)
+            if exact is not None:
+                matches.append((start, exact, 1.0))
+            spans.append((start, query))
+        if trace is not None:
+            trace.count('spans_probed', level, len(spans))
+        if matches:
+            return matches
+
+        shortest_only = names is None and level != 'province'
+        stats = {} if trace is not None else None
+        for start, query in spans:
+            if deadline is not None:
+                deadline.check()
+            if trace is not None:
+                trace.count('fuzzy_searches', level)
+            found = self.token_indexes[level].search_similar(query, max_distance=2, limit=1, parent_id=parent_id)
+            if not found:
+                if trace is not None:
+                    trace.count('fuzzy_fallbacks', level)
+                found = index.search_similar(query, max_distance=2, limit=1, deadline=deadline, stats=stats)
+                if stats:
+                    trace.count('nodes_visited', level, stats.pop('visited', 0))
+            if found:
+                name, distance = found[0]
+                score = 1.0 - 2 * distance / len(query)
+                if score > 0:  # else half the span is edited: a short token, not a name
+                    matches.append((start, name, score))
+                if shortest_only:
+                    break
+        return matches
+
+    def load_own_file(self, xa_file: str, huyen_file: str, tinh_file: str, lazy_wards: bool = False,
+                      previous: Optional['AddressMatcher'] = None, token_levels: Iterable[str] = LEVELS):
+        """Load hierarchical address data
+
+        With ``lazy_wards`` ward rows are only grouped by district here;
+        load_wards turns them into Wards and indexes on first use. Scoped
+        indexes of ``previous`` are reused where a parent's names are
+        unchanged. Scoped token postings are only added for ``token_levels``.
+        """
         # Load provinces
         with open(tinh_file, 'r', encoding='utf-8') as file:
             for line in file:
                 id, name, code = line.strip().split(';')
-                self.provinces[id] = Province(id, name, code)
+                province = Province(id, name, code)
+                self.provinces[id] = province
+                # First entry wins on duplicate names, as a linear scan would
+                self.provinces_by_name.setdefault(name, province)
 
         # Load districts
         with open(huyen_file, 'r', encoding='utf-8') as file:
             for line in file:
                 id, name, code, province_id = line.strip().split(';')
-                if province_id in self.provinces:
-                    self.provinces[province_id].districts[id] = District(id, name, code, province_id)
+                province = self.provinces.get(province_id)
+                if province is not None:
+                    district = District(id, name, code, province_id)
+                    district.province = province
+                    province.districts[id] = district
+                    self.districts_by_id[id] = district
+                    self.districts_by_name.setdefault((province_id, name), district)
 
         # Load wards
         with open(xa_file, 'r', encoding='utf-8') as file:
             for line in file:
                 id, name, code, district_id = line.strip().split(';')
-                ward = Ward(id, name, code, district_id)
-                for province in self.provinces.values():
-                    if district_id in province.districts:
-                        province.districts[district_id].wards[id] = ward
-                        break
+                district = self.districts_by_id.get(district_id)
+                if district is not None and lazy_wards:
+                    self.pending_wards.setdefault(district_id, []).append((id, name, code))
+                elif district is not None:
+                    ward = Ward(id, name, code, district_id)
+                    ward.district = district
+                    district.wards[id] = ward
+
+        # Precompute scoped indexes so lookups at query time are dict hits
+        old_provinces = previous.provinces if previous is not None else {}
+        old_districts = previous.districts_by_id if previous is not None else {}
+        for province in self.provinces.values():
+            old = old_provinces.get(province.id)
+            scope = self.build_scope_index(province.districts.values(),
+                                           (old.district_names, old.district_index) if old is not None else None)
+            province.district_names, province.district_index = scope
+            if old is not None and scope[1] is old.district_index:
+                self.reused['district_scopes'] += 1
+            if 'district' in token_levels:
+                for norm_name, name in province.district_names.items():
+                    self.token_indexes['district'].insert(norm_name, name, province.id)
+            if not lazy_wards:
+                for district in province.districts.values():
+                    self._build_ward_scope(district, old_districts.get(district.id), 'ward' in token_levels)
+
+    def _build_ward_scope(self, district: District, previous: Optional[District] = None, tokens: bool = True):
+        names, index = self.build_scope_index(district.wards.values(),
+                                              (previous.ward_names, previous.ward_index) if previous else None)
+        if previous is not None and index is previous.ward_index:
+            self.reused['ward_scopes'] += 1
+        if tokens:
+            for norm_name, name in names.items():
+                self.token_indexes['ward'].insert(norm_name, name, district.id)
+        if isinstance(index, CompactTrie):
+            index.compile()
+        # Published last: readers take a non-None ward_index to mean the district is ready
+        district.ward_names = names
+        district.ward_index = index
+
+
+# Matcher held by each match_many pool worker, set once by the pool initializer
+_pool_matcher = None
+
+
+def _pool_context():
+    # Forked workers inherit the parent's matcher without pickling it
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('fork' if 'fork' in methods else None)
+
+
+def _shared_pool(matcher: AddressMatcher, workers: int, executor: bool = False):
+    """Forked pool of ``workers`` processes holding ``matcher``, a ProcessPoolExecutor if ``executor``
+
+    The matcher is shared first: lazily loaded wards are built once here rather
+    than in every worker, and the compiled indexes move into one read-only
+    mapping all workers share.
+    """
+    matcher.share()
+    if executor:
+        return ProcessPoolExecutor(workers, mp_context=_pool_context(), initializer=_init_pool_worker,
+                                   initargs=(matcher,))
+    return _pool_context().Pool(workers, initializer=_init_pool_worker, initargs=(matcher,))
+
+
+def _init_pool_worker(matcher: AddressMatcher):
+    global _pool_matcher
+    _pool_matcher = matcher
+
+
+def _process_chunk(chunk: List[str]) -> List[Dict[str, str]]:
+    return [_pool_matcher.process(address) for address in chunk]
 
 
 def load_test_cases(filename):
@@ -0,0 +1,84 @@
+"""Benchmark: materialized spelling variations against query-time edit lookup.
+
+Builds one level's Solution trie from the first --rows rows of its data file
+both ways: with every edit-1 variation inserted (Trie()) and with only the
+canonical variations, matched with a one-edit trie walk (Trie(edit_lookup=True)).
+Reports build time, memory held by the trie (tracemalloc), node count and the
+search_phrase latency over the addresses of --data, and checks that both return
+the same matches.
+
+Run from the repository root:
+
+    python -m benchmarks.edit_lookup [--level districts] [--rows 200] [--data public.json]
+"""
+import argparse
+import csv
+import gc
+import json
+import time
+import tracemalloc
+
+from main import Trie
+
+LEVELS = {
+    'provinces': ('Provinces.txt', ('Code', 'FullName')),
+    'districts': ('Districts.txt', ('Code', 'FullName', 'ProvinceCode')),
+    'wards': ('Wards.txt', ('Code', 'FullName', 'DistrictCode')),
+}
+
+
+def measure(rows: list, phrases: list, edit_lookup: bool) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    trie = Trie(edit_lookup=edit_lookup)
+    trie.build(rows)
+    build = time.perf_counter() - start
+    trie.variation_cache.clear()  # build-time memo, not kept in snapshots
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    results, latencies = [], []
+    for phrase in phrases:
+        start = time.perf_counter()
+        results.append(trie.search_phrase(phrase))
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        'build_s': build,
+        'memory_mib': memory / 2**20,
+        'nodes': trie.node_count(),
+        'mean_ms': 1000 * sum(latencies) / len(latencies),
+        'p50_ms': 1000 * latencies[len(latencies) // 2],
+        'p99_ms': 1000 * latencies[int(0.99 * (len(latencies) - 1))],
+    }, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Materialized variations against query-time edit lookup')
+    parser.add_argument('--level', default='districts', choices=sorted(LEVELS))
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--data', default='public.json')
+    args = parser.parse_args()
+
+    path, fields = LEVELS[args.level]
+    with open(path, encoding='utf-8') as f:
+        rows = [{field: row[field] for field in fields} for row in csv.DictReader(f, delimiter=';')][:args.rows]
+    with open(args.data, encoding='utf-8') as f:
+        phrases = [case['text'] for case in json.load(f)]
+
+    print(f"{args.level}, {len(rows)} rows, {len(phrases)} phrases")
+    # The small trie first: freeing the materialized one takes seconds
+    for name, edit_lookup in (('edit-lookup', True), ('materialized', False)):
+        report, results = measure(rows, phrases, edit_lookup)
+        print(f"{name:<13} build {report['build_s']:6.2f}s  memory {report['memory_mib']:8.1f} MiB  "
+              f"nodes {report['nodes']:9d}  search_phrase mean {report['mean_ms']:.3f}ms "
+              f"p50 {report['p50_ms']:.3f}ms p99 {report['p99_ms']:.3f}ms")
+        if not edit_lookup:
+            print('same matches' if results == expected else 'MATCHES DIFFER')
+        expected = results
+
+
+if __name__ == '__main__':
+    main()
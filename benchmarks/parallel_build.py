@@ -0,0 +1,76 @@
+"""Benchmark: Solution trie build time against the number of worker processes.
+
+Builds one level's variation trie from the first --rows rows of its data file,
+in-process (Trie.build) and then sharded over pools of each --workers size, as
+Trie.build does with a pool. Each build is checked to hold the same number of
+nodes as the in-process one.
+
+Besides the wall time, the CPU time of the slowest shard task is reported: it
+is the time the build approaches when every worker has a core of its own, which
+the wall time only shows on a host with that many idle cores.
+
+Run from the repository root:
+
+    python -m benchmarks.parallel_build [--level districts] [--rows 200] [--workers 2 4 8]
+"""
+import argparse
+import csv
+import multiprocessing
+import time
+
+from main import Trie, _build_frozen_shard
+
+LEVELS = {
+    'provinces': ('Provinces.txt', ('Code', 'FullName')),
+    'districts': ('Districts.txt', ('Code', 'FullName', 'ProvinceCode')),
+    'wards': ('Wards.txt', ('Code', 'FullName', 'DistrictCode')),
+}
+
+
+def timed_shard(task) -> tuple:
+    start = time.process_time()
+    shard = _build_frozen_shard(task)
+    return time.process_time() - start, shard
+
+
+def parallel_build(rows: list, workers: int) -> tuple:
+    """(wall seconds, node count, slowest task CPU seconds); the pool start-up is included"""
+    start = time.perf_counter()
+    trie = Trie()
+    names = [data['FullName'] for data in rows]
+    with multiprocessing.Pool(workers) as pool:
+        trie.shard_map = trie.balance_shards(names, workers)
+        timed = pool.map(timed_shard, [(names, trie.shard_map, workers, shard) for shard in range(workers)])
+    trie.shards = [shard for _, shard in timed]
+    trie.rows = rows
+    return time.perf_counter() - start, trie.node_count(), max(seconds for seconds, _ in timed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Solution trie build time against worker count')
+    parser.add_argument('--level', default='districts', choices=sorted(LEVELS))
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4, 8])
+    args = parser.parse_args()
+
+    path, fields = LEVELS[args.level]
+    with open(path, encoding='utf-8') as f:
+        rows = [{field: row[field] for field in fields} for row in csv.DictReader(f, delimiter=';')][:args.rows]
+
+    start = time.perf_counter()
+    trie = Trie()
+    trie.build(rows)
+    serial, nodes = time.perf_counter() - start, trie.node_count()
+    del trie
+
+    print(f"{args.level}, {len(rows)} rows, {nodes} nodes, {multiprocessing.cpu_count()} cores")
+    print(f"workers  1: {serial:7.2f}s")
+    for workers in args.workers:
+        seconds, count, slowest = parallel_build(rows, workers)
+        status = 'ok' if count == nodes else f'MISMATCH ({count} nodes)'
+        print(f"workers {workers:2d}: {seconds:7.2f}s wall, slowest shard {slowest:5.2f}s "
+              f"(speedup {serial / seconds:4.2f}x wall, {serial / slowest:4.2f}x with a core per worker)  {status}")
+
+
+if __name__ == '__main__':
+    main()
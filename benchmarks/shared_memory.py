@@ -0,0 +1,100 @@
+"""Benchmark: total memory of forked workers with private and shared indexes.
+
+The parent builds a matcher and, with --shared, moves its compiled indexes
+into one read-only mapping. It then forks N workers that each match the whole
+dataset. Every process reports its proportional set size (PSS), where shared
+pages are split between the processes mapping them, so the sum is the real
+memory used. Linux only (reads /proc/self/smaps_rollup).
+
+Run from the repository root:
+
+    python -m benchmarks.shared_memory [--workers 1 2 4 8] [--data public.json]
+"""
+import argparse
+import json
+import os
+
+from address_matcher import AddressMatcher
+
+
+def memory_kib() -> dict:
+    """PSS and private (unshared) KiB of the current process"""
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                fields[name] = int(value.split()[0])
+    return {'pss': fields['Pss'], 'private': fields['Private_Clean'] + fields['Private_Dirty']}
+
+
+def run_workers(matcher: AddressMatcher, cases: list, workers: int) -> tuple:
+    """Fork ``workers`` processes that match every case; return the parent's memory and theirs
+
+    Workers stay alive until the parent has measured itself: PSS splits a
+    page between the processes mapping it at the time, so every process must
+    be measured while the others still map their shared pages.
+    """
+    readers = []
+    release_read, release_write = os.pipe()
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        if os.fork() == 0:
+            os.close(read_fd)
+            os.close(release_write)
+            for case in cases:
+                matcher.match_address(case)
+            with os.fdopen(write_fd, 'w') as f:
+                json.dump(memory_kib(), f)
+            os.read(release_read, 1)
+            os._exit(0)
+        os.close(write_fd)
+        readers.append(read_fd)
+    usage = []
+    for read_fd in readers:
+        with os.fdopen(read_fd) as f:
+            usage.append(json.load(f))
+    parent = memory_kib()
+    os.close(release_read)
+    os.close(release_write)
+    for _ in readers:
+        os.wait()
+    return parent, usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Total PSS of forked matcher workers')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--data', default='public.json')
+    parser.add_argument('--fuzzy-index', default='trie', choices=sorted(AddressMatcher.FUZZY_INDEXES))
+    args = parser.parse_args()
+
+    with open(args.data, encoding='utf-8') as f:
+        cases = [case['text'] for case in json.load(f)]
+
+    for shared in (False, True):
+        # Each mode builds its matcher in a fresh fork, so the other mode's objects are not counted
+        pid = os.fork()
+        if pid == 0:
+            measure(args, cases, shared)
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+
+def measure(args, cases: list, shared: bool):
+    matcher = AddressMatcher('list_ward.txt', 'list_district.txt', 'list_province.txt', fuzzy_index=args.fuzzy_index)
+    matcher.load_all_wards()
+    if shared:
+        block = matcher.share()
+        print(f"shared block: {block.size / 2**20:.1f} MiB, {block.indexes} indexes")
+    matcher.cache.clear()
+    for workers in args.workers:
+        parent, usage = run_workers(matcher, cases, workers)
+        total = parent['pss'] + sum(worker['pss'] for worker in usage)
+        private = sum(worker['private'] for worker in usage) / workers
+        print(f"{'shared' if shared else 'private':<8} workers {workers:2d}: total PSS {total / 1024:7.1f} MiB, "
+              f"private per worker {private / 1024:6.1f} MiB", flush=True)
+
+
+if __name__ == '__main__':
+    main()
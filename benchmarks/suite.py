@@ -0,0 +1,229 @@
+"""Latency, throughput and accuracy benchmark with a regression gate.
+
+Each engine runs in its own interpreter (fixed PYTHONHASHSEED) so cold start
+and peak RSS are measured from a clean process. Every engine makes a cold-cache
+pass over the dataset and then a warm-cache pass. The report is written as
+JSON and compared with a stored baseline. The run fails if latency or accuracy
+regresses beyond the tolerances.
+
+Run from the repository root:
+
+    python -m benchmarks.suite                      # compare with benchmarks/baseline.json
+    python -m benchmarks.suite --update-baseline    # accept the current numbers
+    python -m benchmarks.suite --engines matcher solution --data public.json
+
+Latency numbers depend on the host. Regenerate the baseline on the machine
+that runs the gate.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+LEVELS = ('province', 'district', 'ward')
+ENGINES = ('matcher', 'matcher-deletion', 'matcher-bucket', 'matcher-bucket-numpy', 'solution')
+DEFAULT_ENGINES = ('matcher', 'matcher-deletion')
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def build_engine(name: str):
+    """Construct an engine and return it with its per-address callable and cache reset"""
+    if name.startswith('matcher'):
+        from address_matcher import AddressMatcher
+
+        fuzzy_index = name.partition('-')[2] or 'trie'
+        engine = AddressMatcher('list_ward.txt', 'list_district.txt', 'list_province.txt', fuzzy_index=fuzzy_index)
+        return engine, engine.process, engine.cache.clear
+    if name == 'solution':
+        from main import Solution
+
+        engine = Solution()
+        return engine, engine.process, lambda: None
+    raise ValueError(f'unknown engine {name!r}')
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run_pass(process, cases: list) -> dict:
+    latencies = []
+    correct = dict.fromkeys(LEVELS, 0)
+    errors = 0
+    start = time.perf_counter()
+    for case in cases:
+        begin = time.perf_counter_ns()
+        try:
+            result = process(case['text'])
+        except Exception:
+            errors += 1
+            result = {}
+        latencies.append((time.perf_counter_ns() - begin) / 1e6)
+        for level in LEVELS:
+            correct[level] += int(result.get(level) == case['result'][level])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    count = len(cases)
+    return {
+        'count': count,
+        'errors': errors,
+        'throughput_per_s': count / elapsed if elapsed else 0.0,
+        'latency_ms': {
+            'mean': sum(latencies) / count if count else 0.0,
+            'p50': percentile(latencies, 0.50),
+            'p90': percentile(latencies, 0.90),
+            'p99': percentile(latencies, 0.99),
+            'max': latencies[-1] if latencies else 0.0,
+        },
+        'accuracy': {
+            **{level: correct[level] / count if count else 0.0 for level in LEVELS},
+            'overall': sum(correct.values()) / (3 * count) if count else 0.0,
+        },
+    }
+
+
+def run_engine(name: str, data: str) -> dict:
+    """Measure one engine in the current process (called in a fresh child)"""
+    with open(data, encoding='utf-8') as f:
+        cases = json.load(f)
+
+    start = time.perf_counter()
+    engine, process, clear_cache = build_engine(name)
+    cold_start = time.perf_counter() - start
+
+    clear_cache()
+    cold = run_pass(process, cases)
+    warm = run_pass(process, cases)
+
+    return {
+        'cold_start_s': cold_start,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'cold_cache': cold,
+        'warm_cache': warm,
+    }
+
+
+def run_in_child(name: str, data: str) -> dict:
+    env = dict(os.environ, PYTHONHASHSEED='0')
+    completed = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.suite', '--child', name, '--data', data],
+        capture_output=True, text=True, env=env,
+    )
+    if completed.returncode != 0:
+        return {'error': completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'failed'}
+    # Engines may print while loading; the report is the last line
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def compare(report: dict, baseline: dict, latency_tolerance: float, accuracy_tolerance: float,
+            latency_slack_ms: float) -> list:
+    """Return human-readable regressions of ``report`` against ``baseline``
+
+    Latency must exceed the baseline by the relative tolerance plus an absolute
+    slack, so sub-millisecond timer noise on cached lookups does not fail runs.
+    """
+    regressions = []
+    for name, expected in baseline.get('engines', {}).items():
+        actual = report['engines'].get(name)
+        if actual is None:
+            continue
+        if 'error' in actual:
+            if 'error' not in expected:
+                regressions.append(f"{name}: failed to run ({actual['error']})")
+            continue
+        if 'error' in expected:
+            continue
+
+        for phase in ('cold_cache', 'warm_cache'):
+            for stat in ('p50', 'p99'):
+                was = expected[phase]['latency_ms'][stat]
+                now = actual[phase]['latency_ms'][stat]
+                if now > was * (1 + latency_tolerance) + latency_slack_ms:
+                    regressions.append(f"{name} {phase} {stat} latency {now:.3f}ms > baseline {was:.3f}ms")
+            for level, was in expected[phase]['accuracy'].items():
+                now = actual[phase]['accuracy'][level]
+                if now < was - accuracy_tolerance:
+                    regressions.append(f"{name} {phase} {level} accuracy {now:.4f} < baseline {was:.4f}")
+
+        was, now = expected['cold_start_s'], actual['cold_start_s']
+        if now > was * (1 + latency_tolerance) + latency_slack_ms / 1000:
+            regressions.append(f"{name} cold start {now:.3f}s > baseline {was:.3f}s")
+    return regressions
+
+
+def print_report(report: dict):
+    for name, result in report['engines'].items():
+        if 'error' in result:
+            print(f"{name:<18} ERROR {result['error']}")
+            continue
+        print(f"{name:<18} cold start {result['cold_start_s']:.3f}s, peak RSS {result['peak_rss_mb']:.1f} MiB")
+        for phase in ('cold_cache', 'warm_cache'):
+            stats = result[phase]
+            latency = stats['latency_ms']
+            accuracy = stats['accuracy']
+            print(f"  {phase:<11} p50 {latency['p50']:7.3f}ms  p90 {latency['p90']:7.3f}ms  "
+                  f"p99 {latency['p99']:7.3f}ms  max {latency['max']:7.3f}ms  "
+                  f"{stats['throughput_per_s']:8.1f}/s  accuracy "
+                  + ' '.join(f"{level} {accuracy[level]:.3f}" for level in (*LEVELS, 'overall')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the address engines against a stored baseline')
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(DEFAULT_ENGINES))
+    parser.add_argument('--data', default='public.json')
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--latency-tolerance', type=float, default=0.25,
+                        help='allowed relative latency/cold-start increase (default 0.25)')
+    parser.add_argument('--latency-slack-ms', type=float, default=0.1,
+                        help='absolute latency increase always allowed on top of the tolerance (default 0.1)')
+    parser.add_argument('--accuracy-tolerance', type=float, default=0.002,
+                        help='allowed absolute accuracy drop per level (default 0.002)')
+    parser.add_argument('--child', choices=ENGINES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_engine(args.child, args.data)))
+        return
+
+    report = {
+        'data': args.data,
+        'created': time.time(),
+        'host': {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'engines': {name: run_in_child(name, args.data) for name in args.engines},
+    }
+    print_report(report)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.latency_tolerance, args.accuracy_tolerance,
+                          args.latency_slack_ms)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print('No regressions against baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Microbenchmark: Trie.search_similar against the original recursive search.
+
+The array-backed CompactTrie, a DeletionIndex and the length-bucket indexes
+(scalar bit-parallel and, when numpy is installed, vectorized) built over the
+same names are timed alongside.
+
+Run from the repository root:
+
+    python -m benchmarks.trie_search [--queries 300] [--seed 7]
+"""
+import argparse
+import random
+import time
+
+from address_matcher import HAS_NUMPY, AddressMatcher, BucketIndex, CompactTrie, DeletionIndex, Trie
+
+
+def legacy_search_similar(trie: Trie, word: str, max_distance: int = 2) -> list:
+    """The recursive search Trie.search_similar replaced, kept for comparison"""
+    def _search_recursive(node, prefix, remaining_word, distance):
+        results = set()
+
+        if not remaining_word and node.is_end and distance <= max_distance:
+            results.add((node.word, distance))
+
+        if distance > max_distance:
+            return results
+
+        if remaining_word:
+            char = remaining_word[0]
+            rest = remaining_word[1:]
+
+            if char in node.children:
+                results.update(_search_recursive(node.children[char], prefix + char, rest, distance))
+
+            results.update(_search_recursive(node, prefix, rest, distance + 1))
+
+            for c in node.children:
+                if c != char:
+                    results.update(_search_recursive(node.children[c], prefix + c, rest, distance + 1))
+
+        for c in node.children:
+            results.update(_search_recursive(node.children[c], prefix + c, remaining_word, distance + 1))
+
+        return results
+
+    return sorted(_search_recursive(trie.root, "", word, 0), key=lambda x: x[1])
+
+
+def make_queries(names: list, count: int, seed: int) -> list:
+    """Sample names and apply 0-3 random edits, plus a few over-long spans"""
+    rnd = random.Random(seed)
+    alphabet = 'abcdeghiklmnopqrstuvxy '
+    queries = []
+    for _ in range(count):
+        word = list(rnd.choice(names))
+        for _ in range(rnd.randint(0, 3)):
+            i = rnd.randrange(len(word) + 1)
+            op = rnd.random()
+            if op < 0.33 and i < len(word):
+                del word[i]
+            elif op < 0.66:
+                word.insert(i, rnd.choice(alphabet))
+            elif i < len(word):
+                word[i] = rnd.choice(alphabet)
+        queries.append(''.join(word))
+    # Long suffix spans like the ones match_address probes on noisy input
+    for _ in range(count // 10):
+        queries.append(' '.join(rnd.sample(names, 2)))
+    return queries
+
+
+def time_search(search, queries: list) -> list:
+    timings = []
+    for query in queries:
+        start = time.perf_counter_ns()
+        search(query)
+        timings.append(time.perf_counter_ns() - start)
+    return timings
+
+
+def summarize(label: str, timings: list):
+    timings = sorted(timings)
+    total = sum(timings)
+    p50 = timings[len(timings) // 2]
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{label:<10} total {total / 1e9:8.3f}s  "
+          f"p50 {p50 / 1e6:8.3f}ms  p99 {p99 / 1e6:8.3f}ms  max {timings[-1] / 1e6:8.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--max-distance', type=int, default=2)
+    parser.add_argument('--limit', type=int, default=1, help='top-k passed to search_similar')
+    args = parser.parse_args()
+
+    matcher = AddressMatcher('list_ward.txt', 'list_district.txt', 'list_province.txt')
+    names = sorted({matcher.normalize(name) for name in matcher.data['ward']})
+    trie = Trie()
+    for name in names:
+        trie.insert(name, name)
+    compact = CompactTrie.from_trie(trie)
+    deletion_index = DeletionIndex(args.max_distance)
+    bucket_index = BucketIndex()
+    vectorized_index = BucketIndex(vectorized=True) if HAS_NUMPY else None
+    for name in names:
+        deletion_index.insert(name, name)
+        bucket_index.insert(name, name)
+        if vectorized_index is not None:
+            vectorized_index.insert(name, name)
+
+    queries = make_queries(names, args.queries, args.seed)
+    print(f"{len(names)} ward names, {len(queries)} queries, max_distance={args.max_distance}")
+
+    legacy = time_search(lambda q: legacy_search_similar(trie, q, args.max_distance), queries)
+    current = time_search(lambda q: trie.search_similar(q, args.max_distance, args.limit), queries)
+    compact_timings = time_search(lambda q: compact.search_similar(q, args.max_distance, args.limit), queries)
+
+    deletion = time_search(lambda q: deletion_index.search_similar(q, args.max_distance, args.limit), queries)
+    bucket = time_search(lambda q: bucket_index.search_similar(q, args.max_distance, args.limit), queries)
+    if vectorized_index is not None:
+        vectorized_index.search_similar(queries[0], args.max_distance)  # pack the lanes outside the timing
+        vectorized = time_search(lambda q: vectorized_index.search_similar(q, args.max_distance, args.limit),
+                                 queries)
+
+    summarize('legacy', legacy)
+    summarize('current', current)
+    summarize('compact', compact_timings)
+    summarize('deletion', deletion)
+    summarize('bucket', bucket)
+    if vectorized_index is not None:
+        summarize('numpy', vectorized)
+    print(f"speedup    {sum(legacy) / max(sum(current), 1):.1f}x trie, "
+          f"{sum(legacy) / max(sum(deletion), 1):.1f}x deletion index")
+    print(f"memory     trie {trie.memory_usage() / 2**20:.1f} MiB, "
+          f"compact trie {compact.memory_usage() / 2**20:.2f} MiB ({compact.node_count} nodes), "
+          f"deletion index {deletion_index.memory_usage() / 2**20:.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""Stream addresses from JSONL or CSV through the matcher with bounded memory.
+
+Records are read lazily, classified in fixed-size chunks and written as
+soon as each chunk completes, so memory depends on ``--chunk-size`` and
+``--workers`` and not on the input size. Output order matches input order.
+
+    python classify.py addresses.jsonl -o results.jsonl --workers 4
+    zcat dump.csv.gz | python classify.py - --format csv --field address > results.csv
+
+JSONL input lines are either JSON strings or objects holding the address in
+``--field`` (default ``text``, as in public.json). Each object is written back
+with the prediction stored under ``--result-field``. CSV rows keep their columns
+and gain ``province``, ``district`` and ``ward``. Progress goes to stderr.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from collections import deque
+from itertools import islice
+from typing import Dict, Iterable, Iterator, Tuple
+
+from address_matcher import AddressMatcher, _process_chunk, _shared_pool
+
+LEVELS = ('province', 'district', 'ward')
+
+
+def read_jsonl(stream, field: str) -> Iterator[Tuple[dict, str]]:
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if isinstance(record, str):
+            record = {field: record}
+        elif not isinstance(record, dict) or not isinstance(record.get(field), str):
+            raise ValueError(f'line {line_number}: expected a string or an object with a "{field}" string')
+        yield record, record[field]
+
+
+def read_csv(stream, field: str) -> Iterator[Tuple[dict, str]]:
+    reader = csv.DictReader(stream)
+    if reader.fieldnames is None or field not in reader.fieldnames:
+        raise ValueError(f'CSV header {reader.fieldnames} has no "{field}" column')
+    for row in reader:
+        yield row, row[field] or ''
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def classify_stream(matcher: AddressMatcher, records: Iterable[Tuple[dict, str]], workers: int = 1,
+                    chunk_size: int = 256) -> Iterator[Tuple[dict, Dict[str, str]]]:
+    """Yield (record, result) in input order, holding a bounded number of chunks
+
+    ``Pool.imap`` would drain the whole input into its task queue, so chunks
+    are submitted through a window of two per worker instead.
+    """
+    chunks = chunked(records, chunk_size)
+    if workers <= 1:
+        for chunk in chunks:
+            for record, address in chunk:
+                yield record, matcher.process(address)
+        return
+
+    with _shared_pool(matcher, workers) as pool:
+        window = deque()
+        for chunk in chunks:
+            window.append((chunk, pool.apply_async(_process_chunk, ([address for _, address in chunk],))))
+            if len(window) >= 2 * workers:
+                yield from _drain(window.popleft())
+        while window:
+            yield from _drain(window.popleft())
+
+
+def _drain(submitted) -> Iterator[Tuple[dict, Dict[str, str]]]:
+    chunk, pending = submitted
+    for (record, _), result in zip(chunk, pending.get()):
+        yield record, result
+
+
+class JsonlWriter:
+    __slots__ = ['stream', 'result_field']
+
+    def __init__(self, stream, result_field: str):
+        self.stream = stream
+        self.result_field = result_field
+
+    def write(self, record: dict, result: Dict[str, str]):
+        self.stream.write(json.dumps({**record, self.result_field: result}, ensure_ascii=False))
+        self.stream.write('\n')
+
+
+class CsvWriter:
+    __slots__ = ['stream', 'writer']
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.writer = None
+
+    def write(self, record: dict, result: Dict[str, str]):
+        if self.writer is None:
+            fieldnames = list(record) + [level for level in LEVELS if level not in record]
+            self.writer = csv.DictWriter(self.stream, fieldnames=fieldnames, extrasaction='ignore')
+            self.writer.writeheader()
+        row = {key: value if isinstance(value, str) or value is None else json.dumps(value, ensure_ascii=False)
+               for key, value in record.items()}
+        self.writer.writerow({**row, **{level: result.get(level, '') for level in LEVELS}})
+
+
+class Progress:
+    __slots__ = ['stream', 'interval', 'started', 'last_report', 'count']
+
+    def __init__(self, stream, interval: float = 5.0):
+        self.stream = stream
+        self.interval = interval
+        self.started = self.last_report = time.monotonic()
+        self.count = 0
+
+    def update(self):
+        self.count += 1
+        if self.interval and self.count % 1024 == 0:
+            now = time.monotonic()
+            if now - self.last_report >= self.interval:
+                self.last_report = now
+                self.report('progress')
+
+    def report(self, label: str):
+        elapsed = time.monotonic() - self.started
+        rate = self.count / elapsed if elapsed else 0.0
+        print(f"{label}: {self.count} rows in {elapsed:.1f}s ({rate:.0f} rows/s)", file=self.stream, flush=True)
+
+
+def detect_format(path: str) -> str:
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Classify a JSONL/CSV stream of addresses')
+    parser.add_argument('input', nargs='?', default='-', help='input file, or - for stdin (default)')
+    parser.add_argument('-o', '--output', default='-', help='output file, or - for stdout (default)')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help='input format; guessed from the extension')
+    parser.add_argument('--output-format', choices=['jsonl', 'csv'], help='defaults to the input format')
+    parser.add_argument('--field', default='text', help='field/column holding the address')
+    parser.add_argument('--result-field', default='result', help='JSONL key the prediction is stored under')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--progress-interval', type=float, default=5.0, help='seconds between reports; 0 disables')
+    parser.add_argument('--ward-file', default='list_ward.txt')
+    parser.add_argument('--district-file', default='list_district.txt')
+    parser.add_argument('--province-file', default='list_province.txt')
+    parser.add_argument('--fuzzy-index', default='trie', choices=sorted(AddressMatcher.FUZZY_INDEXES))
+    args = parser.parse_args()
+
+    input_format = args.format or detect_format(args.input)
+    output_format = args.output_format or input_format
+    matcher = AddressMatcher.load(args.ward_file, args.district_file, args.province_file,
+                                  fuzzy_index=args.fuzzy_index)
+
+    source = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8', newline='')
+    sink = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8', newline='')
+    try:
+        reader = read_csv if input_format == 'csv' else read_jsonl
+        writer = CsvWriter(sink) if output_format == 'csv' else JsonlWriter(sink, args.result_field)
+        progress = Progress(sys.stderr, args.progress_interval)
+        for record, result in classify_stream(matcher, reader(source, args.field), args.workers, args.chunk_size):
+            writer.write(record, result)
+            progress.update()
+        progress.report('done')
+    except BrokenPipeError:
+        # Downstream (e.g. ``head``) stopped reading; exit quietly like other filters
+        sys.stdout = None
+    finally:
+        # Decided from the arguments: the BrokenPipeError handler has replaced sys.stdout
+        if args.input != '-':
+            source.close()
+        if args.output != '-':
+            sink.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Local, checksummed data bundle the Solution engine is built from.
+
+data_manifest.json records the bundle version and, for every file, its SHA-256
+and either the URL it is published at or, for files produced locally, the
+tracked file it is ``generated_from`` (its rows under the recorded ``header``).
+Provinces.txt is such a file: it is not taken from the upstream download.
+Engines only read local files: ``verify`` checks them against the manifest and
+raises BundleMismatch when one is missing or differs, so startup never waits on
+the network. Fetching is a separate, explicit command. Run from the repository
+root:
+
+    python data_bundle.py verify
+    python data_bundle.py download            # fetch published files, regenerate local ones; must match the manifest
+    python data_bundle.py download --accept   # same, recording new checksums as the next version
+    python data_bundle.py update              # record the checksums of the local files as the next version
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Dict, Iterable, Optional
+
+from snapshot import file_checksums
+
+MANIFEST_FILE = 'data_manifest.json'
+DOWNLOAD_TIMEOUT = 60
+
+
+class BundleMismatch(ValueError):
+    """A bundle file is missing or differs from the manifest"""
+
+
+def read_manifest(path: str = MANIFEST_FILE) -> dict:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise BundleMismatch(f'cannot read the data manifest {path}: {e}') from None
+
+
+def write_manifest(manifest: dict, path: str = MANIFEST_FILE):
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp_path, path)
+
+
+def bundle_path(name: str, manifest_path: str = MANIFEST_FILE) -> str:
+    """Bundle files live next to the manifest"""
+    return os.path.join(os.path.dirname(manifest_path), name)
+
+
+def verify(names: Optional[Iterable[str]] = None, manifest_path: str = MANIFEST_FILE) -> dict:
+    """Check the local files (``names``, default every file of the bundle) and return the manifest"""
+    manifest = read_manifest(manifest_path)
+    files = manifest['files']
+    for name in files if names is None else names:
+        if name not in files:
+            raise BundleMismatch(f'{name} is not part of data bundle version {manifest["version"]}')
+        path = bundle_path(name, manifest_path)
+        if not os.path.exists(path):
+            raise BundleMismatch(f'{path} is missing; run "python data_bundle.py download"')
+        if file_checksums([path])[path] != files[name]['sha256']:
+            raise BundleMismatch(f'{path} differs from data bundle version {manifest["version"]}')
+    return manifest
+
+
+def update(manifest_path: str = MANIFEST_FILE) -> dict:
+    """Record the checksums of the local files as the next bundle version"""
+    manifest = read_manifest(manifest_path)
+    checksums = file_checksums(bundle_path(name, manifest_path) for name in manifest['files'])
+    changed = False
+    for name, entry in manifest['files'].items():
+        sha256 = checksums[bundle_path(name, manifest_path)]
+        changed |= entry['sha256'] != sha256
+        entry['sha256'] = sha256
+    if changed:
+        manifest['version'] += 1
+        write_manifest(manifest, manifest_path)
+    return manifest
+
+
+def download(url: str, path: str, expected_sha256: Optional[str] = None):
+    """Fetch ``url`` into ``path``; the file is only replaced once the download is complete and checked"""
+    import requests
+
+    response = requests.get(url, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    tmp_path = f'{path}.download{os.getpid()}'
+    with open(tmp_path, 'wb') as f:
+        f.write(response.content)
+    try:
+        if expected_sha256 is not None and file_checksums([tmp_path])[tmp_path] != expected_sha256:
+            raise BundleMismatch(f'{url} does not match the manifest checksum of {path}')
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def generate(source: str, header: str, path: str, expected_sha256: Optional[str] = None):
+    """Write ``header`` and the rows of ``source`` to ``path``, replaced only once checked"""
+    with open(source, encoding='utf-8') as f:
+        rows = [line.rstrip('\r\n') for line in f if line.strip()]
+    tmp_path = f'{path}.generate{os.getpid()}'
+    with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(''.join(f'{line}\n' for line in [header, *rows]))
+    try:
+        if expected_sha256 is not None and file_checksums([tmp_path])[tmp_path] != expected_sha256:
+            raise BundleMismatch(f'{path} generated from {source} does not match the manifest checksum')
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def download_bundle(accept: bool = False, manifest_path: str = MANIFEST_FILE) -> Dict[str, str]:
+    """Fetch the published files of the bundle and regenerate the local ones
+
+    ``accept`` takes new contents as the next version.
+    """
+    manifest = read_manifest(manifest_path)
+    fetched = {}
+    for name, entry in manifest['files'].items():
+        path = bundle_path(name, manifest_path)
+        expected = None if accept else entry['sha256']
+        if entry.get('url'):
+            download(entry['url'], path, expected)
+        elif entry.get('generated_from'):
+            generate(bundle_path(entry['generated_from'], manifest_path), entry['header'], path, expected)
+        else:
+            continue
+        fetched[name] = path
+    if accept:
+        update(manifest_path)
+    return fetched
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify, fetch or re-version the local data bundle')
+    parser.add_argument('command', choices=['verify', 'download', 'update'])
+    parser.add_argument('--manifest', default=MANIFEST_FILE)
+    parser.add_argument('--accept', action='store_true',
+                        help='download: accept changed files and record them as the next version')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'download':
+            for name, path in download_bundle(args.accept, args.manifest).items():
+                print(f"Wrote {name} to {path}")
+        manifest = update(args.manifest) if args.command == 'update' else verify(manifest_path=args.manifest)
+    except (BundleMismatch, OSError) as e:
+        sys.exit(f"error: {e}")
+    print(f"Data bundle version {manifest['version']}: {len(manifest['files'])} files verified")
+
+
+if __name__ == '__main__':
+    main()
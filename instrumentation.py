@@ -0,0 +1,203 @@
+"""Opt-in per-stage timings and counters for the matchers.
+
+An engine holding an Instrumentation starts a Trace per address. The trace
+records how long each stage took with ``lap`` and counts work with
+``count``. When the address is done ``finish`` merges the trace into
+process-wide counters and per-stage latency histograms. Traces slower than
+``slow_threshold`` are also kept, so a slow address shows which stage it
+spent its time in. Engines only hold None by default, so when
+instrumentation is disabled the cost is one ``is None`` test per hook.
+
+``to_prometheus`` renders everything in the Prometheus text exposition format.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds, in seconds, of the stage latency histogram buckets
+STAGE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+# name -> (label name or None, help text); other counters are exported with a generic help
+COUNTERS = {
+    'requests': (None, 'Addresses processed, cache hits included'),
+    'spans_probed': ('level', 'Token spans looked up as a name of the level'),
+    'fuzzy_searches': ('level', 'Spans without an exact match that were fuzzy searched'),
+    'fuzzy_fallbacks': ('level', 'Fuzzy searches the token index could not answer and the full index walked'),
+    'nodes_visited': ('level', 'Trie nodes (candidate names for non-trie indexes) visited by fuzzy fallbacks'),
+    'timeouts': (None, 'Addresses whose deadline expired, answered with a partial result'),
+}
+
+
+class Trace:
+    """Stage durations and counters of a single address"""
+    __slots__ = ['started', 'mark', 'stages', 'counters']
+
+    def __init__(self):
+        self.started = self.mark = time.perf_counter()
+        self.stages: Dict[str, float] = defaultdict(float)
+        self.counters: Dict[Tuple[str, str], int] = defaultdict(int)
+
+    def lap(self, stage: str):
+        """Charge the time since the previous lap (or the start) to ``stage``"""
+        now = time.perf_counter()
+        self.stages[stage] += now - self.mark
+        self.mark = now
+
+    def count(self, name: str, label: str = '', value: int = 1):
+        self.counters[(name, label)] += value
+
+    def elapsed(self) -> float:
+        return self.mark - self.started
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram"""
+    __slots__ = ['bounds', 'counts', 'count', 'total']
+
+    def __init__(self, bounds: Iterable[float] = STAGE_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * len(self.bounds)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        running, buckets = 0, []
+        for bound, count in zip(self.bounds, self.counts):
+            running += count
+            buckets.append((bound, running))
+        return buckets
+
+    def quantile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the ``fraction`` quantile (inf past the last one)"""
+        target = fraction * self.count
+        for bound, running in self.cumulative():
+            if running >= target:
+                return bound
+        return float('inf')
+
+
+class Instrumentation:
+    """Process-wide counters and stage histograms fed by finished traces
+
+    Thread-safe. A pickled copy (e.g. in a pool worker) starts empty and
+    records on its own.
+    """
+
+    def __init__(self, namespace: str = 'address_matcher', slow_threshold: Optional[float] = None,
+                 slow_log_size: int = 32):
+        self.namespace = namespace
+        self.slow_threshold = slow_threshold
+        self.slow_log_size = slow_log_size
+        self._reset()
+
+    def _reset(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.histograms: Dict[str, Histogram] = {}
+        self.slow: deque = deque(maxlen=self.slow_log_size)
+
+    def __getstate__(self):
+        return self.namespace, self.slow_threshold, self.slow_log_size
+
+    def __setstate__(self, state):
+        self.namespace, self.slow_threshold, self.slow_log_size = state
+        self._reset()
+
+    def start(self) -> Trace:
+        return Trace()
+
+    def finish(self, trace: Trace, subject: str = None):
+        """Merge a finished trace; its last lap ends the request"""
+        total = trace.elapsed()
+        with self.lock:
+            self.counters[('requests', '')] += 1
+            for key, value in trace.counters.items():
+                self.counters[key] += value
+            for stage, seconds in (*trace.stages.items(), ('total', total)):
+                histogram = self.histograms.get(stage)
+                if histogram is None:
+                    histogram = self.histograms[stage] = Histogram()
+                histogram.observe(seconds)
+            if self.slow_threshold is not None and total >= self.slow_threshold:
+                self.slow.append({
+                    'subject': subject,
+                    'seconds': total,
+                    'stages': dict(trace.stages),
+                    'counters': {f'{name}{{{label}}}' if label else name: value
+                                 for (name, label), value in trace.counters.items()},
+                })
+
+    def counter(self, name: str, label: str = '') -> int:
+        return self.counters.get((name, label), 0)
+
+    def snapshot(self) -> dict:
+        """JSON-friendly summary: counters, per-stage count/mean/p50/p99 and slow traces"""
+        with self.lock:
+            counters = defaultdict(dict)
+            for (name, label), value in sorted(self.counters.items()):
+                if label:
+                    counters[name][label] = value
+                else:
+                    counters[name] = value
+            stages = {stage: {'count': histogram.count,
+                              'mean_s': histogram.total / histogram.count if histogram.count else 0.0,
+                              'p50_le_s': histogram.quantile(0.5),
+                              'p99_le_s': histogram.quantile(0.99)}
+                      for stage, histogram in sorted(self.histograms.items())}
+            return {'counters': dict(counters), 'stages': stages, 'slow': list(self.slow)}
+
+    def to_prometheus(self, extra: Iterable[tuple] = ()) -> str:
+        """Prometheus text exposition of the counters and stage histograms
+
+        ``extra`` holds additional (name, type, help, value) samples, e.g.
+        cache gauges, exported under the same namespace.
+        """
+        prefix = self.namespace
+        lines = []
+        with self.lock:
+            by_name = defaultdict(list)
+            for (name, label), value in sorted(self.counters.items()):
+                by_name[name].append((label, value))
+            for name, samples in by_name.items():
+                label_name, help_text = COUNTERS.get(name, ('label', name.replace('_', ' ')))
+                lines += render_metric(f'{prefix}_{name}_total', 'counter', help_text,
+                                       [({label_name: label} if label else {}, value) for label, value in samples])
+
+            if self.histograms:
+                metric = f'{prefix}_stage_seconds'
+                lines.append(f'# HELP {metric} Time per address spent in each stage')
+                lines.append(f'# TYPE {metric} histogram')
+                for stage, histogram in sorted(self.histograms.items()):
+                    for bound, running in histogram.cumulative():
+                        lines.append(f'{metric}_bucket{format_labels({"stage": stage, "le": repr(bound)})} {running}')
+                    lines.append(f'{metric}_bucket{format_labels({"stage": stage, "le": "+Inf"})} {histogram.count}')
+                    lines.append(f'{metric}_sum{format_labels({"stage": stage})} {histogram.total!r}')
+                    lines.append(f'{metric}_count{format_labels({"stage": stage})} {histogram.count}')
+
+        for name, kind, help_text, value in extra:
+            lines += render_metric(f'{prefix}_{name}', kind, help_text, [({}, value)])
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def render_metric(name: str, kind: str, help_text: str, samples: List[Tuple[Dict[str, str], float]]) -> List[str]:
+    """HELP/TYPE header and sample lines of one metric family"""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    lines += [f'{name}{format_labels(labels)} {value!r}' for labels, value in samples]
+    return lines
@@ -1,38 +1,83 @@
 # NOTE: you CAN change this cell
 # If you want to use your own database, download it here
 # !gdown ...
+import gc
 import os
-import requests
 import csv
 import re
 import pandas as pd
 import json
 import time
-from multiprocessing import Process, Manager
 
+from array import array
+from bisect import bisect_left
 from functools import lru_cache
-from collections import defaultdict
+from collections import Counter, defaultdict
 import unicodedata
-from typing import List, Set
+from typing import Dict, List, Optional, Set
 import multiprocessing
+import threading
 
 import cProfile
 import memory_profiler
 from memory_profiler import profile
 
-# Remove file if it exists
-if os.path.exists("test.json"):
-    os.remove("test.json")
+from data_bundle import download, verify
+from instrumentation import Instrumentation, Trace
+from snapshot import read_snapshot, write_snapshot
 
-# Function to download the file from Google Drive (use an alternative method if gdown is not available)
-def download_from_google_drive(url, filename):
-    try:
-        response = requests.get(url)
-        with open(filename, 'wb') as f:
-            f.write(response.content)
-        print(f"Downloaded '{filename}' successfully.")
-    except Exception as e:
-        print(f"An error occurred while downloading the file: {e}")
+# Word-final 'oa', 'oe' and 'uy' take their tone on either vowel (Hòa / Hoà, Thủy / Thuỷ);
+# canonical_tones puts it on the first. 'qu' is a consonant, so 'quý' is left alone
+TONE_MARKS = '\u0300\u0301\u0303\u0309\u0323'
+TONE_PLACEMENT = re.compile(
+    '(?<![qQ])(?:([oO])([{0}]?)([aAeE])|([uU])([{0}]?)([yY]))([{0}]?)(?![\\w\u0300-\u036f])'.format(TONE_MARKS))
+
+
+def _tone_on_first_vowel(match: re.Match) -> str:
+    first, tone, second = match.group(1, 2, 3) if match.group(1) else match.group(4, 5, 6)
+    return first + tone + match.group(7) + second
+
+
+def canonical_tones(text: str) -> str:
+    """NFC ``text`` with the tone of every word-final 'oa', 'oe' and 'uy' on its first vowel"""
+    return unicodedata.normalize('NFC', TONE_PLACEMENT.sub(_tone_on_first_vowel, unicodedata.normalize('NFD', text)))
+
+
+class AliasRewriter:
+    """Whole-word aliases rewritten in one pass of a single alternation regex
+
+    Where aliases overlap at a position, the longest wins. Aliases and
+    replacements are kept in canonical tone placement, so input must be too.
+    """
+    __slots__ = ['replacements', 'ignore_case', 'pattern']
+
+    def __init__(self, aliases: Dict[str, str], ignore_case: bool = False):
+        self.ignore_case = ignore_case
+        self.replacements = {}
+        for alias, replacement in aliases.items():
+            alias = canonical_tones(alias)
+            self.replacements[alias.lower() if ignore_case else alias] = canonical_tones(replacement)
+        alternatives = '|'.join(re.escape(alias) for alias in sorted(self.replacements, key=len, reverse=True))
+        self.pattern = re.compile(rf'\b(?:{alternatives})\b' if alternatives else '(?!)',
+                                  re.IGNORECASE if ignore_case else 0)
+
+    @classmethod
+    def from_file(cls, path: str, ignore_case: bool = False) -> 'AliasRewriter':
+        """Aliases from 'alias,replacement' lines"""
+        aliases = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    alias, replacement = line.strip().split(',')
+                    aliases[alias] = replacement
+        return cls(aliases, ignore_case)
+
+    def _replacement(self, match: re.Match) -> str:
+        alias = match.group()
+        return self.replacements[alias.lower() if self.ignore_case else alias]
+
+    def rewrite(self, text: str) -> str:
+        return self.pattern.sub(self._replacement, text)
 
 
 class TrieNode:
@@ -45,10 +90,35 @@ class TrieNode:
 
 
 class Trie:
-    def __init__(self):
-        self.root = TrieNode()
+    """Variations of names, each word mapped to the numbers of the rows it names
+
+    Inserts go to a tree of TrieNodes, which the next lookup freezes into a
+    FrozenShard; inserting after that thaws it again.
+    """
+
+    def __init__(self, edit_lookup: bool = False):
+        self.root = TrieNode()  # Pending inserts, None once frozen
         self.vietnamese_chars = frozenset("aáàăằắâbcdđeêềfghiíịjklmnoóòôồơpqrstuưvwxyzABCDĐEFGHIJKLMNOPQRSTUVWXYZ")
         self.variation_cache = defaultdict(set)
+        # FrozenShards, first two characters -> shard and the rows the node data number;
+        # a parallel build() makes several shards, freezing in-process inserts makes one
+        self.shards = None
+        self.shard_map = None
+        self.rows = []
+        # Query-time mode: the trie holds only the generate_variations of each name and
+        # search() matches the edits _generate_word_variations would have inserted
+        self.edit_lookup = edit_lookup
+        if edit_lookup:
+            self.stripped = {}  # diacritic-stripped variation -> rows; matched exactly, as they were inserted
+            self.max_length = 0  # of the variations: longer words cannot be one edit away
+            self.edit_chars = frozenset(char.lower() for char in self.vietnamese_chars)
+
+    def __getstate__(self):
+        # Snapshots hold the frozen arrays. The variation cache is only a build-time memo, keep it out
+        self.freeze()
+        state = self.__dict__.copy()
+        state['variation_cache'] = defaultdict(set)
+        return state
 
     @lru_cache(maxsize=1024)
     def remove_diacritics(self, text: str) -> str:
@@ -59,8 +129,10 @@ class Trie:
         if full_name in self.variation_cache:
             return list(self.variation_cache[full_name])
 
-        words = full_name.split()
-        variations = {full_name}
+        # Keys are in canonical tone placement; the rows keep the name as written
+        name = canonical_tones(full_name)
+        words = name.split()
+        variations = {name}
 
         for i in range(len(words)):
             words_with_T = words[:i] + ['T' + words[i]] + words[i + 1:]
@@ -94,14 +166,16 @@ class Trie:
 
         return variations
 
-    def _insert_word(self, word: str, data: dict):
+    def _insert_word(self, word: str, row: int):
+        if self.root is None:
+            self.thaw()
         node = self.root
         for char in word.lower():  # Case-insensitive insert
             if char not in node.children:
                 node.children[char] = TrieNode()
             node = node.children[char]
         node.is_end_of_word = True
-        node.data.append(data)
+        node.data.append(row)
 
     def _generate_all_variations(self, full_name: str) -> set:
         initial_variations = set(self.generate_variations(full_name))
@@ -114,62 +188,190 @@ class Trie:
 
         return all_variations
 
+    def _insert_variations(self, full_name: str, data):
+        row = len(self.rows)
+        self.rows.append(data)
+        if self.edit_lookup:
+            self._insert_canonical(full_name, row)
+            return
+        for word in self._generate_all_variations(full_name):
+            self._insert_word(word, row)
+
+    def _insert_canonical(self, full_name: str, row: int):
+        for variant in self.generate_variations(full_name):
+            self.max_length = max(self.max_length, len(variant))
+            self._insert_word(variant, row)
+            self.stripped.setdefault(self.remove_diacritics(variant).lower(), []).append(row)
+
     def Provinces_insert(self, code: str, full_name: str):
-        all_variations = self._generate_all_variations(full_name)
-        data = {"Code": code, "FullName": full_name}
-        for word in all_variations:
-            self._insert_word(word, data)
+        self._insert_variations(full_name, {"Code": code, "FullName": full_name})
 
     def Districts_insert(self, code: str, full_name: str, ProvinceCode: str):
-        all_variations = self._generate_all_variations(full_name)
-        data = {"Code": code, "FullName": full_name, "ProvinceCode": ProvinceCode}
-        for word in all_variations:
-            self._insert_word(word, data)
+        self._insert_variations(full_name, {"Code": code, "FullName": full_name, "ProvinceCode": ProvinceCode})
 
     def Wards_insert(self, code: str, full_name: str, DistrictCode: str):
-        all_variations = self._generate_all_variations(full_name)
-        data = {"Code": code, "FullName": full_name, "DistrictCode": DistrictCode}
-        for word in all_variations:
-            self._insert_word(word, data)
+        self._insert_variations(full_name, {"Code": code, "FullName": full_name, "DistrictCode": DistrictCode})
+
+    def build(self, rows: List[dict], pool=None, shards: int = 1):
+        """Insert the variations of every row's FullName, with the row as their data
+
+        Tries in edit_lookup mode are small enough to always build in-process.
+        Otherwise, with a pool, each of ``shards`` tasks builds a trie of the variations
+        whose first two characters map to its shard and returns it frozen (see
+        FrozenShard). Lookups go to the shard of the word's first two
+        characters, so the shards are kept as they arrive: merging costs
+        nothing, where rebuilding nodes in this process would cost as much as
+        inserting the words here.
+        """
+        # Millions of acyclic nodes: collections would only rescan them
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if pool is None or self.edit_lookup:
+                for data in rows:
+                    self._insert_variations(data['FullName'], data)
+                return
+            names = [data['FullName'] for data in rows]
+            self.shard_map = self.balance_shards(names, shards)
+            tasks = [(names, self.shard_map, shards, shard) for shard in range(shards)]
+            self.shards = pool.map(_build_frozen_shard, tasks)
+            self.rows = rows
+            self.root = None
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def balance_shards(self, names: List[str], shards: int) -> Dict[str, int]:
+        """Map the common two-character prefixes to shards, balancing their variations
+
+        Most variations of a name start like one of its generate_variations.
+        The others, edited in their first two characters, spread over many
+        prefixes that shard_of hashes instead.
+        """
+        weights = Counter()
+        for name in names:
+            for variant in self.generate_variations(name):
+                weights[variant[:2].lower()] += len(variant)
+        loads, shard_map = [0] * shards, {}
+        for char, weight in sorted(weights.items(), key=lambda item: (-item[1], item[0])):
+            shard = loads.index(min(loads))
+            shard_map[char] = shard
+            loads[shard] += weight
+        return shard_map
+
+    def freeze(self):
+        """Turn the pending inserts into a FrozenShard (no-op when already frozen)"""
+        if self.root is None:
+            return
+        self.shards, self.shard_map = [FrozenShard(self.root)], {}
+        self.root = None
+
+    def thaw(self):
+        """Rebuild the TrieNodes of a frozen trie, to accept more inserts"""
+        if len(self.shards) > 1:
+            raise TypeError('a Trie built in shards is read-only')
+        self.root = self.shards[0].thaw()
+        self.shards = self.shard_map = None
+
+    def node_count(self) -> int:
+        self.freeze()
+        # Shards repeat the root and some first-character nodes; count those once
+        first = {char for shard in self.shards for char in shard.children(0)}
+        return 1 + len(first) + sum(len(shard) - 1 - len(shard.children(0)) for shard in self.shards)
+
+    def find(self, key: str):
+        """Row numbers stored under ``key`` (lower-cased), or None"""
+        self.freeze()
+        return self.shards[shard_of(key[:2], self.shard_map, len(self.shards))].find(key)
 
     def Insert_Compare(self, word: str):
         """Insert word for comparison database"""
-        node = self.root
-        for char in word.lower():  # Case-insensitive insert
-            if char not in node.children:
-                node.children[char] = TrieNode()
-            node = node.children[char]
-        node.is_end_of_word = True
-        # Store the word directly in data instead of list for comparison
-        node.data = word
+        row = len(self.rows)
+        self.rows.append(word)
+        self._insert_word(canonical_tones(word), row)
 
     def search_cp(self, word: str) -> str:
-        """Search in comparison database"""
-        node = self.root
-        for char in word.lower():  # Case-insensitive search
-            if char not in node.children:
-                return None
-            node = node.children[char]
-
-        return node.data if node.is_end_of_word else None
+        """Search in comparison database; the word inserted last wins"""
+        rows = self.find(canonical_tones(word).lower())
+        return self.rows[rows[-1]] if rows is not None else None
 
     def search(self, word: str) -> List[dict]:
-        """Search in main database"""
-        node = self.root
-        for char in word.lower():  # Case-insensitive search
-            if char not in node.children:
-                return None
-            node = node.children[char]
-
-        return node.data if node.is_end_of_word else None
+        """Search in main database; ``word`` must be in canonical tone placement (search_phrase does it)"""
+        if self.edit_lookup:
+            rows = self.search_edits(word.lower())
+            return [self.rows[row] for row in rows] if rows else None
+        rows = self.find(word.lower())
+        return [self.rows[row] for row in rows] if rows is not None else None
+
+    def search_edits(self, word: str) -> List[int]:
+        """Rows with a variation at most one edit from the lower-cased ``word``
+
+        The edits are those _generate_word_variations inserts: any character
+        of the name deleted, or one of the alphabet's characters substituted
+        or inserted. The trie is walked with a budget of one edit, instead of
+        materializing every edit of every name.
+        """
+        found = set(self.stripped.get(word, ()))
+        length, edit_chars = len(word), self.edit_chars
+        if length > self.max_length + 1:
+            return sorted(found)
+        self.freeze()
+        shard = self.shards[0]
+        chars, first_child, data_start, data = shard.chars, shard.first_child, shard.data_start, shard.data
+
+        def match_rest(node: int, i: int):
+            # Once the edit is spent, the rest of the word must follow the trie exactly
+            for char in word[i:]:
+                end = first_child[node + 1]
+                node = bisect_left(chars, char, first_child[node], end)
+                if node == end or chars[node] != char:
+                    return
+            found.update(data[data_start[node]:data_start[node + 1]])
+
+        node = 0
+        for i in range(length + 1):
+            start, end = first_child[node], first_child[node + 1]
+            if i == length:
+                found.update(data[data_start[node]:data_start[node + 1]])
+                for child in range(start, end):  # last character of the name deleted
+                    found.update(data[data_start[child]:data_start[child + 1]])
+                break
+            char = word[i]
+            exact = bisect_left(chars, char, start, end)
+            if exact == end or chars[exact] != char:
+                exact = -1
+            # Grandchildren are contiguous breadth-first, so str.find probes them all at once
+            low, high = first_child[start], first_child[end]
+            grandchild = chars.find(char, low, high)
+            while grandchild >= 0:  # a child deleted from the name
+                match_rest(grandchild, i + 1)
+                grandchild = chars.find(char, grandchild + 1, high)
+            if char in edit_chars:
+                if i + 1 == length:  # last character substituted
+                    for child in range(start, end):
+                        if child != exact:
+                            found.update(data[data_start[child]:data_start[child + 1]])
+                else:  # substituted by a child other than the exact one
+                    skip = (first_child[exact], first_child[exact + 1]) if exact >= 0 else (0, 0)
+                    grandchild = chars.find(word[i + 1], low, high)
+                    while grandchild >= 0:
+                        if not skip[0] <= grandchild < skip[1]:
+                            match_rest(grandchild, i + 2)
+                        grandchild = chars.find(word[i + 1], grandchild + 1, high)
+                match_rest(node, i + 1)  # inserted
+            if exact < 0:
+                break
+            node = exact
+        return sorted(found)
 
     def search_phrase(self, phrase: str) -> List[dict]:
         """Search for multi-word phrases"""
         # Filter words shorter than 2 characters
-        filtered_words = [word for word in phrase.split() if len(word) > 1]
+        filtered_words = [word for word in canonical_tones(phrase).split() if len(word) > 1]
         results = []
 
-        # Search for all possible word combinations
+        # Search for all possible word combinations. Every span is walked in the trie: an edit
+        # may delete a space ("hànội") or change any token, so intact tokens cannot prune spans
         for i in range(len(filtered_words)):
             for j in range(i + 1, len(filtered_words) + 1):
                 phrase_to_check = ' '.join(filtered_words[i:j])
@@ -189,23 +391,244 @@ class Trie:
         return results
 
 
-class Solution:
-    def __init__(self):
+class FrozenShard:
+    """Read-only array form of a Trie whose data are row numbers
+
+    Nodes are numbered breadth-first. The children of node ``n`` are
+    ``first_child[n]:first_child[n + 1]``, sorted by their character in the
+    string ``chars``; its rows are ``data[data_start[n]:data_start[n + 1]]``.
+    There is no Python object per node.
+    """
+    __slots__ = ['chars', 'first_child', 'data_start', 'data']
+
+    def __init__(self, root: TrieNode):
+        self.first_child, self.data_start, self.data = array('I'), array('I', [0]), array('I')
+        chars, nodes = ['\0'], [root]
+        for node in nodes:  # grows while iterating: breadth-first
+            self.first_child.append(len(nodes))
+            for char in sorted(node.children):
+                chars.append(char)
+                nodes.append(node.children[char])
+            self.data.extend(node.data)
+            self.data_start.append(len(self.data))
+        self.first_child.append(len(nodes))
+        self.chars = ''.join(chars)
+
+    def __len__(self) -> int:
+        return len(self.first_child) - 1
+
+    def children(self, node: int) -> List[str]:
+        return list(self.chars[self.first_child[node]:self.first_child[node + 1]])
+
+    def child(self, node: int, char: str) -> int:
+        """Child of ``node`` along ``char``, or -1"""
+        chars, end = self.chars, self.first_child[node + 1]
+        child = bisect_left(chars, char, self.first_child[node], end)
+        return child if child < end and chars[child] == char else -1
+
+    def find(self, word: str):
+        """Row numbers stored under ``word``, or None"""
+        node = 0
+        for char in word:
+            node = self.child(node, char)
+            if node < 0:
+                return None
+        start, end = self.data_start[node], self.data_start[node + 1]
+        return self.data[start:end] if end > start else None
+
+    def thaw(self) -> TrieNode:
+        """Rebuild the TrieNodes, returning the root"""
+        nodes = [TrieNode() for _ in range(len(self))]
+        for n, node in enumerate(nodes):
+            node.data = list(self.data[self.data_start[n]:self.data_start[n + 1]])
+            node.is_end_of_word = bool(node.data)
+            for child in range(self.first_child[n], self.first_child[n + 1]):
+                node.children[self.chars[child]] = nodes[child]
+        return nodes[0]
+
+
+def shard_of(key: str, shard_map: Dict[str, int], shards: int) -> int:
+    """Shard of the words whose first two characters, lower-cased, are ``key``"""
+    shard = shard_map.get(key)
+    if shard is None:
+        shard = sum(map(ord, key)) % shards
+    return shard
+
+
+def _build_frozen_shard(task) -> FrozenShard:
+    """Pool task of Trie.build: one shard's variations, with row numbers as data"""
+    names, shard_map, shards, shard = task
+    trie = Trie()
+    gc.disable()  # pool workers run nothing else
+    owners = dict(shard_map)  # grows into a memo of shard_of
+    for row, name in enumerate(names):
+        for word in trie._generate_all_variations(name):
+            key = word[:2].lower()
+            owner = owners.get(key)
+            if owner is None:
+                owner = owners[key] = shard_of(key, shard_map, shards)
+            if owner == shard:
+                trie._insert_word(word, row)
+    return FrozenShard(trie.root)
+
+
+# Answer for an address whose worker misses its deadline or fails
+DEFAULT_RESULT = {"province": '', "district": '', "ward": ''}
+
+
+def _serve_solution(solution: 'Solution', conn):
+    """TimeoutPool worker loop: the forked copy of the parent's Solution answers each address"""
+    solution.timeout_pool = None
+    while True:
+        try:
+            address = conn.recv()
+        except EOFError:
+            return
+        try:
+            result = solution.process(address)
+        except Exception:
+            result = dict(DEFAULT_RESULT)
+        conn.send(result)
+
+
+class TimeoutPool:
+    """Persistent forked workers holding a loaded Solution, with a deadline per address
+
+    Workers are forked once the parent's tries are built, so they start with
+    everything loaded, and each answers a warm-up address before serving. An
+    address goes to an idle worker; if no answer arrives by the deadline, that
+    worker alone is killed and the address gets DEFAULT_RESULT at once. A fresh
+    fork replaces it in the background and serves once it has answered the
+    warm-up address. Thread-safe: concurrent calls each take their own worker,
+    and a call still running when the pool is closed stops its worker.
+    """
+
+    WARM_UP_ADDRESS = 'Phúc Xá, Ba Đình, Hà Nội'
+    WARM_UP_TIMEOUT = 5.0  # seconds a replacement gets to answer the warm-up address
+
+    def __init__(self, solution: 'Solution', workers: int = 2, timeout: float = 0.1):
+        self.solution = solution
+        self.timeout = timeout
+        self.context = multiprocessing.get_context('fork')
+        self.available = threading.Condition()
+        self.closed = False
+        self.replaced = 0
+        self.workers = [self._start_worker() for _ in range(workers)]
+        for _, conn in self.workers:
+            conn.recv()
+        self.idle = list(self.workers)
+
+    def _start_worker(self) -> tuple:
+        """Fork a worker and send it the warm-up address; the caller receives the answer"""
+        conn, child_conn = self.context.Pipe()
+        process = self.context.Process(target=_serve_solution, args=(self.solution, child_conn), daemon=True)
+        process.start()
+        child_conn.close()
+        conn.send(self.WARM_UP_ADDRESS)
+        return process, conn
+
+    @staticmethod
+    def _stop_worker(worker: tuple):
+        process, conn = worker
+        conn.close()
+        process.kill()
+        process.join()
+
+    def _replace_worker(self, stuck: tuple):
+        """Replacement thread: reap the killed ``stuck`` worker, fork and warm up another, then make it idle
+
+        A fork that fails, dies or misses WARM_UP_TIMEOUT is retried until the pool closes.
+        """
+        self._stop_worker(stuck)
+        while True:
+            with self.available:
+                if self.closed:
+                    return
+            worker, warm = None, False
+            try:
+                worker = self._start_worker()
+                warm = worker[1].poll(self.WARM_UP_TIMEOUT)
+                if warm:
+                    worker[1].recv()
+            except (EOFError, OSError):
+                warm = False
+            if warm:
+                with self.available:
+                    if not self.closed:
+                        self.workers[self.workers.index(stuck)] = worker
+                        self.replaced += 1
+                        self.idle.append(worker)
+                        self.available.notify()
+                        return
+            if worker is not None:
+                self._stop_worker(worker)
+            if not warm:
+                time.sleep(self.timeout)
+
+    def process(self, address: str, timeout: Optional[float] = None) -> Dict[str, str]:
+        """The answer for ``address``, or DEFAULT_RESULT if it takes longer than the deadline"""
+        with self.available:
+            while not self.idle:
+                if self.closed:
+                    raise ValueError('TimeoutPool is closed')
+                self.available.wait()
+            worker = self.idle.pop()
+        process, conn = worker
+        try:
+            conn.send(address)
+            result = conn.recv() if conn.poll(self.timeout if timeout is None else timeout) else None
+        except (EOFError, OSError):
+            result = None
+        if result is None:
+            process.kill()
+            with self.available:
+                if not self.closed:
+                    threading.Thread(target=self._replace_worker, args=(worker,), daemon=True).start()
+                    return dict(DEFAULT_RESULT)
+            self._stop_worker(worker)
+            return dict(DEFAULT_RESULT)
+        with self.available:
+            if not self.closed:
+                self.idle.append(worker)
+                self.available.notify()
+                return result
+        # close() ran meanwhile and has stopped this worker too
+        self._stop_worker(worker)
+        return result
 
-        # Cập nhật các URL thành URL tải xuống trực tiếp từ Google Drive
-        # Download database của mình
-        url_Districts = "https://drive.google.com/uc?id=1HX5_HqBTxi6WGBuv03RDD3Pp1LZfUbO_&export=download"
-        url_Provinces = "https://drive.google.com/uc?id=1r7oFUXFSnVV8L_vF_k6WFkNI5M4tVp5D&export=download"
-        url_Wards = "https://drive.google.com/uc?id=1AEzjEDter32zb3em-XY3lUG4V0YY4FOA&export=download"
+    def close(self):
+        with self.available:
+            self.closed = True
+            self.available.notify_all()
+            workers, self.idle = list(self.workers), []
+        for worker in workers:
+            self._stop_worker(worker)
 
-        download_from_google_drive(url_Districts, "Districts.txt")
-        download_from_google_drive(url_Provinces, "Provinces.txt")
-        download_from_google_drive(url_Wards, "Wards.txt")
 
+class Solution:
+    # Compiled tries saved in snapshots; bump SNAPSHOT_VERSION when their layout changes
+    SNAPSHOT_FILE = 'solution.snap'
+    SNAPSHOT_VERSION = 5
+    SNAPSHOT_STATE = ('provinces_trie', 'districts_trie', 'wards_trie', 'province_cp', 'district_cp', 'ward_cp')
+
+    # Default worker count floor for a parallel load_data: each worker regenerates every
+    # variation to pick its shard's, so fewer cores build slower (benchmarks/parallel_build.py)
+    MIN_PARALLEL_WORKERS = 4
+
+    # Opt-in per-stage timings and counters (see enable_instrumentation)
+    instrumentation = None
+    # Set by start_timeout_pool; process() then runs in its workers
+    timeout_pool = None
+
+    def __init__(self, workers: Optional[int] = None, edit_lookup: bool = True):
+        # Built from the local data bundle only; "python data_bundle.py download" fetches it.
+        # Raises BundleMismatch if a file is missing or differs from data_manifest.json
         self._init_paths()
-        self._init_tries()
+        verify(self.bundle_files())
+        self._init_aliases()
+        self._init_tries(edit_lookup)
         print('Starting data load')
-        self.load_data()
+        self.load_data(workers)
         print('Data load complete')
 
     def _init_paths(self):
@@ -217,16 +640,29 @@ class Solution:
         self.Districts_path = "Districts.txt"
         self.Provinces_path = "Provinces.txt"
         self.Wards_path = "Wards.txt"
-
-    def _init_tries(self):
-        self.provinces_trie = Trie()
-        self.districts_trie = Trie()
-        self.wards_trie = Trie()
+        # Alias paths
+        self.query_aliases_path = "query_aliases.txt"
+        self.hcm_aliases_path = "hcm_aliases.txt"
+
+    def _init_aliases(self):
+        # Each alias table is compiled into one regex; Hồ Chí Minh aliases ignore case
+        self.query_aliases = AliasRewriter.from_file(self.query_aliases_path)
+        self.hcm_aliases = AliasRewriter.from_file(self.hcm_aliases_path, ignore_case=True)
+
+    def _init_tries(self, edit_lookup: bool = True):
+        # edit_lookup matches spelling errors at query time; False materializes every variation
+        self.provinces_trie = Trie(edit_lookup)
+        self.districts_trie = Trie(edit_lookup)
+        self.wards_trie = Trie(edit_lookup)
         self.province_cp = Trie()
         self.district_cp = Trie()
         self.ward_cp = Trie()
 
-    def load_data(self):
+    def load_data(self, workers: Optional[int] = None):
+        """Build the tries; materialized ones in ``workers`` processes (1 builds in-process)
+
+        The default is one per core, or 1 below MIN_PARALLEL_WORKERS cores.
+        """
         # Load main data
         provinces_data = self.read_data(self.Provinces_path)
         districts_data = self.read_data(self.Districts_path)
@@ -237,19 +673,29 @@ class Solution:
         compare_district = self.insert_from_file(self.district_path)
         compare_ward = self.insert_from_file(self.ward_path)
 
-        # Process data in parallel
-        with multiprocessing.Pool() as pool:
+        # Process data in parallel: each worker builds one shard of every trie
+        if workers is None:
+            workers = os.cpu_count() or 1
+            workers = workers if workers >= self.MIN_PARALLEL_WORKERS else 1
+        # Edit-lookup tries hold only canonical names and always build in-process
+        parallel = workers > 1 and not self.provinces_trie.edit_lookup
+        pool = multiprocessing.Pool(workers) if parallel else None
+        try:
             print('Loading provinces')
-            pool.starmap(self.provinces_trie.Provinces_insert,
-                         [(p['Code'], p['FullName']) for p in provinces_data])
+            self.provinces_trie.build([{"Code": p['Code'], "FullName": p['FullName']} for p in provinces_data],
+                                      pool, workers)
 
             print('Loading districts')
-            pool.starmap(self.districts_trie.Districts_insert,
-                         [(d['Code'], d['FullName'], d['ProvinceCode']) for d in districts_data])
+            self.districts_trie.build([{"Code": d['Code'], "FullName": d['FullName'], "ProvinceCode": d['ProvinceCode']}
+                                       for d in districts_data], pool, workers)
 
             print('Loading wards')
-            pool.starmap(self.wards_trie.Wards_insert,
-                         [(w['Code'], w['FullName'], w['DistrictCode']) for w in wards_data])
+            self.wards_trie.build([{"Code": w['Code'], "FullName": w['FullName'], "DistrictCode": w['DistrictCode']}
+                                   for w in wards_data], pool, workers)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
         # Load comparison data
         print('Loading comparison data')
@@ -260,6 +706,29 @@ class Solution:
         for w in compare_ward:
             self.ward_cp.Insert_Compare(w)
 
+    def source_files(self):
+        return [self.Provinces_path, self.Districts_path, self.Wards_path,
+                self.province_path, self.district_path, self.ward_path]
+
+    def bundle_files(self):
+        return self.source_files() + [self.query_aliases_path, self.hcm_aliases_path]
+
+    def save_snapshot(self, path=SNAPSHOT_FILE):
+        """Write the compiled tries to a versioned snapshot"""
+        state = {name: getattr(self, name) for name in self.SNAPSHOT_STATE}
+        write_snapshot(path, state, self.source_files(), 'Solution', self.SNAPSHOT_VERSION)
+
+    @classmethod
+    def from_snapshot(cls, path=SNAPSHOT_FILE):
+        """Load the compiled tries from a snapshot; raises SnapshotMismatch if it is stale"""
+        solution = cls.__new__(cls)
+        solution._init_paths()
+        solution._init_aliases()
+        state = read_snapshot(path, solution.source_files(), 'Solution', cls.SNAPSHOT_VERSION)
+        for name in cls.SNAPSHOT_STATE:
+            setattr(solution, name, state[name])
+        return solution
+
     def read_data(self, file_path):
         with open(file_path, mode='r', encoding='utf-8') as file:
             reader = csv.DictReader(file, delimiter=';')
@@ -279,7 +748,7 @@ class Solution:
         return " ".join(capitalized_words)  # Ghép lại thành chuỗi
 
     # Xử lý riêng Bà Rịa - Vũng Tàu
-    def handle_ba_ria_vung_tau_case(self, input_phrase):
+    def handle_ba_ria_vung_tau_case(self, input_phrase, trace: Optional[Trace] = None):
         """
         Xử lý riêng cho Bà Rịa - Vũng Tàu, nhận diện và trích xuất quận/phường có số, và tiếp tục xử lý phần còn lại.
         """
@@ -309,7 +778,7 @@ class Solution:
         input_phrase = self.capitalize_first_letter(input_phrase)
 
         # Tìm kiếm thông tin tỉnh/thành phố, quận/huyện, và phường/xã trong Trie
-        result = self.query_standard(input_phrase)
+        result = self.query_standard(input_phrase, trace)
 
         # Gán thông tin đặc biệt cho Bà Rịa - Vũng Tàu và chỉ số quận/phường
         result["province"] = "Bà Rịa - Vũng Tàu"
@@ -319,25 +788,10 @@ class Solution:
         return result
 
     def normalize_ho_chi_minh(self, input_phrase):
-        hcm_variants = {
-            'HCM': 'Hồ Chí Minh',
-            'TPHCM': 'Hồ Chí Minh',
-            'HồChíMinh': 'Hồ Chí Minh',
-            'Thành PhôHôChíMinh': 'Hồ Chí Minh',
-            'H.C.Minh': 'Hồ Chí Minh',
-            'H C M': 'Hồ Chí Minh',
-            'H.C.M': 'Hồ Chí Minh',
-            'TP.HCM': 'Hồ Chí Minh',
-            'T.P.H.C.M': 'Hồ Chí Minh'
-        }
-
         # Thay thế các từ viết tắt trong input_phrase
-        for key, value in hcm_variants.items():
-            input_phrase = re.sub(r'\b' + re.escape(key) + r'\b', value, input_phrase, flags=re.IGNORECASE)
+        return self.hcm_aliases.rewrite(input_phrase)
 
-        return input_phrase
-
-    def handle_ward_number_case(self, input_phrase):
+    def handle_ward_number_case(self, input_phrase, trace: Optional[Trace] = None):
         """
         Xử lý riêng cho Ward, nhận diện và trích xuất phường có số (vd. P13, Q7), và tiếp tục xử lý phần còn lại.
         """
@@ -367,7 +821,7 @@ class Solution:
         input_phrase = self.capitalize_first_letter(input_phrase)
 
         # Tiếp tục tìm kiếm thông thường với phần còn lại của Hồ Chí Minh
-        result = self.query_standard(input_phrase)  # Giả định query_standard là hàm xử lý chuẩn
+        result = self.query_standard(input_phrase, trace)  # Giả định query_standard là hàm xử lý chuẩn
 
         if ward:
             result["ward"] = ward
@@ -375,7 +829,7 @@ class Solution:
         return result
 
     # Hàm xử lý riêng cho Hồ Chí Minh với trường hợp quận/phường có số
-    def handle_ho_chi_minh_case(self, input_phrase):
+    def handle_ho_chi_minh_case(self, input_phrase, trace: Optional[Trace] = None):
         """
         Xử lý riêng cho Hồ Chí Minh, nhận diện và trích xuất quận/phường có số (vd. P13, Q7), và tiếp tục xử lý phần còn lại.
         """
@@ -412,7 +866,7 @@ class Solution:
         input_phrase = self.capitalize_first_letter(input_phrase)
 
         # Tiếp tục tìm kiếm thông thường với phần còn lại của Hồ Chí Minh
-        result = self.query_standard(input_phrase)  # Giả định query_standard là hàm xử lý chuẩn
+        result = self.query_standard(input_phrase, trace)  # Giả định query_standard là hàm xử lý chuẩn
 
         # Thêm thông tin về Hồ Chí Minh và kết quả phường/quận nếu có
         result["province"] = "Hồ Chí Minh"
@@ -423,58 +877,69 @@ class Solution:
 
         return result
 
-    def run_with_timeout(func, *args, timeout=0.1):
-        with Manager() as manager:
-            result = manager.dict()
-
-            rep = {
-                "province": '',
-                "district": '',
-                "ward": ''
-            }
+    def start_timeout_pool(self, workers: int = 2, timeout: float = 0.1) -> 'TimeoutPool':
+        """Answer process() from pre-warmed forked workers, each address with a ``timeout`` deadline"""
+        self.stop_timeout_pool()
+        self.timeout_pool = TimeoutPool(self, workers, timeout)
+        return self.timeout_pool
 
-            def worker():
-                result['value'] = func(*args)
+    def stop_timeout_pool(self):
+        if self.timeout_pool is not None:
+            self.timeout_pool.close()
+            self.timeout_pool = None
 
-            p = Process(target=worker)
-            p.start()
-            p.join(timeout=timeout)
-
-            if p.is_alive():
-                p.terminate()
-                p.join()
-                return rep
-
-            return result.get('value', rep)
-
-    def process_second(self, input_phrase):
+    def process_second(self, input_phrase, trace: Optional[Trace] = None):
         """
         Hàm chính để gọi xử lý địa chỉ ngoài Hồ Chí Minh
         """
+        # Hòa / Hoà: the tries and alias tables hold canonical tone placement
+        input_phrase = canonical_tones(input_phrase)
+
         # Kiểm tra và gọi xử lý riêng cho Hồ Chí Minh nếu có
-        hcm_result = self.handle_ho_chi_minh_case(input_phrase)
+        hcm_result = self.handle_ho_chi_minh_case(input_phrase, trace)
         if hcm_result:
             return hcm_result
 
         # Kiểm tra và gọi xử lý riêng cho "Bà Rịa - Vũng Tàu"
-        brvt_result = self.handle_ba_ria_vung_tau_case(input_phrase)
+        brvt_result = self.handle_ba_ria_vung_tau_case(input_phrase, trace)
         if brvt_result:
             return brvt_result
 
         # Xử lý các tỉnh/thành khác như bình thường nếu không phải Hồ Chí Minh
-        return self.handle_ward_number_case(input_phrase)
+        return self.handle_ward_number_case(input_phrase, trace)
 
     def process(self, input_phrase):
         """
         Hàm chính
         """
-        # result = self.run_with_timeout(self.process_second, input_phrase, timeout=0.1)
-        #
-        # print(result)
+        if self.timeout_pool is not None:
+            return self.timeout_pool.process(input_phrase)
 
-        return self.process_second(input_phrase)
-
-    def query_standard(self, input_phrase):
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return self.process_second(input_phrase)
+        trace = instrumentation.start()
+        try:
+            return self.process_second(input_phrase, trace)
+        finally:
+            trace.lap('resolve')
+            instrumentation.finish(trace, input_phrase)
+
+    def enable_instrumentation(self, instrumentation=None):
+        """Record per-stage timings and counters for every process() call"""
+        self.instrumentation = instrumentation or Instrumentation('solution')
+        return self.instrumentation
+
+    def search_level(self, trie, level, input_phrase, trace: Optional[Trace] = None):
+        """search_phrase on one level's trie, timed and counted into ``trace`` if given"""
+        found = trie.search_phrase(input_phrase)
+        if trace is not None:
+            words = sum(len(word) > 1 for word in input_phrase.split())
+            trace.count('spans_probed', level, words * (words + 1) // 2)
+            trace.lap(level)
+        return found
+
+    def query_standard(self, input_phrase, trace: Optional[Trace] = None):
 
         # district_number_data =''
         ward_number_data = ''
@@ -494,79 +959,24 @@ class Solution:
         input_phrase = re.sub(r"\s+", " ", input_phrase).strip()
         input_phrase = self.capitalize_first_letter(input_phrase)
 
-        dict_ghitat = {
-            'HN': 'Hà Nội',
-            'H N': 'Hà Nội',
-            'TPHN': 'Hà Nội',
-            'HNội': 'Hà Nội',
-            'HàNội': 'Hà Nội',
-            'HàNoi': 'Hà Nội',
-            'Phan Rang': 'Phan Rang-Tháp Chàm',
-            'Thanh Hoá': 'Thanh Hóa',
-            'HaNam': 'Hà Nam',
-            'Khánh Hoà': 'Khánh Hòa',
-            'Tin GJiang': 'Tiền Giang',
-            'T Giang': 'Tiền Giang',
-            'Quảyg Nm': 'Quảng Nam',
-            'T T H': 'Thừa Thiên Huế',
-            'Thừa T Huế': 'Thừa Thiên Huế',
-            'TTH': 'Thừa Thiên Huế',
-            'Hanh Hóa': 'Thanh Hóa',
-            'Minh Thượng': 'U Minh Thượng',
-            'HaOi Dương': 'Hải Dương',
-            'H Nam': 'Hà Nam',
-            'Hú Hoa': 'Phú Hoà',
-            'Phú Hòa': 'Phú Hoà',
-            'Tuy Hòa': 'Tuy Hoà',
-            'TQdung Trị': 'Quảng Trị',
-            'Khabnh Hòa': 'Khánh Hòa',
-            'Biên Hoà': 'Biên Hòa',
-            'Chiêm Hoá': 'Chiêm Hóa',
-            'Hoằng Hoá': 'Hoằng Hóa',
-            'HHiệp Ha': 'Hiệp Hòa',
-            'Đức Hoà': 'Đức Hòa',
-            'Hiệp Hoà': 'Hiệp Hòa',
-            'Đông Hoà': 'Đông Hòa',
-            'Ứng Hoà': 'Ứng Hòa',
-            'Sơn Hoà': 'Sơn Hòa',
-            'Hòa Quý': 'Hoà Quý',
-            'Vĩnh Hoà': 'Vĩnh Hòa',
-            'Hoà Cường Nam': 'Hòa Cường Nam',
-            'Minh Hoà': 'Minh Hòa',
-            'Đức Hoà': 'Đức Hòa',
-            'Thái Hoà': 'Thái Hòa',
-            'Thanh Hoà': 'Thanh Hòa',
-            'Bích Hoà': 'Bích Hòa',
-            'Hoà Thọ Đông': 'Hòa Thọ Đông',
-            'Hoà Thạnh': 'Hòa Thạnh',
-            'Hoà Bắc': 'Hòa Bắc',
-            'Cộng Hoà': 'Cộng Hòa',
-            'Hoà Lợi': 'Hòa Lợi',
-            'Lương Hoà': 'Lương Hòa',
-            'Hoà Trị': 'Hòa Trị',
-            'Cộng Hoà': 'Cộng Hòa',
-            'Thái Hoà': 'Thái Hòa',
-            'Tân Hoà': 'Tân Hòa',
-            'ĐồGg Van': 'Đồng Văn'
-        }
-
-        for key, value in dict_ghitat.items():
-            input_phrase = re.sub(r'\b' + re.escape(key) + r'\b', value, input_phrase)
+        input_phrase = self.query_aliases.rewrite(input_phrase)
 
-        found_phrases1 = self.provinces_trie.search_phrase(input_phrase)
+        if trace is not None:
+            trace.lap('clean')
+        found_phrases1 = self.search_level(self.provinces_trie, 'province', input_phrase, trace)
         if len(found_phrases1) == 1:
             province_name = found_phrases1[0]["FullName"]
-            input_phrase = input_phrase.replace(province_name, " ")
+            input_phrase = input_phrase.replace(canonical_tones(province_name), " ")
 
-        found_phrases2 = self.districts_trie.search_phrase(input_phrase)
+        found_phrases2 = self.search_level(self.districts_trie, 'district', input_phrase, trace)
         if len(found_phrases2) == 1:
             district_name = found_phrases2[0]["FullName"]
-            input_phrase = input_phrase.replace(district_name, " ")
+            input_phrase = input_phrase.replace(canonical_tones(district_name), " ")
 
-        found_phrases3 = self.wards_trie.search_phrase(input_phrase)
+        found_phrases3 = self.search_level(self.wards_trie, 'ward', input_phrase, trace)
         if len(found_phrases3) == 1:
             ward_name = found_phrases3[0]["FullName"]
-            input_phrase = input_phrase.replace(ward_name, " ")
+            input_phrase = input_phrase.replace(canonical_tones(ward_name), " ")
 
         provinces_data = []
         districts_data = []
@@ -727,14 +1137,10 @@ class Solution:
 
         return result
 
-# Function to download the file from Google Drive (use an alternative method if gdown is not available)
+# Function to download the file from Google Drive; on failure the existing file is kept
 def download_from_google_drive(url, filename):
-    if os.path.exists(filename):
-        os.remove(filename)
     try:
-        response = requests.get(url)
-        with open(filename, 'wb') as f:
-            f.write(response.content)
+        download(url, filename)
         print(f"Downloaded '{filename}' successfully.")
     except Exception as e:
         print(f"An error occurred while downloading the file: {e}")
@@ -842,6 +1248,9 @@ def test():
 
 # Press the green button in the gutter to run the script.
 if __name__ == '__main__':
+    # Score against a fresh test.json; at import time this deleted it from every pool worker and importer
+    if os.path.exists("test.json"):
+        os.remove("test.json")
     test()
 
 # See PyCharm help at https://www.jetbrains.com/help/pycharm/
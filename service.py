@@ -0,0 +1,365 @@
+"""Asyncio HTTP front-end for AddressMatcher, standard library only.
+
+Endpoints (JSON unless noted):
+
+    POST /classify         {"address": "..."}          -> {"province", "district", "ward"}
+    POST /classify/batch   {"addresses": ["...", ...]} -> {"results": [...]}
+    GET  /health                                        -> {"status": "ok", ...}
+    GET  /metrics                                       -> counters and batch statistics
+    GET  /metrics/prometheus                            -> the same in Prometheus text format
+    POST /reload                                        -> rebuild from the gazetteer files and swap
+
+Concurrent requests for the same address share one in-flight computation.
+Distinct addresses are queued and dispatched in small batches, either to a
+process pool whose workers hold a warm matcher or, with ``--workers 0``, to a
+single thread in the server process. With ``--instrument`` and ``--workers 0``
+the metrics also carry the matcher's per-stage timings and counters.
+
+``POST /reload`` or SIGHUP rebuilds the matcher from the current gazetteer
+files in a background thread. Unchanged indexes are reused. The new matcher,
+and with ``--workers`` a new pool warmed with it, then replaces the old one in
+one step. Batches already dispatched finish on the old matcher, so no request
+waits on the rebuild or sees a mix of the two.
+
+Run from the repository root:
+
+    python service.py [--host 127.0.0.1] [--port 8080] [--workers 2] [--max-batch 32] [--max-delay-ms 2]
+                      [--instrument]
+"""
+import argparse
+import asyncio
+import json
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from address_matcher import AddressMatcher, _process_chunk, _shared_pool
+from instrumentation import render_metric
+
+MAX_BODY_BYTES = 1 << 20
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class BadRequest(ValueError):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class BatchDispatcher:
+    """Coalesces identical addresses and groups the rest into micro-batches"""
+    __slots__ = ['matcher', 'workers', 'executor', 'process_chunk', 'max_batch', 'max_delay',
+                 'queue', 'in_flight', 'slots', 'dispatching', 'task', 'stats', 'reload_lock']
+
+    def __init__(self, matcher: AddressMatcher, workers: int = 2, max_batch: int = 32,
+                 max_delay: float = 0.002):
+        self.matcher = matcher
+        self.workers = workers
+        self.executor = self._make_executor(matcher)
+        self.process_chunk = _process_chunk if workers > 0 else self._process_local
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue: Optional[asyncio.Queue] = None
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.dispatching = set()
+        self.task: Optional[asyncio.Task] = None
+        self.stats = dict.fromkeys(('addresses', 'coalesced', 'batches', 'batched_addresses', 'errors',
+                                    'reloads'), 0)
+        self.reload_lock: Optional[asyncio.Lock] = None
+
+    def _make_executor(self, matcher: AddressMatcher):
+        if self.workers <= 0:
+            return ThreadPoolExecutor(1, thread_name_prefix='matcher')
+        return _shared_pool(matcher, self.workers, executor=True)
+
+    def _process_local(self, chunk: List[str]) -> List[Dict[str, str]]:
+        matcher = self.matcher  # one matcher per batch, even if a reload swaps it meanwhile
+        return [matcher.process(address) for address in chunk]
+
+    async def _warm(self, executor):
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(executor, self.process_chunk, [])
+                               for _ in range(max(1, self.workers))))
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        # At most two batches per worker wait in the executor; meanwhile the
+        # queue keeps growing so the next batch is fuller instead of backlogged
+        self.slots = asyncio.Semaphore(max(1, self.workers) * 2)
+        self.reload_lock = asyncio.Lock()
+        # Start every worker now so the first requests do not pay for it
+        await self._warm(self.executor)
+        self.task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, *self.dispatching, return_exceptions=True)
+        self.executor.shutdown(cancel_futures=True)
+
+    async def classify(self, address: str) -> Dict[str, str]:
+        self.stats['addresses'] += 1
+        future = self.in_flight.get(address)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.in_flight[address] = future
+            self.queue.put_nowait(address)
+        else:
+            self.stats['coalesced'] += 1
+        # A disconnecting client must not cancel the result other waiters share
+        return dict(await asyncio.shield(future))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            flush_at = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = flush_at - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self.slots.acquire()
+            task = asyncio.create_task(self._dispatch(batch))
+            self.dispatching.add(task)
+            task.add_done_callback(self.dispatching.discard)
+
+    async def _dispatch(self, batch: List[str]):
+        self.stats['batches'] += 1
+        self.stats['batched_addresses'] += len(batch)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, self.process_chunk, batch)
+        except Exception as e:
+            self.stats['errors'] += 1
+            for address in batch:
+                future = self.in_flight.pop(address)
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for address, result in zip(batch, results):
+                future = self.in_flight.pop(address)
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self.slots.release()
+
+    async def reload(self) -> dict:
+        """Rebuild the matcher from its files off the event loop and swap it in"""
+        async with self.reload_lock:
+            loop = asyncio.get_running_loop()
+            started = time.monotonic()
+            matcher = await loop.run_in_executor(None, self.matcher.reload)
+            if self.workers > 0:
+                executor = self._make_executor(matcher)
+                await self._warm(executor)
+                old_executor, self.executor = self.executor, executor
+                # Batches already submitted to the old pool still complete
+                old_executor.shutdown(wait=False)
+            self.matcher = matcher
+            self.stats['reloads'] += 1
+            return {'reloaded': True, 'seconds': round(time.monotonic() - started, 3), 'reused': matcher.reused}
+
+    def metrics(self) -> dict:
+        stats = dict(self.stats)
+        stats['in_flight'] = len(self.in_flight)
+        stats['queued'] = self.queue.qsize() if self.queue is not None else 0
+        stats['mean_batch_size'] = stats['batched_addresses'] / stats['batches'] if stats['batches'] else 0.0
+        stats['workers'] = self.workers
+        if self.workers <= 0:
+            # Pool workers each keep a private cache and instrumentation; only the local ones are visible
+            stats['cache'] = self.matcher.cache.stats()
+            if self.matcher.instrumentation is not None:
+                stats['instrumentation'] = self.matcher.instrumentation.snapshot()
+        return stats
+
+    def prometheus(self) -> str:
+        lines = []
+        for name in ('addresses', 'coalesced', 'batches', 'batched_addresses', 'errors', 'reloads'):
+            lines += render_metric(f'address_service_{name}_total', 'counter', f'Dispatcher {name.replace("_", " ")}',
+                                   [({}, self.stats[name])])
+        lines += render_metric('address_service_in_flight', 'gauge', 'Addresses being classified',
+                               [({}, len(self.in_flight))])
+        text = '\n'.join(lines) + '\n'
+        if self.workers <= 0:
+            text += self.matcher.prometheus_metrics()
+        return text
+
+
+class AddressService:
+    """Minimal HTTP/1.1 server (keep-alive, JSON bodies) in front of a BatchDispatcher"""
+    __slots__ = ['dispatcher', 'server', 'started_at', 'requests']
+
+    def __init__(self, dispatcher: BatchDispatcher):
+        self.dispatcher = dispatcher
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.started_at = time.monotonic()
+        self.requests = 0
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8080) -> asyncio.AbstractServer:
+        await self.dispatcher.start()
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.dispatcher.close()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.respond(writer, 400, {'error': 'malformed request line'}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+                try:
+                    length = int(headers.get('content-length') or 0)
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    await self.respond(writer, 400, {'error': 'invalid Content-Length'}, False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self.respond(writer, 413, {'error': f'body exceeds {MAX_BODY_BYTES} bytes'}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                self.requests += 1
+                status, payload = await self.route(method, target.split('?', 1)[0], body)
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def respond(writer: asyncio.StreamWriter, status: int, payload, keep_alive: bool):
+        if isinstance(payload, str):
+            body, content_type = payload.encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            body, content_type = json.dumps(payload, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8'
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def route(self, method: str, path: str, body: bytes) -> Tuple[int, object]:
+        try:
+            if path == '/classify':
+                address = self.parse(method, body, 'address')
+                if not isinstance(address, str):
+                    raise BadRequest('"address" must be a string')
+                return 200, await self.dispatcher.classify(address)
+            if path == '/classify/batch':
+                addresses = self.parse(method, body, 'addresses')
+                if not isinstance(addresses, list) or not all(isinstance(a, str) for a in addresses):
+                    raise BadRequest('"addresses" must be a list of strings')
+                results = await asyncio.gather(*(self.dispatcher.classify(a) for a in addresses))
+                return 200, {'results': list(results)}
+            if path == '/health':
+                return 200, {'status': 'ok', 'uptime_s': round(time.monotonic() - self.started_at, 3)}
+            if path == '/metrics':
+                return 200, {'requests': self.requests, **self.dispatcher.metrics()}
+            if path == '/metrics/prometheus':
+                return 200, self.dispatcher.prometheus()
+            if path == '/reload':
+                if method != 'POST':
+                    raise BadRequest('use POST', 405)
+                return 200, await self.dispatcher.reload()
+            raise BadRequest(f'no route for {path}', 404)
+        except BadRequest as e:
+            return e.status, {'error': str(e)}
+        except Exception as e:
+            return 500, {'error': f'{type(e).__name__}: {e}'}
+
+    @staticmethod
+    def parse(method: str, body: bytes, field: str):
+        if method != 'POST':
+            raise BadRequest('use POST', 405)
+        try:
+            document = json.loads(body)
+        except ValueError as e:
+            raise BadRequest(f'invalid JSON: {e}') from None
+        if not isinstance(document, dict) or field not in document:
+            raise BadRequest(f'expected a JSON object with "{field}"')
+        return document[field]
+
+
+async def serve(args):
+    matcher = AddressMatcher.load(args.ward_file, args.district_file, args.province_file,
+                                  fuzzy_index=args.fuzzy_index)
+    if args.instrument:
+        matcher.enable_instrumentation()
+    dispatcher = BatchDispatcher(matcher, workers=args.workers, max_batch=args.max_batch,
+                                 max_delay=args.max_delay_ms / 1000)
+    service = AddressService(dispatcher)
+    server = await service.start(args.host, args.port)
+    host, port = server.sockets[0].getsockname()[:2]
+    print(f"Serving on http://{host}:{port} with {args.workers} worker(s)")
+
+    async def reload():
+        try:
+            print(f"Reloaded: {await dispatcher.reload()}")
+        except Exception as e:
+            print(f"Reload failed, still serving the previous data: {type(e).__name__}: {e}")
+
+    if hasattr(signal, 'SIGHUP'):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(reload()))
+    try:
+        await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve address classification over HTTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=2, help='matcher processes; 0 runs in-process')
+    parser.add_argument('--max-batch', type=int, default=32)
+    parser.add_argument('--max-delay-ms', type=float, default=2.0,
+                        help='how long the first queued address waits for others to batch with')
+    parser.add_argument('--ward-file', default='list_ward.txt')
+    parser.add_argument('--district-file', default='list_district.txt')
+    parser.add_argument('--province-file', default='list_province.txt')
+    parser.add_argument('--fuzzy-index', default='trie', choices=sorted(AddressMatcher.FUZZY_INDEXES))
+    parser.add_argument('--instrument', action='store_true', help='record per-stage timings and counters')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""One read-only mapping holding the compiled indexes of a matcher, shared by its workers.
+
+Compiled indexes (CompactTrie, PackedTokenIndex) keep all their data in a few
+flat arrays listed in their ``BUFFERS`` attribute, with no pointers between
+them. ``share_buffers`` copies those arrays into one file, maps it read-only
+and rebinds each attribute to a typed memoryview slice of the mapping.
+
+Under /dev/shm the file lives in RAM. It is unlinked as soon as it is mapped,
+so nothing is left behind whichever way the process ends; the pages are freed
+when the last mapping is dropped. Forked workers inherit the mapping. Their
+data pages stay shared because reference counting only touches the small view
+objects, never the mapped bytes. Without sharing, every write to an array
+object header copies its page, and reads of the token index dicts and lists
+slowly unshare them, so each worker ends up with its own copy.
+"""
+import ctypes
+import mmap
+import os
+import tempfile
+from typing import Iterable, Optional
+
+# Slices start on multiples of this, so every typed view is aligned
+ALIGNMENT = 8
+
+
+class SharedBlock:
+    """The read-only mapping backing a set of shared indexes"""
+    __slots__ = ['mapping', 'size', 'indexes']
+
+    def __init__(self, mapping: mmap.mmap, size: int, indexes: int):
+        self.mapping = mapping
+        self.size = size
+        self.indexes = indexes
+
+
+def default_directory() -> str:
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def trim_heap():
+    """Return the free pages of the C heap to the OS, where the C library can (glibc)
+
+    Arrays replaced by shared views leave holes in the heap that would
+    otherwise stay resident in the parent and be inherited by every worker.
+    """
+    try:
+        malloc_trim = ctypes.CDLL(None).malloc_trim
+    except (OSError, TypeError, AttributeError):
+        return
+    malloc_trim(0)
+
+
+def share_buffers(indexes: Iterable, directory: Optional[str] = None) -> SharedBlock:
+    """Move the ``BUFFERS`` of every index into one read-only mapping, in place
+
+    Indexes must be compiled. They keep working unchanged, but their arrays
+    become read-only memoryviews: changing an index afterwards (e.g. a
+    CompactTrie insert) gives it private arrays again.
+    """
+    indexes = list({id(index): index for index in indexes}.values())
+    layout, size = [], 0
+    for index in indexes:
+        for name in index.BUFFERS:
+            view = memoryview(getattr(index, name))
+            size = -(-size // ALIGNMENT) * ALIGNMENT
+            layout.append((index, name, view, size))
+            size += view.nbytes
+
+    fd, path = tempfile.mkstemp(prefix='address-index-', dir=directory or default_directory())
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for _, _, view, offset in layout:
+                f.seek(offset)
+                f.write(view)
+            f.truncate(max(size, 1))
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        os.unlink(path)
+
+    block = memoryview(mapping)
+    for index, name, view, offset in layout:
+        setattr(index, name, block[offset:offset + view.nbytes].cast(view.format))
+    return SharedBlock(mapping, size, len(indexes))
@@ -0,0 +1,156 @@
+"""Versioned binary snapshots of compiled matcher state.
+
+A snapshot is a small JSON header followed by a single pickle payload:
+
+    MAGIC | header length (uint32, big endian) | JSON header | pickle
+
+The header records the format version, an engine-specific version, build
+options and the SHA-256 of every source file the state was compiled from.
+Loading maps the file, checks the header against the current sources and
+deserializes the payload in one ``pickle.loads`` call; any mismatch raises
+SnapshotMismatch so the caller can rebuild.
+
+Build one from the repository root with:
+
+    python snapshot.py [--engine matcher|solution] [-o PATH] [--fuzzy-index trie]
+"""
+import argparse
+import gc
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import struct
+import time
+from typing import Dict, Iterable
+
+MAGIC = b'AMSNAP\x00'
+FORMAT_VERSION = 1
+_LENGTH = struct.Struct('>I')
+
+
+class SnapshotMismatch(ValueError):
+    """The snapshot is unreadable or was built from different sources/options"""
+
+
+def file_checksums(paths: Iterable[str]) -> Dict[str, str]:
+    checksums = {}
+    for path in paths:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 16), b''):
+                digest.update(block)
+        checksums[path] = digest.hexdigest()
+    return checksums
+
+
+def write_snapshot(path: str, state, sources: Iterable[str], engine: str, version: int, options: dict = None):
+    """Serialize ``state`` to ``path`` atomically, stamped with source checksums"""
+    header = json.dumps({
+        'format': FORMAT_VERSION,
+        'engine': engine,
+        'version': version,
+        'options': options or {},
+        'sources': file_checksums(sources),
+        'created': time.time(),
+    }, sort_keys=True).encode('utf-8')
+    payload = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_LENGTH.pack(len(header)))
+        f.write(header)
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+def read_header(buffer) -> tuple:
+    """Return (header dict, payload offset) for a mapped snapshot"""
+    if bytes(buffer[:len(MAGIC)]) != MAGIC:
+        raise SnapshotMismatch('not a snapshot file')
+    start = len(MAGIC) + _LENGTH.size
+    (header_length,) = _LENGTH.unpack(buffer[len(MAGIC):start])
+    try:
+        header = json.loads(bytes(buffer[start:start + header_length]).decode('utf-8'))
+    except ValueError as e:
+        raise SnapshotMismatch(f'corrupt snapshot header: {e}') from None
+    return header, start + header_length
+
+
+def read_snapshot(path: str, sources: Iterable[str], engine: str, version: int, options: dict = None):
+    """Load the state stored at ``path``, rejecting stale or foreign snapshots"""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        header, offset = read_header(buffer)
+        expected = {
+            'format': FORMAT_VERSION,
+            'engine': engine,
+            'version': version,
+            'options': options or {},
+        }
+        for key, value in expected.items():
+            if header.get(key) != value:
+                raise SnapshotMismatch(f'snapshot {key} is {header.get(key)!r}, expected {value!r}')
+        if header.get('sources') != file_checksums(sources):
+            raise SnapshotMismatch('source files changed since the snapshot was built')
+
+        # The payload is one large acyclic object graph; letting the cyclic GC
+        # rescan it on every allocation threshold costs more than the load itself
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with memoryview(buffer) as view:
+                return pickle.loads(view[offset:])
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+
+def build_matcher(args):
+    from address_matcher import AddressMatcher
+
+    output = args.output or AddressMatcher.SNAPSHOT_FILE
+    start = time.perf_counter()
+    matcher = AddressMatcher(args.ward_file, args.district_file, args.province_file, fuzzy_index=args.fuzzy_index)
+    built = time.perf_counter()
+    matcher.save_snapshot(output)
+    saved = time.perf_counter()
+    AddressMatcher.from_snapshot(output, args.ward_file, args.district_file, args.province_file,
+                                 fuzzy_index=args.fuzzy_index)
+    return output, built - start, saved - built, time.perf_counter() - saved
+
+
+def build_solution(args):
+    from main import Solution
+
+    output = args.output or Solution.SNAPSHOT_FILE
+    start = time.perf_counter()
+    solution = Solution()
+    built = time.perf_counter()
+    solution.save_snapshot(output)
+    saved = time.perf_counter()
+    Solution.from_snapshot(output)
+    return output, built - start, saved - built, time.perf_counter() - saved
+
+
+def main():
+    from address_matcher import AddressMatcher
+
+    parser = argparse.ArgumentParser(description='Compile the gazetteer of an engine into a snapshot')
+    parser.add_argument('--engine', default='matcher', choices=['matcher', 'solution'])
+    parser.add_argument('-o', '--output', help='defaults to the engine\'s SNAPSHOT_FILE')
+    parser.add_argument('--ward-file', default='list_ward.txt')
+    parser.add_argument('--district-file', default='list_district.txt')
+    parser.add_argument('--province-file', default='list_province.txt')
+    parser.add_argument('--fuzzy-index', default='trie', choices=sorted(AddressMatcher.FUZZY_INDEXES))
+    args = parser.parse_args()
+
+    build = build_matcher if args.engine == 'matcher' else build_solution
+    output, build_time, save_time, load_time = build(args)
+    print(f"Built in {build_time:.3f}s, wrote {output} ({os.path.getsize(output) / 2**20:.1f} MiB) "
+          f"in {save_time:.3f}s, loads in {load_time:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,64 @@
+import asyncio
+import csv
+import io
+import json
+import multiprocessing
+import os
+import pickle
+import random
+import shutil
+import sys
+import tempfile
 import unittest
-from address_matcher import AddressMatcher, load_test_cases
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from address_matcher import (HAS_NUMPY, AddressMatcher, BucketIndex, CompactTrie, Deadline, DeletionIndex, PackedTokenIndex,
+                             TokenIndex, Trie, TrieView, levenshtein_distance, load_test_cases)
+import classify
+from classify import CsvWriter, JsonlWriter, classify_stream, read_csv, read_jsonl
+from data_bundle import MANIFEST_FILE, BundleMismatch, generate, update, verify
+from instrumentation import Instrumentation
+from main import DEFAULT_RESULT, AliasRewriter, Solution, TimeoutPool, Trie as VariationTrie, canonical_tones
+from service import AddressService, BatchDispatcher
+from snapshot import SnapshotMismatch
+import re
 import time
 import pandas as pd
 
 
+def legacy_normalize(text):
+    """normalize() as it was before the single-pass fold table"""
+    text = text.lower()
+    for viet_char, ascii_char in AddressMatcher.VIET_CHARS.items():
+        text = text.replace(viet_char, ascii_char)
+    return re.sub(r'[^a-z0-9\s]', '', text)
+
+
+def legacy_clean_address(matcher, address):
+    """clean_address() as it was before the replacements became one regex"""
+    for old, new in AddressMatcher.REPLACEMENTS.items():
+        address = address.replace(old, new)
+    match = matcher.admin_indicators.search(address)
+    if match:
+        address = address[match.end():].strip()
+    for pattern in matcher.p_patterns:
+        address = pattern.sub(r'\1', address)
+    return ' '.join(address.split())
+
+
+def legacy_levenshtein(s1, s2):
+    """levenshtein_distance() as it was before the bit-parallel rewrite"""
+    if len(s1) < len(s2):
+        s1, s2 = s2, s1
+    previous_row = range(len(s2) + 1)
+    for i, c1 in enumerate(s1):
+        current_row = [i + 1]
+        for j, c2 in enumerate(s2):
+            current_row.append(min(previous_row[j + 1] + 1, current_row[j] + 1, previous_row[j] + (c1 != c2)))
+        previous_row = current_row
+    return previous_row[-1]
+
+
 class TestAddressMatcher(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -111,6 +166,752 @@ class TestAddressMatcher(unittest.TestCase):
 
         print(df2)
 
+    def test_match_many(self):
+        addresses = [data_point["text"] for data_point in self.test_cases[:40]]
+        addresses += addresses[:10]  # duplicates are answered once but returned in place
+
+        expected = [self.solution.process(address) for address in addresses]
+
+        self.assertEqual(self.solution.match_many(addresses), expected)
+        self.assertEqual(self.solution.match_many(addresses, workers=2, chunk_size=8), expected)
+        self.assertIsNotNone(self.solution.shared_block)  # the pool's workers map the shared indexes
+
+    def test_decoding_ignores_noisy_prefix(self):
+        prefix = "Số 123/45 Ngõ 67 Đường Nguyễn Văn Cừ Tổ dân phố số 7 Khu tập thể Nhà máy Dệt "
+        for data_point in self.test_cases[:40]:
+            address = data_point["text"]
+            self.assertEqual(self.solution.match_address(prefix + address), self.solution.match_address(address),
+                             address)
+
+    def test_short_junk_tokens_are_not_assigned(self):
+        # 'qq' is two edits from any one-character district name: a negative score, not a match
+        for level in ('province', 'district', 'ward'):
+            self.assertEqual(self.solution.span_candidates(['qq'], ['qq'], 1, level, None), [], level)
+        for junk in ("qq", "zz", "Hà Nội qq"):
+            self.assertEqual(self.solution.process(junk), DEFAULT_RESULT, junk)
+        self.assertEqual(self.solution.process("qq Phúc Xá, Ba Đình, Hà Nội"),
+                         {"province": "Hà Nội", "district": "Ba Đình", "ward": "Phúc Xá"})
+
+    def test_scoped_lookups_exclude_other_parents(self):
+        districts = [district for district in self.solution.districts_by_id.values() if district.wards][:60]
+        excluded = 0
+        for district, other in zip(districts, districts[1:]):
+            own = {ward.name for ward in district.wards.values()}
+            for ward in district.wards.values():
+                self.assertIn(self.solution.find_best_match_v3(ward.name, 'ward', district), own)
+            for ward in other.wards.values():
+                if ward.name not in own:
+                    self.assertIn(self.solution.find_best_match_v3(ward.name, 'ward', district), own | {None})
+                    excluded += 1
+        self.assertGreater(excluded, 100)
+
+        provinces = list(self.solution.provinces.values())
+        for province, other in zip(provinces, provinces[1:]):
+            own = {district.name for district in province.districts.values()}
+            for district in other.districts.values():
+                self.assertIn(self.solution.find_best_match_v3(district.name, 'district', province), own | {None})
+
+    def test_reverse_maps_agree_with_hierarchy(self):
+        provinces = self.solution.provinces
+        # The maps give what the linear scans they replaced found: the first entry of a name
+        for name, province in self.solution.provinces_by_name.items():
+            self.assertIs(province, next(p for p in provinces.values() if p.name == name))
+        self.assertEqual(set(self.solution.provinces_by_name), {p.name for p in provinces.values()})
+        for (province_id, name), district in self.solution.districts_by_name.items():
+            self.assertIs(district, next(d for d in provinces[province_id].districts.values() if d.name == name))
+
+        districts = {}
+        for province in provinces.values():
+            for district_id, district in province.districts.items():
+                self.assertIs(district.province, province)
+                self.assertEqual(district.province_id, province.id)
+                self.assertIn((province.id, district.name), self.solution.districts_by_name)
+                for ward in district.wards.values():
+                    self.assertIs(ward.district, district)
+                    self.assertEqual(ward.district_id, district_id)
+                districts[district_id] = district
+        self.assertEqual(districts, self.solution.districts_by_id)
+
+    def test_lazy_wards_match_eager_and_load_on_demand(self):
+        lazy = AddressMatcher('list_ward.txt', 'list_district.txt', 'list_province.txt', lazy_wards=True)
+        self.assertTrue(lazy.ward_level_pending)
+        self.assertTrue(all(d.ward_index is None for d in lazy.districts_by_id.values()))
+
+        addresses = [data_point["text"] for data_point in self.test_cases[:100]]
+        self.assertEqual([lazy.match_address(a) for a in addresses],
+                         [self.solution.match_address(a) for a in addresses])
+        loaded = sum(d.ward_index is not None for d in lazy.districts_by_id.values())
+        self.assertLess(0, loaded)
+        self.assertLess(loaded, len(lazy.districts_by_id))
+
+        lazy.warm_up().join()
+        self.assertFalse(lazy.ward_level_pending or lazy.pending_wards)
+        self.assertEqual(sorted(lazy.token_indexes['ward'].entries),
+                         sorted(self.solution.token_indexes['ward'].entries))
+        self.assertEqual({d.id: d.ward_names for d in lazy.districts_by_id.values()},
+                         {d.id: d.ward_names for d in self.solution.districts_by_id.values()})
+
+    def test_shared_indexes_match_private_ones(self):
+        matcher = AddressMatcher('list_ward.txt', 'list_district.txt', 'list_province.txt', lazy_wards=True)
+        addresses = [data_point["text"] for data_point in self.test_cases[:100]]
+        expected = [self.solution.match_address(a) for a in addresses]
+
+        block = matcher.share()
+        self.assertIs(matcher.share(), block)
+        self.assertTrue(matcher.tries['ward'].chars.readonly)
+        self.assertIsInstance(matcher.token_indexes['ward'], PackedTokenIndex)
+        # Scoped tries are packed into one forest per level
+        self.assertIsInstance(next(iter(matcher.districts_by_id.values())).ward_index, TrieView)
+        self.assertEqual(block.indexes, 11)
+        self.assertEqual([matcher.match_address(a) for a in addresses], expected)
+        matcher.cache.clear()
+        self.assertEqual(matcher.match_many(addresses, workers=2, chunk_size=16), [matcher.process(a) for a in addresses])
+
+        # Pickled (e.g. snapshotted) indexes own their arrays again
+        ward_trie = pickle.loads(pickle.dumps(matcher.tries['ward']))
+        self.assertEqual(ward_trie.search("phuc xa"), matcher.tries['ward'].search("phuc xa"))
+        self.assertNotIsInstance(ward_trie.chars, memoryview)
+
+    def test_cache_hits_on_repeated_raw_input(self):
+        address = self.test_cases[0]["text"]
+        self.solution.cache.clear()
+        hits = self.solution.cache.hits
+
+        first = self.solution.match_address(address)
+        second = self.solution.match_address(address)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.solution.cache.hits, hits + 1)
+
+    def test_expired_deadline_returns_partial_result_from_thread(self):
+        address = self.test_cases[0]["text"]
+        self.solution.cache.clear()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(self.solution.process, address, 0).result()
+
+        self.assertTrue(result["partial"])
+        # Levels resolved before the first deadline check agree with the complete decode
+        complete = self.solution.process(address)
+        self.assertNotIn("partial", complete)
+        self.assertEqual(result["province"], complete["province"])
+        for level in ("district", "ward"):
+            self.assertIn(result[level], ("", complete[level]))
+
+    def test_pickled_matcher_gets_fresh_runtime_state(self):
+        # What pool workers receive when fork is unavailable
+        lazy = AddressMatcher('list_ward.txt', 'list_district.txt', 'list_province.txt', lazy_wards=True)
+        addresses = [data_point["text"] for data_point in self.test_cases[:20]]
+        lazy.match_address(addresses[0])
+        copy = pickle.loads(pickle.dumps(lazy))
+        self.assertEqual(len(copy.cache), 0)
+        self.assertEqual(copy.cache.maxsize, lazy.cache.maxsize)
+        self.assertIsNot(copy.ward_lock, lazy.ward_lock)
+        self.assertEqual(set(copy.pending_wards), set(lazy.pending_wards))
+        self.assertEqual([copy.match_address(a) for a in addresses],
+                         [self.solution.match_address(a) for a in addresses])
+
+    def test_snapshot_round_trip_and_invalidation(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            files = [shutil.copy(name, tmp) for name in ('list_ward.txt', 'list_district.txt', 'list_province.txt')]
+            path = os.path.join(tmp, 'matcher.snap')
+            matcher = AddressMatcher(*files)
+            matcher.save_snapshot(path)
+            addresses = [data_point["text"] for data_point in self.test_cases[:50]]
+
+            loaded = AddressMatcher.from_snapshot(path, *files, cache_size=5)
+            self.assertEqual(loaded.cache.maxsize, 5)
+            self.assertEqual([loaded.match_address(a) for a in addresses], [matcher.match_address(a) for a in addresses])
+
+            class Bumped(AddressMatcher):
+                SNAPSHOT_VERSION = AddressMatcher.SNAPSHOT_VERSION + 1
+            with self.assertRaises(SnapshotMismatch):
+                Bumped.from_snapshot(path, *files)
+            with self.assertRaises(SnapshotMismatch):
+                AddressMatcher.from_snapshot(path, *files, fuzzy_index='deletion')
+
+            with open(files[2], 'a', encoding='utf-8') as f:
+                f.write('Tỉnh Mới\n')
+            with self.assertRaises(SnapshotMismatch):
+                AddressMatcher.from_snapshot(path, *files)
+
+            # load() rebuilds from the changed sources and refreshes the snapshot
+            rebuilt = AddressMatcher.load(*files, snapshot=path)
+            self.assertIn('Tỉnh Mới', rebuilt.data['province'])
+            self.assertIn('Tỉnh Mới', AddressMatcher.from_snapshot(path, *files).data['province'])
+
+            with open(path, 'wb') as f:
+                f.write(b'not a snapshot')
+            with self.assertRaises(SnapshotMismatch):
+                AddressMatcher.from_snapshot(path, *files)
+
+    def test_deadline_expiring_mid_decode_keeps_resolved_levels(self):
+        address = "Phúc Xá, Ba Đình, Hà Nội"
+        span_candidates = self.solution.span_candidates
+
+        def expire_at_ward_level(words, tokens, end, level, scope, deadline=None, trace=None):
+            if level == 'ward':
+                Deadline(0).check()
+            return span_candidates(words, tokens, end, level, scope, deadline, trace)
+
+        self.solution.cache.clear()
+        self.solution.span_candidates = expire_at_ward_level
+        try:
+            result = self.solution.match_address(address, Deadline(60))
+        finally:
+            del self.solution.span_candidates
+        self.assertEqual(result, {"province": "Hà Nội", "district": "Ba Đình", "ward": "", "partial": True})
+        self.assertEqual(self.solution.match_address(address),
+                         {"province": "Hà Nội", "district": "Ba Đình", "ward": "Phúc Xá"})
+
+    def test_instrumentation_counts_stages_without_changing_results(self):
+        addresses = [data_point["text"] for data_point in self.test_cases[:50]]
+        self.solution.cache.clear()
+        expected = [self.solution.process(address) for address in addresses]
+
+        self.solution.cache.clear()
+        instrumentation = self.solution.enable_instrumentation(Instrumentation(slow_threshold=0))
+        try:
+            results = [self.solution.process(address) for address in addresses]
+            self.solution.cache.clear()
+            self.solution.process(addresses[1], 0)
+            text = self.solution.prometheus_metrics()
+        finally:
+            self.solution.instrumentation = None
+
+        self.assertEqual(results, expected)
+        self.assertEqual(instrumentation.counter('requests'), 51)
+        self.assertEqual(instrumentation.counter('timeouts'), 1)
+        self.assertGreater(instrumentation.counter('spans_probed', 'province'), 0)
+        self.assertGreater(instrumentation.counter('nodes_visited', 'ward'), 0)
+        snapshot = instrumentation.snapshot()
+        self.assertEqual(snapshot['stages']['total']['count'], 51)
+        self.assertIn('province', snapshot['slow'][0]['stages'])
+
+        self.assertIn('# TYPE address_matcher_stage_seconds histogram', text)
+        self.assertIn('address_matcher_stage_seconds_count{stage="total"} 51', text)
+        self.assertIn('address_matcher_timeouts_total 1', text)
+        self.assertIn('# TYPE address_matcher_cache_hit_ratio gauge', text)
+
+
+class TestTextPipeline(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.solution = AddressMatcher('list_ward.txt', 'list_district.txt', 'list_province.txt')
+        cls.texts = [data_point["text"] for data_point in load_test_cases('public.json')]
+
+    def test_normalize_matches_legacy(self):
+        names = [name for level in self.solution.data.values() for name in level]
+        for text in self.texts + names + ['İstanbul ẞ Σίσυφος ½ \t tab']:
+            self.assertEqual(self.solution.normalize(text), legacy_normalize(text), text)
+
+    def test_clean_address_matches_legacy(self):
+        for text in self.texts:
+            self.assertEqual(self.solution.clean_address(text), legacy_clean_address(self.solution, text), text)
+
+    def test_chained_replacements_match_legacy(self):
+        # Blanking a pattern can create another one, e.g. 'T' before a blanked 'Thành phố '
+        rnd = random.Random(9)
+        pieces = list(AddressMatcher.REPLACEMENTS) + ['Hà Nội', 'Ba Đình', 'Phú', '12', 'a', 'h', 'T', ' ']
+        texts = ['thị xã Hà NộiTnhthị xã Thành phố PhTP.', 'TTThành phố ', 'Hà NộihTT.PTỉnhV Huyện t.P']
+        texts += [''.join(rnd.choice(pieces) for _ in range(rnd.randint(1, 8))) for _ in range(5000)]
+        for text in texts:
+            self.assertEqual(self.solution.clean_address(text), legacy_clean_address(self.solution, text), text)
+
+
+class TestEditDistance(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        matcher = AddressMatcher('list_ward.txt', 'list_district.txt', 'list_province.txt')
+        cls.names = sorted({matcher.normalize(name) for name in matcher.data['ward']})
+
+    def test_bit_parallel_matches_dp(self):
+        rnd = random.Random(3)
+        for _ in range(2000):
+            s1 = ''.join(rnd.choice('ab n') for _ in range(rnd.randint(0, 70)))
+            s2 = ''.join(rnd.choice('ab n') for _ in range(rnd.randint(0, 70)))
+            expected = legacy_levenshtein(s1, s2)
+            self.assertEqual(levenshtein_distance(s1, s2), expected, (s1, s2))
+            self.assertEqual(levenshtein_distance(s1, s2, 2), min(expected, 3), (s1, s2))
+
+    def test_compact_trie_matches_trie(self):
+        trie, compact = Trie(), CompactTrie()
+        for name in self.names:
+            trie.insert(name, name.title())
+            compact.insert(name, name.title())
+        compact = pickle.loads(pickle.dumps(compact))
+        self.assertEqual(compact.node_count, 1 + sum(1 for _ in self.walk(trie.root)))
+        self.assertLess(compact.memory_usage(), trie.memory_usage() / 10)
+        for query in ["tan bnh", "phuoc hoa", "xa", self.names[7], self.names[-1] + "x"]:
+            self.assertEqual(compact.search(query), trie.search(query), query)
+            self.assertEqual(compact.search_similar(query, limit=5), trie.search_similar(query, limit=5), query)
+
+        compact.insert("zzz", "Zzz")  # inserting after compiling thaws and recompiles
+        self.assertEqual((compact.search("zzz"), compact.search(self.names[7])), ("Zzz", self.names[7].title()))
+
+    def test_forest_views_match_separate_tries(self):
+        groups = [self.names[i::3] for i in range(3)] + [[]]
+        tries = []
+        for group in groups:
+            trie = CompactTrie()
+            for name in group:
+                trie.insert(name, name.title())
+            trie.compile()
+            tries.append(trie)
+        views = CompactTrie.forest(tries)
+        # A forest can be laid out again from views, e.g. of a reloaded matcher
+        views = CompactTrie.forest(views[::-1])[::-1]
+        for trie, view in zip(tries, views):
+            self.assertEqual(view.max_length, trie.max_length)
+            self.assertLess(view.memory_usage(), trie.memory_usage())
+            for query in ["tan bnh", "phuoc hoa", "xa", self.names[7], self.names[-1] + "x"]:
+                self.assertEqual(view.search(query), trie.search(query), query)
+                self.assertEqual(view.search_similar(query, limit=5), trie.search_similar(query, limit=5), query)
+        with self.assertRaises(TypeError):
+            views[0].insert("zzz", "Zzz")
+
+    @staticmethod
+    def walk(node):
+        for child in node.children.values():
+            yield child
+            yield from TestEditDistance.walk(child)
+
+    @unittest.skipIf(not HAS_NUMPY, "numpy is not installed")
+    def test_vectorized_buckets_match_scalar(self):
+        scalar, vectorized = BucketIndex(), BucketIndex(vectorized=True)
+        for name in self.names:
+            scalar.insert(name, name)
+            vectorized.insert(name, name)
+        for query in ["tan bnh", "phuoc hoa", "xa", "nguyen van troi", self.names[-1] + "x"]:
+            self.assertEqual(vectorized.search_similar(query), scalar.search_similar(query), query)
+
+    def test_deletion_index_matches_brute_force(self):
+        def check(index, names, queries):
+            for query in queries:
+                distances = {normalized: levenshtein_distance(query, normalized) for normalized in names}
+                near = {index.exact[normalized] for normalized, distance in distances.items() if distance <= 2}
+                self.assertLessEqual(near, index.candidates(query), query)
+                expected = sorted((distance, index.exact[normalized], names[normalized])
+                                  for normalized, distance in distances.items() if distance <= 2)
+                if query in names:
+                    expected = expected[:1]
+                self.assertEqual(index.search_similar(query, limit=len(names)),
+                                 [(original, distance) for distance, _, original in expected], query)
+
+        rnd = random.Random(11)
+
+        def typos(name):
+            chars = list(name)
+            for _ in range(rnd.randint(1, 3)):
+                i = rnd.randrange(len(chars) + 1)
+                if i < len(chars) and rnd.random() < 0.5:
+                    del chars[i]
+                else:
+                    chars.insert(i, rnd.choice("abhnt "))
+            return ''.join(chars)
+
+        index = DeletionIndex()
+        for name in self.names:
+            index.insert(name, name.title())
+        sample = rnd.sample(self.names, 40)
+        check(index, {name: name.title() for name in self.names},
+              ["", "xa", "tan bnh", "phuoc hoa", self.names[-1] + "x"] + sample[:10] + [typos(name) for name in sample])
+
+        # Scoped indexes hold only the district's wards; typos of other districts' wards find nothing else
+        matcher = AddressMatcher('list_ward.txt', 'list_district.txt', 'list_province.txt', fuzzy_index='deletion')
+        districts = rnd.sample(list(matcher.districts_by_id.values()), 5)
+        for district, other in zip(districts, districts[1:] + districts[:1]):
+            names, index = matcher.level_indexes('ward', district)
+            self.assertIsInstance(index, DeletionIndex)
+            self.assertEqual(len(index.words), len(names))
+            others = matcher.level_indexes('ward', other)[0]
+            check(index, names, [typos(name) for name in [*names, *others]])
+
+
+class TestTokenIndex(unittest.TestCase):
+    def test_postings_are_scoped_by_parent(self):
+        index = TokenIndex()
+        index.insert("tan binh", "Tân Bình", "d1")
+        index.insert("tan phu", "Tân Phú", "d1")
+        index.insert("tan binh", "Tân Bình", "d2")
+        index.insert("binh an", "Bình An", "d2")
+
+        self.assertEqual(index.search_similar("tan bnh", parent_id="d1"), [("Tân Bình", 1)])
+        self.assertEqual([index.entries[i][1] for i in index.candidates("binh", parent_id="d2")],
+                         ["Tân Bình", "Bình An"])
+        self.assertEqual(index.candidates("tan binh"), [])
+        self.assertEqual(index.search_similar("xyz", parent_id="d1"), [])
+
+        packed = PackedTokenIndex(index)
+        for word, parent_id in (("tan bnh", "d1"), ("binh", "d2"), ("tan binh", None), ("an", "d3")):
+            self.assertEqual(list(packed.candidates(word, parent_id)), list(index.candidates(word, parent_id)))
+            self.assertEqual(packed.search_similar(word, parent_id=parent_id),
+                             index.search_similar(word, parent_id=parent_id))
+
+
+class TestSolutionBuild(unittest.TestCase):
+    ROWS = [{"Code": "1", "FullName": "Hà Nội"}, {"Code": "2", "FullName": "Hà Giang"},
+            {"Code": "79", "FullName": "Hồ Chí Minh"}, {"Code": "760", "FullName": "1"}]
+
+    def test_parallel_build_matches_single_process(self):
+        single = VariationTrie()
+        single.build(self.ROWS)
+        parallel = VariationTrie()
+        with multiprocessing.Pool(2) as pool:
+            parallel.build(self.ROWS, pool, shards=3)
+
+        self.assertGreater(single.node_count(), 1000)
+        self.assertEqual(parallel.node_count(), single.node_count())
+        for word in ["ha noi", "hà giang", "ho chi mnh", "", "1", "12", "xyz"]:
+            self.assertEqual(parallel.search(word), single.search(word), word)
+
+    def test_edit_lookup_matches_materialized_variations(self):
+        materialized = VariationTrie()
+        materialized.build(self.ROWS)
+        edit_lookup = VariationTrie(edit_lookup=True)
+        edit_lookup.build(self.ROWS)
+        self.assertLess(edit_lookup.node_count() * 100, materialized.node_count())
+
+        rnd = random.Random(5)
+        alphabet = "aàăằđêềhnộíxyz Ð1-"
+        probes = {"", "tha noi", "hcm", "ha noi ha giang"}
+        for row in self.ROWS:
+            for variant in materialized.generate_variations(row["FullName"]):
+                for word in (variant.lower(), materialized.remove_diacritics(variant).lower()):
+                    probes.add(word)
+                    for _ in range(60):
+                        chars, i = list(word), rnd.randrange(len(word) + 1)
+                        for _ in range(rnd.choice([1, 1, 1, 2])):
+                            operation = rnd.randrange(3)
+                            if operation == 0 and i < len(chars):
+                                del chars[i]
+                            elif operation == 1 and i < len(chars):
+                                chars[i] = rnd.choice(alphabet)
+                            else:
+                                chars.insert(i, rnd.choice(alphabet))
+                            i = rnd.randrange(len(chars) + 1)
+                        probes.add(''.join(chars))
+
+        def unique(rows):
+            return None if rows is None else [row for i, row in enumerate(rows) if row not in rows[:i]]
+
+        for probe in probes:
+            self.assertEqual(unique(edit_lookup.search(probe)), unique(materialized.search(probe)), probe)
+        self.assertEqual(edit_lookup.search_phrase("thanh pho ha nọi hà giangx"),
+                         materialized.search_phrase("thanh pho ha nọi hà giangx"))
+
+    def test_frozen_trie_thaws_for_inserts(self):
+        trie = VariationTrie()
+        trie.build(self.ROWS[:2])
+        nodes = trie.node_count()
+        self.assertIsNone(trie.root)
+        giang = trie.search("hà giang")
+        self.assertEqual(set(row["Code"] for row in giang), {"2"})
+
+        trie.Insert_Compare("Hà Nam")
+        self.assertIsNotNone(trie.root)
+        self.assertGreater(trie.node_count(), nodes)
+        self.assertEqual(trie.search_cp("Hà Nam"), "Hà Nam")
+
+        copy = pickle.loads(pickle.dumps(trie))
+        self.assertIsNone(copy.root)
+        self.assertEqual(copy.search("hà giang"), giang)
+        self.assertEqual(copy.search_cp("Hà Nam"), "Hà Nam")
+
+    def test_aliases_rewrite_in_one_pass_after_tone_canonicalization(self):
+        self.assertEqual(canonical_tones("Hoà Thuỷ KHOẺ quý Hoàng hoặc Ngoài"), "Hòa Thủy KHỎE quý Hoàng hoặc Ngoài")
+        self.assertEqual(canonical_tones("Hòa"), canonical_tones("Hoa\u0300"))
+
+        aliases = AliasRewriter({"HN": "Hà Nội", "H N": "Hà Nội", "H Nam": "Hà Nam", "Hú Hoa": "Phú Hoà"})
+        self.assertEqual(aliases.rewrite("HN, H Nam HNội H N Hú Hoa"), "Hà Nội, Hà Nam HNội Hà Nội Phú Hòa")
+        hcm = AliasRewriter.from_file("hcm_aliases.txt", ignore_case=True)
+        self.assertEqual(hcm.rewrite("tp.hcm Q1, H.C.M"), "Hồ Chí Minh Q1, Hồ Chí Minh")
+
+        trie = VariationTrie(edit_lookup=True)
+        trie.build([{"Code": "1", "FullName": "Phú Hoà"}])
+        trie.Insert_Compare("Khánh Hoà")
+        self.assertEqual(trie.search_phrase("phú hòa"), [{"Code": "1", "FullName": "Phú Hoà"}])
+        self.assertEqual(trie.search_cp("Khánh Hòa"), "Khánh Hoà")
+
+    def test_data_bundle_is_verified_locally(self):
+        manifest = verify()
+        solution = Solution.__new__(Solution)
+        solution._init_paths()
+        self.assertEqual(set(manifest['files']), set(solution.bundle_files()))
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        manifest_path = os.path.join(directory, MANIFEST_FILE)
+        for name in (MANIFEST_FILE, *manifest['files']):
+            shutil.copy(name, directory)
+        verify(manifest_path=manifest_path)
+        with open(os.path.join(directory, 'Provinces.txt'), 'a', encoding='utf-8') as f:
+            f.write('99;Tỉnh Mới;TM\n')
+        with self.assertRaises(BundleMismatch):
+            verify(['Provinces.txt'], manifest_path)
+        verify(['Districts.txt'], manifest_path)
+        # Generated locally, not downloaded: regenerating restores the recorded contents
+        provinces = manifest['files']['Provinces.txt']
+        self.assertNotIn('url', provinces)
+        shutil.copy(provinces['generated_from'], directory)
+        generate(os.path.join(directory, provinces['generated_from']), provinces['header'],
+                 os.path.join(directory, 'Provinces.txt'), provinces['sha256'])
+        verify(['Provinces.txt'], manifest_path)
+        with open(os.path.join(directory, 'Provinces.txt'), 'a', encoding='utf-8') as f:
+            f.write('99;Tỉnh Mới;TM\n')
+        self.assertEqual(update(manifest_path)['version'], manifest['version'] + 1)
+        verify(manifest_path=manifest_path)
+        os.remove(os.path.join(directory, 'Wards.txt'))
+        with self.assertRaises(BundleMismatch):
+            verify(manifest_path=manifest_path)
+
+    def test_concurrent_requests_keep_their_own_traces(self):
+        solution = Solution(workers=1)
+        addresses = [case["text"] for case in load_test_cases('public.json')[:40]]
+
+        def counters_per_address(threads):
+            instrumentation = solution.enable_instrumentation(Instrumentation(slow_threshold=0, slow_log_size=100))
+            with ThreadPoolExecutor(threads) as executor:
+                list(executor.map(solution.process, addresses))
+            solution.instrumentation = None
+            self.assertEqual(instrumentation.counter('requests'), len(addresses))
+            return sorted((entry['subject'], sorted(entry['counters'].items()), sorted(entry['stages']))
+                          for entry in instrumentation.snapshot()['slow'])
+
+        self.assertEqual(counters_per_address(4), counters_per_address(1))
+
+    def test_timeout_pool_replaces_only_the_stuck_worker(self):
+        solution = Solution(workers=1)
+        addresses = [case["text"] for case in load_test_cases('public.json')[:20]]
+        expected = [solution.process(address) for address in addresses]
+
+        answer = solution.process_second
+        # Forked workers inherit this patched instance
+        solution.process_second = lambda phrase: time.sleep(30) if phrase == 'stuck' else answer(phrase)
+        pool = solution.start_timeout_pool(workers=2, timeout=1)
+        self.addCleanup(solution.stop_timeout_pool)
+        self.assertEqual([solution.process(address) for address in addresses], expected)
+
+        healthy = pool.idle[0][0]
+        start = time.perf_counter()
+        self.assertEqual(pool.process('stuck', timeout=0.2), DEFAULT_RESULT)
+        # Answered at the deadline: the replacement is forked and warmed up in the background
+        self.assertLess(time.perf_counter() - start, 0.3)
+        self.wait_for_replacements(pool, 1)
+        self.assertTrue(healthy.is_alive())
+        self.assertIn(healthy, [process for process, _ in pool.workers])
+        with ThreadPoolExecutor(2) as executor:
+            self.assertEqual(list(executor.map(solution.process, addresses)), expected)
+
+    def test_timeout_pool_retries_replacements_that_die(self):
+        solution = Solution(workers=1)
+        answer = solution.process_second
+        solution.process_second = lambda phrase: time.sleep(30) if phrase == 'stuck' else answer(phrase)
+        pool = solution.start_timeout_pool(workers=1, timeout=0.2)
+        self.addCleanup(solution.stop_timeout_pool)
+        start_worker, forks = pool._start_worker, []
+
+        def dying_first():
+            worker = start_worker()
+            forks.append(worker)
+            if len(forks) == 1:
+                worker[0].kill()
+            return worker
+
+        pool._start_worker = dying_first
+        self.assertEqual(pool.process('stuck'), DEFAULT_RESULT)
+        self.wait_for_replacements(pool, 1)
+        self.assertEqual(len(forks), 2)
+        self.assertIs(pool.idle[0], forks[1])
+        self.assertEqual(pool.process(TimeoutPool.WARM_UP_ADDRESS), answer(TimeoutPool.WARM_UP_ADDRESS))
+
+    @staticmethod
+    def wait_for_replacements(pool, count: int):
+        deadline = time.monotonic() + 10
+        with pool.available:
+            while pool.replaced < count and time.monotonic() < deadline:
+                pool.available.wait(0.05)
+        if pool.replaced < count:
+            raise AssertionError(f'{pool.replaced} of {count} replacements ready')
+
+    def test_timeout_pool_warms_replacements_and_stops_after_close(self):
+        solution = Solution(workers=1)
+        log = os.path.join(tempfile.mkdtemp(), 'phrases.txt')
+        self.addCleanup(shutil.rmtree, os.path.dirname(log))
+        answer = solution.process_second
+
+        def logged(phrase):
+            with open(log, 'a', encoding='utf-8') as f:
+                f.write(phrase + '\n')
+            if phrase in ('stuck', 'slow'):
+                time.sleep(30)
+            return answer(phrase)
+
+        def phrases():
+            with open(log, encoding='utf-8') as f:
+                return f.read().splitlines()
+
+        solution.process_second = logged
+        pool = solution.start_timeout_pool(workers=2, timeout=5)
+        self.addCleanup(solution.stop_timeout_pool)
+        warm_up = TimeoutPool.WARM_UP_ADDRESS
+        self.assertEqual(phrases().count(warm_up), 2)
+        self.assertEqual(pool.process('stuck', timeout=0.2), DEFAULT_RESULT)
+        self.wait_for_replacements(pool, 1)
+        self.assertEqual(phrases().count(warm_up), 3)
+
+        # A call still waiting when the pool closes neither replaces nor returns its worker
+        with ThreadPoolExecutor(1) as executor:
+            slow = executor.submit(pool.process, 'slow')
+            while phrases()[-1] != 'slow':
+                time.sleep(0.01)
+            pool.close()
+            self.assertEqual(slow.result(timeout=5), DEFAULT_RESULT)
+        self.assertEqual((pool.idle, pool.replaced), ([], 1))
+        self.assertFalse(any(process.is_alive() for process, _ in pool.workers))
+        self.assertEqual(multiprocessing.active_children(), [])
+        with self.assertRaises(ValueError):
+            pool.process('Phúc Xá')
+
+
+class TestStreamingClassifier(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.solution = AddressMatcher('list_ward.txt', 'list_district.txt', 'list_province.txt')
+        cls.addresses = [data_point["text"] for data_point in load_test_cases('public.json')[:30]]
+
+    def test_jsonl_and_csv_streams_preserve_order(self):
+        expected = [self.solution.process(address) for address in self.addresses]
+        jsonl = io.StringIO(''.join(json.dumps({"text": address, "id": i}) + '\n'
+                                    for i, address in enumerate(self.addresses)))
+        output = io.StringIO()
+        writer = JsonlWriter(output, 'result')
+        for record, result in classify_stream(self.solution, read_jsonl(jsonl, 'text'), workers=2, chunk_size=4):
+            writer.write(record, result)
+        rows = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([row["id"] for row in rows], list(range(len(self.addresses))))
+        self.assertEqual([row["result"] for row in rows], expected)
+
+        table = io.StringIO()
+        csv_writer = csv.writer(table)
+        csv_writer.writerow(["address"])
+        csv_writer.writerows([address] for address in self.addresses)
+        table.seek(0)
+        output = io.StringIO()
+        writer = CsvWriter(output)
+        for record, result in classify_stream(self.solution, read_csv(table, 'address'), chunk_size=7):
+            writer.write(record, result)
+        rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+        self.assertEqual([row["address"] for row in rows], self.addresses)
+        self.assertEqual([{level: row[level] for level in ("province", "district", "ward")} for row in rows],
+                         [{level: result[level] for level in ("province", "district", "ward")} for result in expected])
+
+    def test_broken_pipe_exits_quietly_without_closing_stdout(self):
+        class ClosedReader(io.StringIO):
+            def write(self, text):
+                raise BrokenPipeError()
+
+        stdout = ClosedReader()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'input.jsonl')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps({"text": address}) + '\n' for address in self.addresses)
+            with mock.patch.object(sys, 'argv', ['classify.py', path, '--progress-interval', '0']), \
+                    mock.patch.object(sys, 'stdout', stdout), \
+                    mock.patch.object(AddressMatcher, 'load', return_value=self.solution):
+                classify.main()
+        self.assertFalse(stdout.closed)
+
+
+async def http_request(port, method, path, payload=None, content_length=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    content_length = len(body) if content_length is None else content_length
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {content_length}\r\n"
+                 f"Connection: close\r\n\r\n".encode('latin-1') + body)
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+
+class TestService(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.solution = AddressMatcher('list_ward.txt', 'list_district.txt', 'list_province.txt')
+        cls.addresses = [data_point["text"] for data_point in load_test_cases('public.json')[:20]]
+
+    def test_classify_coalesces_and_batches(self):
+        async def scenario():
+            service = AddressService(BatchDispatcher(self.solution, workers=0, max_batch=8))
+            server = await service.start('127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                single = await asyncio.gather(*(http_request(port, 'POST', '/classify', {'address': address})
+                                                for address in self.addresses[:3]))
+                # Duplicates within one batch share a single computation
+                batch = await http_request(port, 'POST', '/classify/batch',
+                                           {'addresses': self.addresses + self.addresses[:3]})
+                bad = await http_request(port, 'POST', '/classify', {'address': 1})
+                invalid_lengths = [await http_request(port, 'POST', '/classify', {'address': 'x'}, length)
+                                   for length in ('abc', -5)]
+                health = await http_request(port, 'GET', '/health')
+                metrics = await http_request(port, 'GET', '/metrics')
+            finally:
+                await service.close()
+            return single, batch, bad, invalid_lengths, health, metrics
+
+        single, batch, bad, invalid_lengths, health, metrics = asyncio.run(scenario())
+        expected = [self.solution.process(address) for address in self.addresses]
+
+        self.assertEqual(single, [(200, result) for result in expected[:3]])
+        self.assertEqual(batch, (200, {'results': expected + expected[:3]}))
+        self.assertEqual(bad[0], 400)
+        self.assertEqual(invalid_lengths, [(400, {'error': 'invalid Content-Length'})] * 2)
+        self.assertEqual(health[1]['status'], 'ok')
+        self.assertEqual(metrics[1]['coalesced'], 3)
+        self.assertLess(metrics[1]['batches'], metrics[1]['addresses'])
+
+    def test_reload_swaps_in_rebuilt_matcher(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for name in ('list_ward.txt', 'list_district.txt', 'list_province.txt', *AddressMatcher.HIERARCHY_FILES):
+            shutil.copy(name, directory)
+
+        class CopiedMatcher(AddressMatcher):
+            HIERARCHY_FILES = tuple(os.path.join(directory, name) for name in AddressMatcher.HIERARCHY_FILES)
+
+        matcher = CopiedMatcher(*(os.path.join(directory, name)
+                                  for name in ('list_ward.txt', 'list_district.txt', 'list_province.txt')))
+        address = 'Phúc Xá Mới, Ba Đình, Hà Nội'
+
+        async def scenario():
+            service = AddressService(BatchDispatcher(matcher, workers=0))
+            server = await service.start('127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                before = await http_request(port, 'POST', '/classify', {'address': address})
+                # Rename a ward in both gazetteer files
+                with open(CopiedMatcher.HIERARCHY_FILES[0], encoding='utf-8') as f:
+                    rows = f.read().replace('1;Phúc Xá;PX;1', '1;Phúc Xá Mới;PX;1', 1)
+                with open(CopiedMatcher.HIERARCHY_FILES[0], 'w', encoding='utf-8') as f:
+                    f.write(rows)
+                with open(os.path.join(directory, 'list_ward.txt'), 'a', encoding='utf-8') as f:
+                    f.write('Phúc Xá Mới\n')
+                reload = await http_request(port, 'POST', '/reload')
+                after = await http_request(port, 'POST', '/classify', {'address': address})
+            finally:
+                await service.close()
+            return before, reload, after
+
+        before, (status, reload), after = asyncio.run(scenario())
+        self.assertNotEqual(before[1]['ward'], 'Phúc Xá Mới')
+        self.assertEqual(after[1], {'province': 'Hà Nội', 'district': 'Ba Đình', 'ward': 'Phúc Xá Mới'})
+        self.assertEqual(status, 200)
+        self.assertEqual(reload['reused']['levels'], ['province', 'district'])
+        self.assertEqual(reload['reused']['ward_scopes'], len(matcher.districts_by_id) - 1)
+        # The matcher that was swapped out is untouched
+        self.assertEqual(matcher.match_address(address), before[1])
+
 
 if __name__ == '__main__':
     unittest.main()